@@ -0,0 +1,141 @@
+# Description: Database-side aggregation of the property space totals.
+# The totals are computed with correlated subqueries, so a page of property
+# spaces (or a single one) is resolved in one SQL statement instead of
+# loading every UnitSpace and MeterData row into Python.
+
+from datetime import datetime
+from typing import Iterable, Set, Tuple
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from api.models import MeterDataUnitSpace, PropertySpaceYearlyRollup, UnitSpace
+from api.units import converted
+
+# The totals computed by `annotate_property_space_totals`.
+PROPERTY_SPACE_TOTALS = ("number_of_units", "total_area", "total_consumption")
+
+
+def year_range(year: int) -> Tuple[datetime, datetime]:
+    """
+    Return the half-open range [start, end) of the given year in the current time zone.
+
+    Args:
+        year (int): The year.
+    """
+    tz = timezone.get_current_timezone()
+    return datetime(year, 1, 1, tzinfo=tz), datetime(year + 1, 1, 1, tzinfo=tz)
+
+
+def meter_year_filter(year: int, prefix: str = "") -> Q:
+    """
+    Build the filter matching the meter data that belongs to the given year.
+    A reading belongs to a year if it starts or ends in that year.
+    The filter compares the raw columns with the bounds of the year, so the date indexes can be used.
+
+    Args:
+        year (int): The year to filter on.
+        prefix (str): The lookup prefix to reach the MeterData fields, e.g. "meterdata__".
+    """
+    start, end = year_range(year)
+    return (
+        Q(**{f"{prefix}measurement_start_date__gte": start, f"{prefix}measurement_start_date__lt": end})
+        | Q(**{f"{prefix}measurement_end_date__gte": start, f"{prefix}measurement_end_date__lt": end})
+    )
+
+
+def meter_years(measurement_start_date, measurement_end_date, tz=None) -> Set[int]:
+    """
+    Return the years a reading belongs to, in the current time zone.
+
+    Args:
+        measurement_start_date (datetime): The start of the measurement period.
+        measurement_end_date (datetime): The end of the measurement period.
+        tz (tzinfo): The time zone to use, resolved once by callers looping over many readings.
+    """
+    tz = tz or timezone.get_current_timezone()
+    return {
+        measurement_start_date.astimezone(tz).year,
+        measurement_end_date.astimezone(tz).year,
+    }
+
+
+def total_consumption_subquery(year: int = None, unit: str = None) -> Subquery:
+    """
+    Subquery summing the consumption of the property space referenced by the outer query.
+    If a meter is shared between units, the reading is divided by the number of units associated with it,
+    which is stored in `MeterData.share_reading`. The readings are converted to the target unit.
+
+    Args:
+        year (int): The year to filter the MeterData on.
+        unit (str): The unit of the total, the default unit if None.
+    """
+    links = MeterDataUnitSpace.objects.filter(unitspace__property_space_id=OuterRef("pk"))
+    if year is not None:
+        links = links.filter(meter_year_filter(year, prefix="meterdata__"))
+
+    return Subquery(
+        links
+        .values("unitspace__property_space_id")
+        .annotate(total=Sum(converted("meterdata__share_reading", "meterdata__measurement_unit", unit)))
+        .values("total"),
+        output_field=FloatField(),
+    )
+
+
+def rollup_consumption_subquery(year: int, unit: str = None) -> Subquery:
+    """
+    Subquery reading the consumption of the property space referenced by the outer query
+    from the yearly rollup table instead of the meter history.
+    The rollups are stored per measurement unit and converted when they are read,
+    so a change of the conversion table does not require a rebuild.
+
+    Args:
+        year (int): The year of the rollup rows.
+        unit (str): The unit of the total, the default unit if None.
+    """
+    return Subquery(
+        PropertySpaceYearlyRollup.objects
+        .filter(property_space_id=OuterRef("pk"), year=year)
+        .values("property_space_id")
+        .annotate(total=Sum(converted("total_consumption", "measurement_unit", unit)))
+        .values("total"),
+        output_field=FloatField(),
+    )
+
+
+def annotate_property_space_totals(
+    queryset: QuerySet,
+    year: int = None,
+    use_rollup: bool = False,
+    totals: Iterable[str] = PROPERTY_SPACE_TOTALS,
+    unit: str = None,
+) -> QuerySet:
+    """
+    Annotate a PropertySpace queryset with `number_of_units`, `total_area` and `total_consumption`.
+
+    Args:
+        queryset (QuerySet): The PropertySpace queryset.
+        year (int): The year to filter the MeterData on.
+        use_rollup (bool): Read the yearly consumption from the rollup table when a year is given.
+        totals (Iterable[str]): The totals to annotate, the others are not computed.
+        unit (str): The unit of `total_consumption`, the default unit if None.
+    """
+    units = UnitSpace.objects.filter(property_space_id=OuterRef("pk")).values("property_space_id")
+    annotations = {}
+    if "number_of_units" in totals:
+        annotations["number_of_units"] = Coalesce(
+            Subquery(units.annotate(count=Count("id")).values("count"), output_field=IntegerField()),
+            Value(0),
+        )
+    if "total_area" in totals:
+        annotations["total_area"] = Coalesce(
+            Subquery(units.annotate(area=Sum("area")).values("area"), output_field=FloatField()),
+            Value(0.0),
+        )
+    if "total_consumption" in totals:
+        if year is not None and use_rollup:
+            consumption = rollup_consumption_subquery(year, unit)
+        else:
+            consumption = total_consumption_subquery(year, unit)
+        annotations["total_consumption"] = Coalesce(consumption, Value(0.0))
+    return queryset.annotate(**annotations)
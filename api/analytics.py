@@ -0,0 +1,173 @@
+# Description: Portfolio analytics: consumption, area and energy-use intensity
+# (consumption per unit of area) grouped by location or by unit type, and the
+# ranking of the property spaces by intensity.
+# Every report is a single SQL statement grouping the correlated subqueries of
+# `api.aggregations`, so no unit or meter row is loaded into Python. With a year,
+# the location reports and the ranking read the consumption from the yearly rollups.
+# The portfolio totals can be served from the in-memory columnar snapshot of `api.columnar`.
+
+from typing import Dict, List
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+from api.aggregations import annotate_property_space_totals, meter_year_filter
+from api.columnar import get_snapshot
+from api.exceptions import BadRequestException
+from api.models import MeterDataUnitSpace, PropertySpace, UnitSpace
+from api.units import converted
+
+# The columns identifying a group, per grouping. A city is only unique within its state and country.
+LOCATION_GROUPS: Dict[str, List[str]] = {
+    "city": ["address__city", "address__state", "address__country"],
+    "state": ["address__state", "address__country"],
+    "country": ["address__country"],
+}
+GROUP_BY_CHOICES = [*LOCATION_GROUPS, "unit_type"]
+
+RANKING_LIMIT_DEFAULT = 10
+
+
+def _intensity(consumption: str, area: str) -> ExpressionWrapper:
+    # NULL instead of a division by zero when the area is 0.
+    return ExpressionWrapper(F(consumption) / NullIf(F(area), Value(0.0)), output_field=FloatField())
+
+
+def _location_groups(group_by: str, year: int = None, unit: str = None) -> QuerySet:
+    keys = LOCATION_GROUPS[group_by]
+    return (
+        annotate_property_space_totals(PropertySpace.objects.all(), year, use_rollup=True, unit=unit)
+        .values(*keys)
+        .annotate(
+            group_property_count=Count("id"),
+            group_unit_count=Sum("number_of_units"),
+            group_area=Sum("total_area"),
+            group_consumption=Sum("total_consumption"),
+        )
+        .order_by(*keys)
+    )
+
+
+def _unit_type_groups(year: int = None, unit: str = None) -> QuerySet:
+    links = MeterDataUnitSpace.objects.filter(unitspace_id=OuterRef("pk"))
+    if year is not None:
+        links = links.filter(meter_year_filter(year, prefix="meterdata__"))
+    unit_consumption = Subquery(
+        links
+        .values("unitspace_id")
+        .annotate(total=Sum(converted("meterdata__share_reading", "meterdata__measurement_unit", unit)))
+        .values("total"),
+        output_field=FloatField(),
+    )
+    return (
+        UnitSpace.objects
+        .annotate(unit_consumption=Coalesce(unit_consumption, Value(0.0)))
+        .values("unit_type")
+        .annotate(
+            group_property_count=Count("property_space_id", distinct=True),
+            group_unit_count=Count("id"),
+            group_area=Sum("area"),
+            group_consumption=Sum("unit_consumption"),
+        )
+        .order_by("unit_type")
+    )
+
+
+def portfolio_groups(group_by: str, year: int = None, unit: str = None) -> List[dict]:
+    """
+    Return the aggregates of the portfolio per group, ordered by the group columns.
+    Each group has the property space and unit space counts, the total area and consumption,
+    and the intensity, None when the area is 0.
+    Shared meters are divided between their units and the readings are converted to the
+    target unit, like the property space totals.
+
+    Args:
+        group_by (str): "city", "state", "country" or "unit_type".
+        year (int): The year to filter the MeterData on.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    if group_by in LOCATION_GROUPS:
+        keys = LOCATION_GROUPS[group_by]
+        rows = _location_groups(group_by, year, unit)
+    elif group_by == "unit_type":
+        keys = ["unit_type"]
+        rows = _unit_type_groups(year, unit)
+    else:
+        raise BadRequestException(f"Invalid group_by: {group_by}")
+
+    groups = []
+    for row in rows:
+        total_area = row["group_area"] or 0.0
+        total_consumption = row["group_consumption"] or 0.0
+        groups.append({
+            "group": {key.replace("address__", ""): row[key] for key in keys},
+            "property_count": row["group_property_count"],
+            "unit_count": row["group_unit_count"] or 0,
+            "total_area": total_area,
+            "total_consumption": total_consumption,
+            # Divided here rather than in SQL, where it would evaluate the subqueries of the sums a second time.
+            "intensity": total_consumption / total_area if total_area else None,
+        })
+    return groups
+
+
+def portfolio_totals(year: int = None, unit: str = None) -> dict:
+    """
+    Return the number of property spaces and unit spaces, the area and the consumption of the portfolio.
+    They are read from the columnar snapshot of the process when it is enabled (`api.columnar`),
+    from the database otherwise, with one statement.
+
+    Args:
+        year (int): The year to filter the MeterData on.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return {**snapshot.portfolio_totals(year, unit), "source": "columnar"}
+    totals = annotate_property_space_totals(PropertySpace.objects.all(), year, use_rollup=True, unit=unit).aggregate(
+        property_count=Count("id"),
+        units=Sum("number_of_units"),
+        area=Sum("total_area"),
+        consumption=Sum("total_consumption"),
+    )
+    return {
+        "property_count": totals["property_count"],
+        "number_of_units": totals["units"] or 0,
+        "total_area": totals["area"] or 0.0,
+        "total_consumption": totals["consumption"] or 0.0,
+        "source": "database",
+    }
+
+
+def intensity_ranking(year: int = None, limit: int = RANKING_LIMIT_DEFAULT, unit: str = None) -> List[dict]:
+    """
+    Return the property spaces with the highest intensity, highest first.
+    Property spaces without area are left out.
+
+    Args:
+        year (int): The year to filter the MeterData on.
+        limit (int): The number of property spaces to return.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    rows = (
+        annotate_property_space_totals(PropertySpace.objects.all(), year, use_rollup=True, unit=unit)
+        .filter(total_area__gt=0)
+        .annotate(intensity=_intensity("total_consumption", "total_area"))
+        .order_by(F("intensity").desc(), "id")
+        .values(
+            "id", "name", "address__city", "address__state", "address__country",
+            "total_area", "total_consumption", "intensity",
+        )[:limit]
+    )
+    return [
+        {
+            "rank": rank,
+            "id": row["id"],
+            "name": row["name"],
+            "city": row["address__city"],
+            "state": row["address__state"],
+            "country": row["address__country"],
+            "total_area": row["total_area"],
+            "total_consumption": row["total_consumption"],
+            "intensity": row["intensity"],
+        }
+        for rank, row in enumerate(rows, start=1)
+    ]
@@ -7,3 +7,7 @@ load_dotenv()
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect the signal handlers maintaining the stored aggregates.
+        from api import signals  # noqa: F401
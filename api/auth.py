@@ -0,0 +1,156 @@
+# Description: API key authentication.
+# The keys are looked up by the SHA-256 hash of the token, and the result of the
+# lookup, valid or not, is kept in an in-process cache for API_KEY_CACHE_TTL seconds,
+# so that authenticating a request usually costs no query. A revoked key stops
+# working at once in the process that revokes it, and within the TTL in the others.
+# The AUTH_TOKEN of the environment, read once in the settings, is still accepted as a shared key.
+
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+from django.conf import settings
+from api.models import ApiKey
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# The identifier of the AUTH_TOKEN key, e.g. for its rate limit.
+ENVIRONMENT_KEY_ID = "env"
+
+
+class ApiKeyIdentity(NamedTuple):
+    """
+    An authenticated API key, set as `request.auth`.
+    """
+    id: str
+    name: str
+    rate_limit_per_minute: int
+    rate_limit_burst: int
+
+
+def hash_key(key: str) -> str:
+    """
+    Return the hash stored for a key.
+    The keys are random 256-bit tokens, so a fast hash is enough: there is nothing to brute-force.
+
+    Args:
+        key (str): The API key.
+    """
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_api_key(name: str, rate_limit_per_minute: int = None, rate_limit_burst: int = None) -> Tuple[ApiKey, str]:
+    """
+    Create an API key. Returns the model instance and the key, which is not stored.
+
+    Args:
+        name (str): The name of the client.
+        rate_limit_per_minute (int): The rate limit of the key, API_RATE_LIMIT_PER_MINUTE if None.
+        rate_limit_burst (int): The burst of the key, API_RATE_LIMIT_BURST if None.
+    """
+    key = secrets.token_urlsafe(32)
+    api_key = ApiKey.objects.create(
+        name=name,
+        prefix=key[:8],
+        key_hash=hash_key(key),
+        rate_limit_per_minute=rate_limit_per_minute,
+        rate_limit_burst=rate_limit_burst,
+    )
+    logger.info(f"API key created: {api_key}")
+    return api_key, key
+
+
+class _KeyCache:
+    """
+    In-process cache of the key lookups, by key hash, with a TTL and a maximum size.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key_hash: str):
+        # Returns (found, identity); the identity of an unknown key is None.
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return False, None
+            expires_at, identity = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key_hash]
+                return False, None
+            return True, identity
+
+    def set(self, key_hash: str, identity: Optional[ApiKeyIdentity]):
+        ttl = getattr(settings, "API_KEY_CACHE_TTL", 60)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key_hash] = (time.monotonic() + ttl, identity)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > getattr(settings, "API_KEY_CACHE_MAX_ENTRIES", 10000):
+                self._entries.popitem(last=False)
+
+    def delete(self, key_hash: str):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_key_cache = _KeyCache()
+
+
+def forget_api_key(key_hash: str) -> None:
+    """
+    Drop a key from the in-process cache, e.g. when it is revoked.
+
+    Args:
+        key_hash (str): The hash of the key.
+    """
+    _key_cache.delete(key_hash)
+
+
+def clear_api_key_cache() -> None:
+    """
+    Drop every key from the in-process cache.
+    """
+    _key_cache.clear()
+
+
+def _identity(api_key: ApiKey) -> ApiKeyIdentity:
+    return ApiKeyIdentity(
+        id=str(api_key.id),
+        name=api_key.name,
+        rate_limit_per_minute=api_key.rate_limit_per_minute or settings.API_RATE_LIMIT_PER_MINUTE,
+        rate_limit_burst=api_key.rate_limit_burst or settings.API_RATE_LIMIT_BURST,
+    )
+
+
+def authenticate_api_key(token: str) -> Optional[ApiKeyIdentity]:
+    """
+    Return the identity of an active API key, or None.
+
+    Args:
+        token (str): The bearer token of the request.
+    """
+    environment_token = settings.AUTH_TOKEN
+    if environment_token and hmac.compare_digest(token.encode(), environment_token.encode()):
+        return ApiKeyIdentity(
+            ENVIRONMENT_KEY_ID, "AUTH_TOKEN", settings.API_RATE_LIMIT_PER_MINUTE, settings.API_RATE_LIMIT_BURST
+        )
+
+    key_hash = hash_key(token)
+    found, identity = _key_cache.get(key_hash)
+    if not found:
+        api_key = ApiKey.objects.filter(key_hash=key_hash, is_active=True).first()
+        identity = None if api_key is None else _identity(api_key)
+        _key_cache.set(key_hash, identity)
+    return identity
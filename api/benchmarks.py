@@ -0,0 +1,336 @@
+# Description: Benchmark suite of the api_v1 endpoints on synthetic datasets.
+# For each dataset size, a dataset is generated with `api.synthetic`, every endpoint
+# is called a number of times with the response cache cleared, and the latency
+# percentiles, the number of queries and the peak Python memory are recorded.
+# The dataset of each size is rolled back afterward, so the sizes are independent.
+# Reports are plain JSON and `compare_reports` flags the regressions between two runs.
+
+import json
+import math
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Tuple
+import django
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from api.jobs import submit_job
+from api.models import Address, PropertySpace, UnitSpace
+from api.pagination import encode_cursor
+from api.synthetic import generate_synthetic_data
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+BENCHMARK_SIZES = [1_000, 100_000, 1_000_000]
+BENCHMARK_ITERATIONS = 20
+READINGS_PER_PROPERTY = 100
+UNITS_PER_PROPERTY = 4
+SHARED_FRACTION = 0.1
+INGEST_READINGS_PER_CALL = 100
+IMPORT_PROPERTIES_PER_CALL = 100
+BATCH_IDS_PER_CALL = 100
+BULK_DELETE_PROPERTIES_PER_CALL = 100
+
+# A scenario prepares the request of an iteration, outside of the measured time,
+# and returns (method, path, JSON body).
+Scenario = Callable[[int], Tuple[str, str, dict]]
+
+
+class _Scenarios:
+    """
+    The requests of the benchmarked endpoints, for a generated dataset.
+    The jobs are only submitted and read: they run in the worker, not in the request.
+    """
+
+    def __init__(self, property_space_ids: List[int], unit_space_ids: List[int]):
+        self.property_space_ids = property_space_ids
+        self.unit_space_ids = unit_space_ids
+        self.middle_cursor = None
+
+    def all(self) -> Dict[str, Scenario]:
+        return {
+            "create_property_space": self.create_property_space,
+            "get_property_space": lambda i: ("get", self._detail_path(i), None),
+            "get_property_space_year": lambda i: ("get", self._detail_path(i, "?year=2022"), None),
+            "get_property_space_async": lambda i: ("async", self._detail_path(i, "?year=2022", "async/"), None),
+            "get_property_space_consumption": lambda i: (
+                "get", self._detail_path(i, "/consumption?start=2020-01-01&end=2024-12-31&granularity=month"), None
+            ),
+            "get_property_spaces_batch": self.get_property_spaces_batch,
+            "list_property_spaces": lambda i: ("get", "/api/v1/property-spaces", None),
+            "list_property_spaces_year": lambda i: ("get", "/api/v1/property-spaces?year=2022", None),
+            "list_property_spaces_cursor": self.list_property_spaces_cursor,
+            "list_property_spaces_async": lambda i: ("async", "/api/v1/async/property-spaces?year=2022", None),
+            "export_property_spaces": lambda i: ("get", "/api/v1/property-spaces/export?year=2022", None),
+            "property_space_changes": lambda i: ("get", "/api/v1/property-spaces/changes?limit=100", None),
+            "update_property_space": lambda i: ("put", self._detail_path(i), {"name": f"benchmark update {i}"}),
+            "delete_property_space": self.delete_property_space,
+            "bulk_delete_property_spaces": self.bulk_delete_property_spaces,
+            "bulk_create_meter_data": self.bulk_create_meter_data,
+            "import_property_spaces": self.import_property_spaces,
+            "portfolio_analytics": lambda i: ("get", "/api/v1/analytics/portfolio?group_by=city&year=2022", None),
+            "portfolio_totals": lambda i: ("get", "/api/v1/analytics/totals?year=2022", None),
+            "intensity_ranking": lambda i: ("get", "/api/v1/analytics/intensity-ranking?year=2022", None),
+            "submit_portfolio_report_job": lambda i: (
+                "post", "/api/v1/jobs/portfolio-report", {"start_year": 2021, "end_year": 2022}
+            ),
+            "get_job": self.get_job,
+            "cache_stats": lambda i: ("get", "/api/v1/cache-stats", None),
+        }
+
+    def _detail_path(self, iteration: int, query: str = "", prefix: str = "") -> str:
+        # Spread the calls over the property spaces.
+        property_space_id = self.property_space_ids[iteration * 7919 % len(self.property_space_ids)]
+        return f"/api/v1/{prefix}property-spaces/{property_space_id}{query}"
+
+    def create_property_space(self, iteration: int):
+        return "post", "/api/v1/property-spaces", {
+            "name": f"benchmark create {iteration}",
+            "address": {
+                "street": f"{iteration} Benchmark St",
+                "city": "Oakland",
+                "state": "CA",
+                "country": "USA",
+                "postal_code": "94607",
+            },
+        }
+
+    def list_property_spaces_cursor(self, iteration: int):
+        if self.middle_cursor is None:
+            self.middle_cursor = encode_cursor(self.property_space_ids[len(self.property_space_ids) // 2])
+        return "get", f"/api/v1/property-spaces?year=2022&cursor={self.middle_cursor}", None
+
+    def get_property_spaces_batch(self, iteration: int):
+        step = max(1, len(self.property_space_ids) // BATCH_IDS_PER_CALL)
+        ids = self.property_space_ids[iteration % step::step][:BATCH_IDS_PER_CALL]
+        return "get", f"/api/v1/property-spaces/batch?year=2022&ids={','.join(map(str, ids))}", None
+
+    def _new_property_spaces(self, iteration: int, count: int) -> List[int]:
+        # New property spaces with units to delete, so that the dataset keeps its size.
+        addresses = Address.objects.bulk_create([
+            Address(street=f"{index} Delete St", city="Oakland", state="CA", country="USA", postal_code="94607")
+            for index in range(count)
+        ])
+        property_spaces = PropertySpace.objects.bulk_create([
+            PropertySpace(address=address, name=f"benchmark delete {iteration}-{index}")
+            for index, address in enumerate(addresses)
+        ])
+        UnitSpace.objects.bulk_create([
+            UnitSpace(name=f"unit {index}", area=1000, property_space=property_space)
+            for property_space in property_spaces
+            for index in range(UNITS_PER_PROPERTY)
+        ])
+        return [property_space.id for property_space in property_spaces]
+
+    def delete_property_space(self, iteration: int):
+        property_space_id, = self._new_property_spaces(iteration, 1)
+        return "delete", f"/api/v1/property-spaces/{property_space_id}", None
+
+    def bulk_delete_property_spaces(self, iteration: int):
+        ids = self._new_property_spaces(iteration, BULK_DELETE_PROPERTIES_PER_CALL)
+        return "post", "/api/v1/property-spaces/bulk-delete", {"ids": ids}
+
+    def get_job(self, iteration: int):
+        job = submit_job("portfolio_report", {"start_year": 2022, "end_year": 2022})
+        return "get", f"/api/v1/jobs/{job.id}", None
+
+    def bulk_create_meter_data(self, iteration: int):
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        return "post", "/api/v1/meter-data/bulk", {"readings": [
+            {
+                "meter_number": f"BENCH-{iteration}-{index}",
+                "meter_provider_name": "benchmark",
+                "meter_source": "benchmark",
+                "measurement_reading": 100.0,
+                "measurement_start_date": (start + timedelta(days=index)).isoformat(),
+                "measurement_end_date": (start + timedelta(days=index + 30)).isoformat(),
+                "unit_space_ids": [
+                    self.unit_space_ids[(iteration * INGEST_READINGS_PER_CALL + index) % len(self.unit_space_ids)]
+                ],
+            }
+            for index in range(INGEST_READINGS_PER_CALL)
+        ]}
+
+    def import_property_spaces(self, iteration: int):
+        return "post", "/api/v1/property-spaces/import", {"properties": [
+            {
+                "external_id": f"benchmark-{iteration}-{index}",
+                "name": f"benchmark import {iteration}-{index}",
+                "address": {
+                    "street": f"{index} Import St",
+                    "city": "Oakland",
+                    "state": "CA",
+                    "country": "USA",
+                    "postal_code": "94607",
+                },
+                "units": [
+                    {"external_id": f"unit-{unit}", "name": f"unit {unit}", "area": 1000}
+                    for unit in range(UNITS_PER_PROPERTY)
+                ],
+            }
+            for index in range(IMPORT_PROPERTIES_PER_CALL)
+        ]}
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    # Nearest-rank percentile.
+    return sorted_values[max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)]
+
+
+def _send(client: Client, async_client: AsyncClient, method: str, path: str, body: dict):
+    if method == "async":
+        # The default headers of an AsyncClient are not sent as HTTP headers, they are passed per request.
+        headers = {"Authorization": client.defaults["HTTP_AUTHORIZATION"]}
+        response = async_to_sync(async_client.get)(path, headers=headers)
+    elif body is None:
+        response = getattr(client, method)(path)
+    else:
+        response = getattr(client, method)(path, data=json.dumps(body), content_type="application/json")
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method.upper()} {path} returned {response.status_code}")
+    # Consume the streamed responses, their rows are only computed while iterating.
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+def _benchmark_scenario(client: Client, async_client: AsyncClient, scenario: Scenario, iterations: int) -> dict:
+    latencies = []
+    queries = 0
+    for iteration in range(iterations + 1):
+        method, path, body = scenario(iteration)
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            _send(client, async_client, method, path, body)
+            elapsed = time.perf_counter() - started
+        # The first call warms up the imports and the connection, it is not measured.
+        if iteration:
+            latencies.append(elapsed * 1000)
+            queries = max(queries, len(captured))
+
+    # Tracing the allocations slows the request down, the peak is measured on a separate call.
+    method, path, body = scenario(iterations + 1)
+    cache.clear()
+    tracemalloc.start()
+    try:
+        _send(client, async_client, method, path, body)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "max_ms": round(latencies[-1], 3),
+        "queries": queries,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run_endpoint_benchmarks(
+    sizes: Iterable[int] = BENCHMARK_SIZES,
+    iterations: int = BENCHMARK_ITERATIONS,
+    seed: int = 0,
+    endpoints: Iterable[str] = None,
+    progress: Callable[[str], None] = None,
+) -> dict:
+    """
+    Run the endpoint benchmarks on a synthetic dataset of each size.
+    Returns the report, a JSON serializable dictionary.
+    Every dataset is generated and rolled back in a transaction of the current database,
+    which should be a dedicated one, e.g. a test database.
+
+    Args:
+        sizes (Iterable[int]): The numbers of meter readings of the datasets.
+        iterations (int): The number of measured calls per endpoint.
+        seed (int): The seed of the dataset generator.
+        endpoints (Iterable[str]): The names of the endpoints to run, all of them if None.
+        progress (Callable[[str], None]): Called with a progress message.
+    """
+    progress = progress or logger.info
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {os.getenv('AUTH_TOKEN')}")
+    async_client = AsyncClient()
+    endpoints = None if endpoints is None else set(endpoints)
+
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "machine": platform.machine(),
+        },
+        "config": {
+            "seed": seed,
+            "iterations": iterations,
+            "readings_per_property": READINGS_PER_PROPERTY,
+            "units_per_property": UNITS_PER_PROPERTY,
+            "shared_fraction": SHARED_FRACTION,
+        },
+        "sizes": {},
+    }
+    for size in sizes:
+        with transaction.atomic():
+            started = time.perf_counter()
+            dataset = generate_synthetic_data(
+                properties=max(10, size // READINGS_PER_PROPERTY),
+                units_per_property=UNITS_PER_PROPERTY,
+                readings=size,
+                shared_fraction=SHARED_FRACTION,
+                seed=seed,
+            )
+            progress(f"{size} readings: generated in {time.perf_counter() - started:.1f}s")
+            scenarios = _Scenarios(
+                list(PropertySpace.objects.order_by("id").values_list("id", flat=True)),
+                list(UnitSpace.objects.order_by("id").values_list("id", flat=True)),
+            )
+            results = {}
+            for name, scenario in scenarios.all().items():
+                if endpoints is not None and name not in endpoints:
+                    continue
+                results[name] = _benchmark_scenario(client, async_client, scenario, iterations)
+                progress(f"{size} readings: {name} p50 {results[name]['p50_ms']}ms, {results[name]['queries']} queries")
+            report["sizes"][str(size)] = {"dataset": dataset, "endpoints": results}
+            transaction.set_rollback(True)
+        cache.clear()
+    return report
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float = 0.2) -> List[str]:
+    """
+    Compare two benchmark reports.
+    Returns the list of regressions: a p95 latency or a peak memory higher than the baseline
+    by more than the tolerance, or more queries. Only the sizes and endpoints of both reports are compared.
+
+    Args:
+        baseline (dict): The reference report.
+        current (dict): The new report.
+        tolerance (float): The accepted relative increase of the latency and memory.
+    """
+    regressions = []
+    for size, current_size in current.get("sizes", {}).items():
+        baseline_endpoints = baseline.get("sizes", {}).get(size, {}).get("endpoints", {})
+        for name, result in current_size["endpoints"].items():
+            reference = baseline_endpoints.get(name)
+            if reference is None:
+                continue
+            for metric in ["p95_ms", "peak_memory_kb"]:
+                if result[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append(f"{size} readings, {name}: {metric} {reference[metric]} -> {result[metric]}")
+            if result["queries"] > reference["queries"]:
+                regressions.append(f"{size} readings, {name}: queries {reference['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,161 @@
+# Description: Change feed of the property spaces, for the clients syncing them.
+# Every change of a property space output (its name, address, units or meters) moves
+# the property space to the next value of a change sequence, and a deleted property
+# space leaves a tombstone with its own sequence value. A client reads the changes
+# after its cursor, a (change_seq, id) keyset served by an index, so a sync costs
+# the number of changes, not the size of the portfolio.
+# The sequence is a counter row updated in the transaction of the change. The row
+# lock orders the writers, so the values are taken in commit order and a reader never
+# skips a change committed after it read a higher value. Every writer takes the value
+# and writes the changed rows in one transaction (see also `PropertySpace.save`).
+
+import base64
+import binascii
+import heapq
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+from api.exceptions import BadRequestException
+from api.models import ChangeSequence, PropertySpace, PropertySpaceTombstone
+
+# The ID of the cursor placed after every change of its sequence value.
+_AFTER_EVERY_ID = 2 ** 63 - 1
+
+
+def next_change_seq() -> int:
+    """
+    Take the next value of the change sequence, in the current transaction.
+    The rows written with the value must be written in the same transaction.
+    """
+    # The update and the read must be in one transaction, no savepoint is needed within an outer one.
+    with transaction.atomic(savepoint=False):
+        if not ChangeSequence.objects.filter(pk=1).update(value=F("value") + 1):
+            # The counter row is created by the migrations, a flushed database has none.
+            ChangeSequence.objects.create(pk=1, value=1)
+        return ChangeSequence.objects.values_list("value", flat=True).get(pk=1)
+
+
+def current_change_seq() -> int:
+    """
+    Return the last value taken from the change sequence.
+    """
+    return ChangeSequence.objects.filter(pk=1).values_list("value", flat=True).first() or 0
+
+
+def touch_property_spaces(property_space_ids: Iterable[int]) -> None:
+    """
+    Move the given property spaces to the next change sequence value, with one update.
+
+    Args:
+        property_space_ids (Iterable[int]): The property spaces whose output changed.
+    """
+    property_space_ids = set(property_space_ids)
+    if not property_space_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        PropertySpace.objects.filter(id__in=property_space_ids).update(
+            change_seq=next_change_seq(),
+            updated_at=timezone.now(),
+        )
+
+
+def record_tombstones(property_space_ids: Iterable[int]) -> None:
+    """
+    Record the deletion of the given property spaces in the change feed.
+
+    Args:
+        property_space_ids (Iterable[int]): The deleted property spaces.
+    """
+    property_space_ids = set(property_space_ids)
+    if not property_space_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        change_seq = next_change_seq()
+        PropertySpaceTombstone.objects.bulk_create([
+            PropertySpaceTombstone(property_space_id=property_space_id, change_seq=change_seq)
+            for property_space_id in property_space_ids
+        ])
+
+
+def encode_change_cursor(change_seq: int, last_id: int) -> str:
+    """
+    Encode the position of the last change of a page into an opaque cursor.
+
+    Args:
+        change_seq (int): The change sequence value of the last change.
+        last_id (int): The property space ID of the last change.
+    """
+    return base64.urlsafe_b64encode(f"change:{change_seq}:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_change_cursor(cursor: str) -> Tuple[int, int]:
+    """
+    Decode a change feed cursor back into the position of the last change of the previous page.
+
+    Args:
+        cursor (str): The cursor returned with the previous page.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, change_seq, last_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        if prefix != "change":
+            raise ValueError(prefix)
+        return int(change_seq), int(last_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise BadRequestException(f"Invalid cursor: {cursor}")
+
+
+def changes_page(
+    queryset: QuerySet,
+    limit: int,
+    cursor: str = None,
+    updated_since: datetime = None,
+) -> Tuple[List[dict], Optional[str], bool]:
+    """
+    Fetch the next changes of the property spaces, ordered by (change_seq, id), with two queries.
+    Returns the changes, the cursor to resume from, and whether more changes are waiting.
+    A change is the property space row with `deleted` False, or a tombstone with `deleted` True.
+    The cursor is returned even when there are no changes, to poll with it later.
+
+    Args:
+        queryset (QuerySet): A PropertySpace values() queryset, including `id`, `change_seq` and `updated_at`.
+        limit (int): The maximum number of changes.
+        cursor (str): The cursor returned with the previous page, the sync starts from the beginning if None.
+        updated_since (datetime): Without a cursor, only the changes made since this time.
+    """
+    tombstones = PropertySpaceTombstone.objects.all()
+    if cursor:
+        change_seq, last_id = decode_change_cursor(cursor)
+        queryset = queryset.filter(Q(change_seq__gt=change_seq) | Q(change_seq=change_seq, id__gt=last_id))
+        tombstones = tombstones.filter(
+            Q(change_seq__gt=change_seq) | Q(change_seq=change_seq, property_space_id__gt=last_id)
+        )
+    elif updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+        tombstones = tombstones.filter(deleted_at__gte=updated_since)
+
+    # One extra change tells whether there is a next page.
+    rows = [
+        {**row, "deleted": False}
+        for row in queryset.order_by("change_seq", "id")[:limit + 1]
+    ]
+    deleted = [
+        {"id": property_space_id, "change_seq": change_seq, "updated_at": deleted_at, "deleted": True}
+        for property_space_id, change_seq, deleted_at in tombstones
+        .order_by("change_seq", "property_space_id")
+        .values_list("property_space_id", "change_seq", "deleted_at")[:limit + 1]
+    ]
+    changes = list(heapq.merge(rows, deleted, key=lambda change: (change["change_seq"], change["id"])))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    if changes:
+        next_cursor = encode_change_cursor(changes[-1]["change_seq"], changes[-1]["id"])
+    elif cursor:
+        next_cursor = cursor
+    else:
+        # Nothing changed since `updated_since`, resume after the last change made so far.
+        next_cursor = encode_change_cursor(current_change_seq(), _AFTER_EVERY_ID)
+    return changes, next_cursor, has_more
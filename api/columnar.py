@@ -0,0 +1,300 @@
+# Description: In-memory columnar snapshot of the meter readings, for the portfolio aggregates.
+# The links between the meters and the unit spaces are loaded into NumPy arrays (property
+# space, share of the reading in kWh, start and end timestamps), along with the area of the
+# unit spaces. The totals are grouped sums (`np.bincount`) over a vectorized year mask, and
+# the totals of a year are kept until the next refresh, so a portfolio aggregate is answered
+# without a query.
+# The snapshot is refreshed incrementally from the change feed (`api.changes`): only the
+# property spaces moved forward in the change sequence since the last refresh are reloaded,
+# and the deleted ones are dropped. It is refreshed at most every COLUMNAR_REFRESH_SECONDS,
+# which bounds how stale the aggregates can be.
+# NumPy is optional. Without it, or when COLUMNAR_ANALYTICS_ENABLED is off, or when the
+# snapshot would exceed COLUMNAR_MEMORY_BUDGET_MB, `get_snapshot` returns None and the
+# callers use the database.
+
+import itertools
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from api.aggregations import year_range
+from api.changes import current_change_seq
+from api.models import MeterDataUnitSpace, PropertySpace, PropertySpaceTombstone, UnitSpace
+from api.units import conversion_factors, resolve_unit
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+# Bytes per link (property space id and index, share, start, end) and per unit space (id, index, area).
+LINK_BYTES = 8 * 5
+UNIT_BYTES = 8 * 3
+
+# Above this fraction of changed property spaces, a refresh reloads the whole snapshot.
+FULL_RELOAD_FRACTION = 0.5
+
+LOAD_CHUNK_SIZE = 10000
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Raised when the snapshot of the data at `change_seq` would not fit in the memory budget.
+    """
+
+    def __init__(self, message: str, change_seq: int):
+        super().__init__(message)
+        self.change_seq = change_seq
+
+
+def _memory_budget() -> int:
+    return int(getattr(settings, "COLUMNAR_MEMORY_BUDGET_MB", 512) * 1024 * 1024)
+
+
+class ColumnarSnapshot:
+    """
+    Columnar copy of the readings and unit spaces of the portfolio.
+    A refresh builds new arrays and swaps them, so the reads never see a half-refreshed snapshot.
+    """
+
+    def __init__(self):
+        self.change_seq = None
+        self.refreshed_at = 0.0
+        self._columns = None
+        self._consumption_by_year: Dict[Optional[int], "np.ndarray"] = {}
+
+    @property
+    def nbytes(self) -> int:
+        if self._columns is None:
+            return 0
+        return sum(array.nbytes for array in self._columns.values())
+
+    def load(self) -> None:
+        """
+        Load every link and unit space, with a few queries streaming the rows.
+        """
+        change_seq = current_change_seq()
+        link_count, unit_count = MeterDataUnitSpace.objects.count(), UnitSpace.objects.count()
+        self._check_budget(link_count, unit_count, change_seq)
+        columns = self._load_rows(
+            PropertySpace.objects.values_list("id", flat=True),
+            MeterDataUnitSpace.objects.all(),
+            UnitSpace.objects.all(),
+            link_count,
+            unit_count,
+        )
+        self._swap(columns, change_seq)
+        logger.info(
+            f"Loaded the columnar snapshot: {len(columns['link_property'])} links, "
+            f"{len(columns['unit_property'])} unit spaces, {self.nbytes} bytes"
+        )
+
+    def refresh(self) -> None:
+        """
+        Reload the property spaces changed since the last refresh and drop the deleted ones.
+        """
+        change_seq = current_change_seq()
+        if change_seq == self.change_seq:
+            self.refreshed_at = time.monotonic()
+            return
+        changed = list(PropertySpace.objects.filter(change_seq__gt=self.change_seq).values_list("id", flat=True))
+        deleted = list(
+            PropertySpaceTombstone.objects.filter(change_seq__gt=self.change_seq).values_list("property_space_id", flat=True)
+        )
+        columns = self._columns
+        if len(changed) + len(deleted) > FULL_RELOAD_FRACTION * max(len(columns["property_ids"]), 1):
+            self.load()
+            return
+
+        dropped = np.array(changed + deleted, dtype=np.int64)
+        links = MeterDataUnitSpace.objects.filter(unitspace__property_space_id__in=changed)
+        units = UnitSpace.objects.filter(property_space_id__in=changed)
+        fresh = self._load_rows(changed, links, units, links.count(), units.count())
+        kept_links = ~np.isin(columns["link_property"], dropped)
+        kept_units = ~np.isin(columns["unit_property"], dropped)
+        merged = {
+            "property_ids": np.union1d(np.setdiff1d(columns["property_ids"], dropped), fresh["property_ids"]),
+            **{
+                name: np.concatenate([columns[name][kept_links], fresh[name]])
+                for name in ("link_property", "link_share", "link_start", "link_end")
+            },
+            **{
+                name: np.concatenate([columns[name][kept_units], fresh[name]])
+                for name in ("unit_property", "unit_area")
+            },
+        }
+        self._check_budget(len(merged["link_property"]), len(merged["unit_property"]), change_seq)
+        self._swap(self._index(merged), change_seq)
+        logger.info(f"Refreshed the columnar snapshot: {len(changed)} changed and {len(deleted)} deleted property spaces")
+
+    def _check_budget(self, links: int, units: int, change_seq: int) -> None:
+        needed = links * LINK_BYTES + units * UNIT_BYTES
+        if needed > _memory_budget():
+            raise MemoryBudgetExceeded(
+                f"The columnar snapshot needs {needed} bytes, over the budget of {_memory_budget()} bytes",
+                change_seq,
+            )
+
+    def _load_rows(self, property_space_ids: Iterable[int], links, units, link_count: int, unit_count: int) -> dict:
+        # The shares are stored in kWh and converted to the requested unit when they are summed.
+        factors = conversion_factors()
+
+        def link_rows():
+            for property_space_id, share_reading, measurement_unit, start, end in links.values_list(
+                "unitspace__property_space_id",
+                "meterdata__share_reading",
+                "meterdata__measurement_unit",
+                "meterdata__measurement_start_date",
+                "meterdata__measurement_end_date",
+            ).iterator(chunk_size=LOAD_CHUNK_SIZE):
+                # A unit missing from the conversion table is left out of the sums, like in SQL.
+                share = share_reading * factors[measurement_unit] if measurement_unit in factors else 0.0
+                yield property_space_id, share, start.timestamp(), end.timestamp()
+
+        columns = {
+            **_fill_columns(
+                link_rows(),
+                link_count,
+                [("link_property", np.int64), ("link_share", np.float64), ("link_start", np.float64), ("link_end", np.float64)],
+            ),
+            **_fill_columns(
+                units.values_list("property_space_id", "area").iterator(chunk_size=LOAD_CHUNK_SIZE),
+                unit_count,
+                [("unit_property", np.int64), ("unit_area", np.float64)],
+            ),
+        }
+        # The tables are read by separate queries, a property space created in between
+        # still gets its own bin. It is dropped by the next refresh if it was deleted.
+        # The links are deduplicated first, rather than concatenated into a copy of their column.
+        columns["property_ids"] = np.unique(np.concatenate([
+            np.fromiter(property_space_ids, dtype=np.int64), np.unique(columns["link_property"]), columns["unit_property"],
+        ]))
+        return self._index(columns)
+
+    def _index(self, columns: dict) -> dict:
+        # The position of the property space of each row, the bins of the grouped sums.
+        columns["link_index"] = np.searchsorted(columns["property_ids"], columns["link_property"])
+        columns["unit_index"] = np.searchsorted(columns["property_ids"], columns["unit_property"])
+        return columns
+
+    def _swap(self, columns: dict, change_seq: int) -> None:
+        size = len(columns["property_ids"])
+        columns["number_of_units"] = np.bincount(columns["unit_index"], minlength=size)
+        columns["total_area"] = np.bincount(columns["unit_index"], weights=columns["unit_area"], minlength=size)
+        self._columns, self._consumption_by_year = columns, {}
+        self.change_seq, self.refreshed_at = change_seq, time.monotonic()
+
+    def _consumption(self, year: int = None) -> "np.ndarray":
+        # The consumption in kWh of every property space, computed once per year and snapshot.
+        consumption_by_year = self._consumption_by_year
+        consumption = consumption_by_year.get(year)
+        if consumption is None:
+            columns = self._columns
+            index, share = columns["link_index"], columns["link_share"]
+            if year is not None:
+                # A reading belongs to a year if it starts or ends in that year, like `meter_year_filter`.
+                start, end = (bound.timestamp() for bound in year_range(year))
+                mask = (
+                    ((columns["link_start"] >= start) & (columns["link_start"] < end))
+                    | ((columns["link_end"] >= start) & (columns["link_end"] < end))
+                )
+                index, share = index[mask], share[mask]
+            consumption = np.bincount(index, weights=share, minlength=len(columns["property_ids"]))
+            consumption_by_year[year] = consumption
+        return consumption
+
+    def portfolio_totals(self, year: int = None, unit: str = None) -> dict:
+        """
+        Return the number of property spaces and unit spaces, the area and the consumption of the portfolio.
+
+        Args:
+            year (int): The year to filter the readings on.
+            unit (str): The unit of the consumption, the default unit if None.
+        """
+        columns = self._columns
+        return {
+            "property_count": len(columns["property_ids"]),
+            "number_of_units": int(columns["number_of_units"].sum()),
+            "total_area": float(columns["total_area"].sum()),
+            "total_consumption": float(self._consumption(year).sum()) / conversion_factors()[resolve_unit(unit)],
+        }
+
+
+def _fill_columns(rows: Iterable[tuple], count: int, columns: List[Tuple[str, type]]) -> dict:
+    # Fill arrays allocated for `count` rows, one chunk of rows at a time, so the load needs
+    # the final arrays and a chunk of Python objects, not a Python list per column.
+    # The rows added since the count grow the arrays, the rows deleted shrink them.
+    arrays = {name: np.empty(count, dtype=dtype) for name, dtype in columns}
+    position = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, LOAD_CHUNK_SIZE))
+        if not chunk:
+            break
+        end = position + len(chunk)
+        if end > len(arrays[columns[0][0]]):
+            for name in arrays:
+                arrays[name] = np.resize(arrays[name], end + end // 4)
+        for index, (name, _) in enumerate(columns):
+            arrays[name][position:end] = [row[index] for row in chunk]
+        position = end
+    if position == len(arrays[columns[0][0]]):
+        return arrays
+    # A copy, a view would keep the whole buffer.
+    return {name: array[:position].copy() for name, array in arrays.items()}
+
+
+_snapshot: Optional[ColumnarSnapshot] = None
+_snapshot_lock = threading.Lock()
+# The change sequence value and the budget of the last load over the budget. The counts are only
+# taken again once the data or the budget changed.
+_over_budget: Optional[Tuple[int, int]] = None
+
+
+def columnar_enabled() -> bool:
+    return np is not None and getattr(settings, "COLUMNAR_ANALYTICS_ENABLED", False)
+
+
+def get_snapshot() -> Optional[ColumnarSnapshot]:
+    """
+    Return the snapshot of the process, loaded on the first call and refreshed when it is
+    older than COLUMNAR_REFRESH_SECONDS. Returns None when the engine is not available.
+    """
+    global _snapshot, _over_budget
+    if not columnar_enabled():
+        return None
+    snapshot = _snapshot
+    refresh_seconds = getattr(settings, "COLUMNAR_REFRESH_SECONDS", 5)
+    if snapshot is not None and time.monotonic() - snapshot.refreshed_at < refresh_seconds:
+        return snapshot
+    with _snapshot_lock:
+        try:
+            if _snapshot is None:
+                if _over_budget is not None and _over_budget == (current_change_seq(), _memory_budget()):
+                    return None
+                snapshot = ColumnarSnapshot()
+                snapshot.load()
+                _snapshot = snapshot
+                _over_budget = None
+            elif time.monotonic() - _snapshot.refreshed_at >= refresh_seconds:
+                _snapshot.refresh()
+        except MemoryBudgetExceeded as exc:
+            # Dropped until the data or the budget changes, e.g. after rows were deleted or the budget was raised.
+            logger.warning(f"Columnar analytics disabled: {exc}")
+            _snapshot = None
+            _over_budget = (exc.change_seq, _memory_budget())
+        return _snapshot
+
+
+def reset_snapshot() -> None:
+    """
+    Drop the snapshot of the process, the next `get_snapshot` loads a new one.
+    """
+    global _snapshot, _over_budget
+    with _snapshot_lock:
+        _snapshot = None
+        _over_budget = None
@@ -0,0 +1,203 @@
+# Description: Routing of the read-only endpoints to the read replicas.
+# The replicas are the aliases of DATABASE_REPLICAS, with their weights. Reads go to
+# a replica only inside a view decorated with `replica_reads`; everything else,
+# including the reads of the write endpoints and of the management commands, uses
+# the primary (`default`). After a write, the client reads from the primary for
+# DATABASE_PRIMARY_STICKY_SECONDS, so it sees its own write despite the replication lag.
+# The replica is selected on the first read of a view and used for all its reads,
+# so the queries of a request see the same replica, with the same lag.
+
+import functools
+import inspect
+import itertools
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import StreamingHttpResponse
+
+ROUND_ROBIN = "round_robin"
+RANDOM = "random"
+
+
+class RoutingState:
+    """
+    Routing state of a request, set by `api.middleware.ReplicaRoutingMiddleware`.
+
+    Args:
+        pinned (bool): The client wrote recently, its reads go to the primary.
+    """
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+class _ReplicaReads:
+    # The replica selected for the reads of a view, on its first read.
+
+    def __init__(self):
+        self.alias = None
+
+
+_current_state: ContextVar = ContextVar("routing_state", default=None)
+_replica_reads: ContextVar = ContextVar("replica_reads", default=None)
+
+
+@contextmanager
+def routing_state(state: RoutingState):
+    """
+    Use the routing state for the requests handled in the block.
+
+    Args:
+        state (RoutingState): The routing state of the request.
+    """
+    token = _current_state.set(state)
+    try:
+        yield state
+    finally:
+        _current_state.reset(token)
+
+
+@contextmanager
+def use_replicas(reads: _ReplicaReads = None):
+    """
+    Send the reads of the block to a replica, unless the client is pinned to the primary.
+    All the reads of the block, including those of a nested block, go to the same replica.
+
+    Args:
+        reads (_ReplicaReads): The replica selection to continue, e.g. in the chunks of a streamed response.
+    """
+    token = _replica_reads.set(reads or _replica_reads.get() or _ReplicaReads())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pinned_to_primary() -> bool:
+    """
+    Return whether the reads of the current request go to the primary because its client wrote recently,
+    or because the request itself wrote.
+    """
+    state = _current_state.get()
+    return state is not None and (state.pinned or state.wrote)
+
+
+def read_from_replica() -> bool:
+    """
+    Return whether the current view read from a replica, which may lag behind the primary.
+    """
+    reads = _replica_reads.get()
+    return reads is not None and reads.alias is not None
+
+
+class _ReplicaIterator:
+    # The chunks of a streamed response are computed after the view returns.
+    def __init__(self, iterable, reads: _ReplicaReads):
+        self.iterator = iter(iterable)
+        self.reads = reads
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with use_replicas(self.reads):
+            return next(self.iterator)
+
+
+def _stream_from_replicas(response):
+    if isinstance(response, StreamingHttpResponse):
+        response.streaming_content = _ReplicaIterator(response.streaming_content, _replica_reads.get())
+    return response
+
+
+def replica_reads(view):
+    """
+    Decorator of the read-only views, whose reads can be served by the replicas.
+    It supports the sync and async views, and the streamed responses.
+
+    Args:
+        view (Callable): The view function.
+    """
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            with use_replicas():
+                return _stream_from_replicas(await view(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replicas():
+            return _stream_from_replicas(view(*args, **kwargs))
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of the `replica_reads` views to the replicas,
+    selected in weighted round-robin (DATABASE_REPLICA_SELECTION = "round_robin")
+    or at random in proportion to their weights ("random").
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cycles = {}
+
+    def _replicas(self) -> Dict[str, int]:
+        return getattr(settings, "DATABASE_REPLICAS", {})
+
+    def _round_robin(self, replicas: Dict[str, int]) -> str:
+        # One cycle per configuration, so that overridden settings take effect.
+        key = tuple(sorted(replicas.items()))
+        with self._lock:
+            if key not in self._cycles:
+                self._cycles[key] = itertools.cycle(_weighted_sequence(replicas))
+            return next(self._cycles[key])
+
+    def _select(self, replicas: Dict[str, int]) -> str:
+        if getattr(settings, "DATABASE_REPLICA_SELECTION", ROUND_ROBIN) == RANDOM:
+            return random.choices(list(replicas), weights=list(replicas.values()))[0]
+        return self._round_robin(replicas)
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        reads = _replica_reads.get()
+        if not replicas or reads is None:
+            return DEFAULT_DB_ALIAS
+        state = _current_state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        if reads.alias not in replicas:
+            reads.alias = self._select(replicas)
+        return reads.alias
+
+    def db_for_write(self, model, **hints):
+        state = _current_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def _weighted_sequence(replicas: Dict[str, int]) -> List[str]:
+    # Smooth weighted round-robin: {"a": 2, "b": 1} gives a, b, a rather than a, a, b.
+    current = {alias: 0 for alias in replicas}
+    total = sum(replicas.values())
+    sequence = []
+    for _ in range(total):
+        for alias, weight in replicas.items():
+            current[alias] += weight
+        alias = max(current, key=current.get)
+        current[alias] -= total
+        sequence.append(alias)
+    return sequence
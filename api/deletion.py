@@ -0,0 +1,104 @@
+# Description: Bulk deletion of property spaces with their addresses, unit spaces and meters.
+# Model.delete() runs the deletion collector, which loads every unit space and meter link
+# into Python and sends a signal per row. Here each table is deleted with one
+# `DELETE ... WHERE id IN (subquery)` per batch of property spaces, so the rows are selected
+# by the database and never loaded, and no model signal is sent. Each batch runs in its own
+# transaction, so the locks are held for a bounded time. The rows are deleted parents
+# first, the foreign keys are checked at the commit.
+# The meters linked only to the deleted unit spaces (none of their links is left, a NOT
+# EXISTS subquery) are deleted with them. The meters shared with other property spaces are
+# kept, with their shares refreshed, and those property spaces are notified once per batch
+# (rollups, cached responses, change feed). Every deleted property space leaves a tombstone
+# in the change feed.
+
+from typing import Iterable
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef, QuerySet
+from api.changes import record_tombstones
+from api.models import Address, MeterData, MeterDataUnitSpace, PropertySpace, PropertySpaceYearlyRollup, UnitSpace
+from api.response_cache import invalidate_property_spaces
+from api.shares import refresh_meter_shares
+from api.signals import notify_meters_changed
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 500
+
+
+def _delete(queryset: QuerySet) -> int:
+    # A single DELETE of the rows selected by the queryset, as a subquery: unlike QuerySet.delete(),
+    # no row is loaded and no signal is sent.
+    model = queryset.model
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    subquery, params = queryset.values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote_name(model._meta.db_table)} WHERE {quote_name(model._meta.pk.column)} IN ({subquery})",
+            params,
+        )
+        return cursor.rowcount
+
+
+def delete_property_spaces(property_space_ids: Iterable[int], batch_size: int = DELETE_BATCH_SIZE) -> dict:
+    """
+    Delete property spaces with their address, unit spaces, rollups, meter links and the meters
+    linked only to them. Returns the number of deleted rows per model and the IDs not found.
+    Each batch is deleted in its own transaction: an error leaves the previous batches deleted.
+
+    Args:
+        property_space_ids (Iterable[int]): The property spaces to delete.
+        batch_size (int): The number of property spaces deleted per transaction.
+    """
+    property_space_ids = list(dict.fromkeys(property_space_ids))
+    existing = sorted(PropertySpace.objects.filter(id__in=property_space_ids).values_list("id", flat=True))
+    found = set(existing)
+    result = {
+        "deleted": 0,
+        "unit_spaces": 0,
+        "meters": 0,
+        "addresses": 0,
+        "not_found": [property_space_id for property_space_id in property_space_ids if property_space_id not in found],
+    }
+    for start in range(0, len(existing), batch_size):
+        batch = existing[start:start + batch_size]
+        with transaction.atomic():
+            counts = _delete_batch(batch)
+        for name, count in counts.items():
+            result[name] += count
+    logger.info(
+        f"Deleted {result['deleted']} property spaces, {result['unit_spaces']} unit spaces, "
+        f"{result['meters']} meters and {result['addresses']} addresses"
+    )
+    return result
+
+
+def _delete_batch(property_space_ids: list) -> dict:
+    links = MeterDataUnitSpace.objects.filter(unitspace__property_space_id__in=property_space_ids)
+    other_links = (
+        MeterDataUnitSpace.objects
+        .filter(meterdata_id=OuterRef("pk"))
+        .exclude(unitspace__property_space_id__in=property_space_ids)
+    )
+    meters = MeterData.objects.filter(id__in=links.values("meterdata_id"))
+    # The meters still linked to another property space, whose totals change.
+    shared_meter_ids = list(meters.filter(Exists(other_links)).values_list("id", flat=True))
+
+    meters = _delete(meters.exclude(Exists(other_links)))
+    _delete(links)
+    _delete(PropertySpaceYearlyRollup.objects.filter(property_space_id__in=property_space_ids))
+    unit_spaces = _delete(UnitSpace.objects.filter(property_space_id__in=property_space_ids))
+    addresses = _delete(Address.objects.filter(propertyspace__id__in=property_space_ids))
+    deleted = _delete(PropertySpace.objects.filter(id__in=property_space_ids))
+
+    if shared_meter_ids:
+        # Divided between fewer unit spaces now, the totals of the other property spaces changed.
+        refresh_meter_shares(shared_meter_ids)
+        notify_meters_changed(shared_meter_ids)
+    record_tombstones(property_space_ids)
+    invalidate_property_spaces(property_space_ids)
+    # A request running before the commit may cache the deleted property spaces again.
+    transaction.on_commit(lambda: invalidate_property_spaces(property_space_ids))
+    return {"deleted": deleted, "unit_spaces": unit_spaces, "meters": meters, "addresses": addresses}
@@ -1,15 +1,39 @@
 # Description: This file contains the API endpoints for the version 1 of the API.
 
-import os
-from typing import List
-from ninja import NinjaAPI
+import json
+import math
+from datetime import date, datetime
+from typing import List, Literal, Optional, Union
+from asgiref.sync import sync_to_async
+from ninja import NinjaAPI, Query
 from ninja.security import HttpBearer
-from .schema_v1 import PropertySpaceIn, PropertySpaceOut, PatchPropertySpaceSchema
-from api.models import Address, PropertySpace, UnitSpace, MeterData
+from .schema_v1 import (
+    PropertySpaceIn, PropertySpaceOut, PropertySpaceFieldsOut, PatchPropertySpaceSchema,
+    MeterReadingsBulkIn, MeterReadingsBulkOut, CacheStatsOut, ConsumptionSeriesOut, PortfolioGroupsOut, PortfolioTotalsOut, IntensityRankingOut,
+    PropertySpacesImportIn, PropertySpacesImportOut, PropertySpaceChangesOut,
+    RebuildRollupsJobIn, PortfolioReportJobIn, JobOut, PropertySpacesDeleteIn, PropertySpacesDeleteOut,
+    PropertySpacesBatchOut, PropertySpacesPageOut
+)
+from api.models import Address, Job, PropertySpace
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch, Q, Count
-from django.http import Http404
-from api.exceptions import ServiceUnavailableException
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from api.aggregations import PROPERTY_SPACE_TOTALS, annotate_property_space_totals
+from api.analytics import RANKING_LIMIT_DEFAULT, intensity_ranking, portfolio_groups, portfolio_totals
+from api.auth import authenticate_api_key
+from api.changes import changes_page
+from api.db_router import replica_reads
+from api.deletion import delete_property_spaces
+from api.exceptions import BadRequestException, ConflictException, RateLimitExceededException, ServiceUnavailableException
+from api.ingest import ingest_meter_readings
+from api.jobs import REPORT_YEARS_MAX, cancel_job, submit_job
+from api.middleware import timed
+from api.pagination import apaginate_by_id, paginate_by_id
+from api.rate_limit import check_rate_limit
+from api.response_cache import acached_response, cache_stats, cached_response, detail_cache_key, list_cache_key
+from api.timeseries import consumption_time_series
+from api.topology import import_topology
+from api.units import default_unit, resolve_unit
 import logging
 
 
@@ -18,12 +42,35 @@ logger = logging.getLogger(__name__)
 
 class AuthBearer(HttpBearer):
     def authenticate(self, request, token):
-        auth_token = os.getenv('AUTH_TOKEN')
-        if token == auth_token:
-            return token
+        identity = authenticate_api_key(token)
+        if identity is not None:
+            check_rate_limit(identity.id, identity.rate_limit_per_minute, identity.rate_limit_burst)
+        return identity
+
+
+class AsyncAuthBearer(AuthBearer):
+    # The key lookup and the rate limit use the database and the cache, run in one thread hop.
+    is_async = True
+
+    async def authenticate(self, request, token):
+        return await sync_to_async(super().authenticate)(request, token)
+
 
 api_v1 = NinjaAPI(version='1.0', auth=AuthBearer())
 
+# The columns of a property space response, fetched with values() instead of model instances.
+ADDRESS_FIELDS = ["address__street", "address__city", "address__state", "address__country", "address__postal_code"]
+PROPERTY_SPACE_FIELDS = ["id", "name", *ADDRESS_FIELDS, "number_of_units", "total_area", "total_consumption"]
+
+# The fields of a property space response that can be selected with the `fields` parameter.
+PROPERTY_SPACE_OUTPUT_FIELDS = list(PropertySpaceOut.model_fields)
+
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+EXPORT_BATCH_SIZE = 500
+# The most property spaces requested at once by ID.
+BATCH_IDS_MAX = 1000
+
 
 @api_v1.post("/property-spaces")
 def create_property_space_v1(request, payload: PropertySpaceIn):
@@ -44,46 +91,215 @@ def create_property_space_v1(request, payload: PropertySpaceIn):
     return {"property_space_id": property_space.id}
 
 
-@api_v1.get("/property-spaces/{property_space_id}", response=PropertySpaceOut)
-def get_property_space_by_id_v1(request, property_space_id: int, year: int = None):
+@api_v1.post("/property-spaces/import", response=PropertySpacesImportOut)
+def import_property_spaces_v1(request, payload: PropertySpacesImportIn):
+    logger.info(f"Importing {len(payload.properties)} property spaces, upsert: {payload.upsert}")
+    return import_topology(
+        (property_space.dict() for property_space in payload.properties),
+        upsert=payload.upsert,
+    )
+
+
+@api_v1.post("/property-spaces/bulk-delete", response=PropertySpacesDeleteOut)
+def bulk_delete_property_spaces_v1(request, payload: PropertySpacesDeleteIn):
+    logger.info(f"Deleting {len(payload.ids)} property spaces")
+    return delete_property_spaces(payload.ids)
+
+
+@api_v1.get("/property-spaces/export")
+@replica_reads
+def export_property_spaces_v1(
+    request,
+    year: int = None,
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=PAGE_SIZE_MAX),
+    unit: str = None,
+):
+    logger.info(f"Exporting property spaces with year: {year}")
+    response = StreamingHttpResponse(
+        _stream_property_spaces_ndjson(year, batch_size, resolve_unit(unit)),
+        content_type="application/x-ndjson",
+    )
+    response["Content-Disposition"] = 'attachment; filename="property-spaces.ndjson"'
+    return response
+
+
+# Read from the primary: the rows and the tombstones of a page come from two queries,
+# on replicas they could see different points of the replication and the cursor could skip changes.
+@api_v1.get("/property-spaces/changes", response=PropertySpaceChangesOut)
+def get_property_space_changes_v1(
+    request,
+    cursor: str = None,
+    updated_since: datetime = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    year: int = None,
+    unit: str = None,
+):
+    logger.info(f"Getting property space changes with cursor: {cursor}, updated_since: {updated_since}, limit: {limit}")
+    unit = resolve_unit(unit)
+    queryset = (
+        annotate_property_space_totals(PropertySpace.objects.all(), year, use_rollup=True, unit=unit)
+        .values(*PROPERTY_SPACE_FIELDS, "change_seq", "updated_at")
+    )
+    with timed("aggregation"):
+        changes, next_cursor, has_more = changes_page(queryset, limit, cursor, updated_since)
+        data = {
+            "changes": [
+                {
+                    "id": change["id"],
+                    "change_seq": change["change_seq"],
+                    "updated_at": change["updated_at"],
+                    "deleted": change["deleted"],
+                    "property_space": None if change["deleted"] else _generate_property_space_dict(change, unit=unit),
+                }
+                for change in changes
+            ],
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+    with timed("serialization"):
+        return api_v1.create_response(request, data, status=200)
+
+
+@api_v1.get("/property-spaces/batch", response=PropertySpacesBatchOut)
+@replica_reads
+def get_property_spaces_by_ids_v1(request, ids: str, year: int = None, fields: str = None, unit: str = None):
+    property_space_ids = _parse_ids(ids)
+    logger.info(f"Getting {len(property_space_ids)} property spaces by id with year: {year}")
+    fields, unit = _parse_fields(fields), resolve_unit(unit)
+    with timed("aggregation"):
+        property_spaces = list(_property_spaces_by_ids_queryset(property_space_ids, year, fields, unit))
+    return _property_spaces_batch_response(request, property_space_ids, property_spaces, fields, unit)
+
+
+@api_v1.get("/property-spaces/{property_space_id}", response=Union[PropertySpaceOut, PropertySpaceFieldsOut])
+@replica_reads
+def get_property_space_by_id_v1(
+    request, property_space_id: int, year: int = None, fields: str = None, unit: str = None
+):
     logger.info(f"Getting property space by id: {property_space_id}")
-    property_space = (
-        PropertySpace.objects
-        .filter(id=property_space_id)
-        .select_related("address")
-        .prefetch_related(_generate_property_space_prefetch(year))
+    fields, unit = _parse_fields(fields), resolve_unit(unit)
+    return cached_response(
+        request,
+        detail_cache_key(property_space_id, year, fields, unit),
+        lambda: _render_property_space(request, property_space_id, year, fields, unit),
     )
-    if not property_space.exists():
-        logger.error(f"Property space not found: {property_space_id}")
-        raise Http404
-    logger.info(f"Property space found: {property_space_id}")
-    return _generate_property_space_dict(property_space.first())
 
 
-@api_v1.get("/property-spaces", response=List[PropertySpaceOut])
-def get_property_spaces_v1(request, year: int = None):
-    logger.info(f"Getting all property spaces with year: {year}")
-    property_spaces = (
-        PropertySpace.objects
-        .select_related("address")
-        .prefetch_related(_generate_property_space_prefetch(year))
+@api_v1.get("/property-spaces/{property_space_id}/consumption", response=ConsumptionSeriesOut)
+@replica_reads
+def get_property_space_consumption_v1(
+    request,
+    property_space_id: int,
+    start: date,
+    end: date,
+    granularity: Literal["year", "month"] = "year",
+    prorate: bool = False,
+    unit: str = None,
+):
+    unit = resolve_unit(unit)
+    logger.info(f"Getting {granularity} consumption of property space {property_space_id} from {start} to {end}")
+    if not PropertySpace.objects.filter(id=property_space_id).exists():
+        raise Http404(f"Property space {property_space_id} not found")
+    return {
+        "property_space_id": property_space_id,
+        "granularity": granularity,
+        "prorated": prorate,
+        "consumption_unit": unit,
+        "buckets": consumption_time_series(property_space_id, start, end, granularity, prorate, unit),
+    }
+
+
+@api_v1.get("/property-spaces", response=Union[List[Union[PropertySpaceOut, PropertySpaceFieldsOut]], PropertySpacesPageOut])
+@replica_reads
+def get_property_spaces_v1(
+    request,
+    year: int = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: str = None,
+    fields: str = None,
+    unit: str = None,
+    envelope: bool = False,
+):
+    logger.info(f"Getting property spaces with year: {year}, limit: {limit}, cursor: {cursor}")
+    fields, unit = _parse_fields(fields), resolve_unit(unit)
+    return cached_response(
+        request,
+        list_cache_key(year, limit, cursor, fields, unit, envelope),
+        lambda: _render_property_spaces(request, year, limit, cursor, fields, unit, envelope),
+    )
+
+
+# Async variants of the read endpoints, for the ASGI deployment.
+# They return the same responses and share the cache of the sync endpoints.
+@api_v1.get("/async/property-spaces/batch", response=PropertySpacesBatchOut, auth=AsyncAuthBearer())
+@replica_reads
+async def get_property_spaces_by_ids_async_v1(request, ids: str, year: int = None, fields: str = None, unit: str = None):
+    property_space_ids = _parse_ids(ids)
+    logger.info(f"Getting {len(property_space_ids)} property spaces by id with year: {year}")
+    fields, unit = _parse_fields(fields), resolve_unit(unit)
+    with timed("aggregation"):
+        property_spaces = [
+            property_space async for property_space in _property_spaces_by_ids_queryset(property_space_ids, year, fields, unit)
+        ]
+    return _property_spaces_batch_response(request, property_space_ids, property_spaces, fields, unit)
+
+
+@api_v1.get(
+    "/async/property-spaces/{property_space_id}",
+    response=Union[PropertySpaceOut, PropertySpaceFieldsOut],
+    auth=AsyncAuthBearer(),
+)
+@replica_reads
+async def get_property_space_by_id_async_v1(
+    request, property_space_id: int, year: int = None, fields: str = None, unit: str = None
+):
+    logger.info(f"Getting property space by id: {property_space_id}")
+    fields, unit = _parse_fields(fields), resolve_unit(unit)
+    return await acached_response(
+        request,
+        lambda: detail_cache_key(property_space_id, year, fields, unit),
+        lambda: _arender_property_space(request, property_space_id, year, fields, unit),
+    )
+
+
+@api_v1.get(
+    "/async/property-spaces",
+    response=Union[List[Union[PropertySpaceOut, PropertySpaceFieldsOut]], PropertySpacesPageOut],
+    auth=AsyncAuthBearer(),
+)
+@replica_reads
+async def get_property_spaces_async_v1(
+    request,
+    year: int = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: str = None,
+    fields: str = None,
+    unit: str = None,
+    envelope: bool = False,
+):
+    logger.info(f"Getting property spaces with year: {year}, limit: {limit}, cursor: {cursor}")
+    fields, unit = _parse_fields(fields), resolve_unit(unit)
+    return await acached_response(
+        request,
+        lambda: list_cache_key(year, limit, cursor, fields, unit, envelope),
+        lambda: _arender_property_spaces(request, year, limit, cursor, fields, unit, envelope),
     )
-    logger.info(f"Found {property_spaces.count()} property spaces")
-    return [_generate_property_space_dict(property_space) for property_space in property_spaces]
 
 
 @api_v1.put("/property-spaces/{property_space_id}")
 def update_property_space_v1(request, property_space_id: int, payload: PatchPropertySpaceSchema):
     logger.info(f"Updating property space: {property_space_id}")
-    property_space = get_object_or_404(PropertySpace, id=property_space_id)
-    if payload.name:
-        property_space.name = payload.name
-    if payload.address:
-        address = property_space.address
-        for attr, value in payload.address.dict(exclude_unset=True).items():
-            setattr(address, attr, value)
-        address.save()
-    property_space.save()
+    # The address, the property space and their change feed position are committed together.
+    with transaction.atomic():
+        property_space = get_object_or_404(PropertySpace, id=property_space_id)
+        if payload.name:
+            property_space.name = payload.name
+        if payload.address:
+            address = property_space.address
+            for attr, value in payload.address.dict(exclude_unset=True).items():
+                setattr(address, attr, value)
+            address.save()
+        property_space.save()
     logger.info(f"Property space updated: {property_space_id}")
     return {"success": True}
 
@@ -91,12 +307,111 @@ def update_property_space_v1(request, property_space_id: int, payload: PatchProp
 @api_v1.delete("/property-spaces/{property_space_id}")
 def delete_property_space_v1(request, property_space_id: int):
     logger.info(f"Deleting property space: {property_space_id}")
-    property_space = get_object_or_404(PropertySpace, id=property_space_id)
-    property_space.delete()
+    # With its address and the meters linked only to it, unlike PropertySpace.delete().
+    if delete_property_spaces([property_space_id])["not_found"]:
+        raise Http404
     logger.info(f"Property space deleted: {property_space_id}")
     return {"success": True}
 
 
+@api_v1.post("/meter-data/bulk", response=MeterReadingsBulkOut)
+def bulk_create_meter_data_v1(request, payload: MeterReadingsBulkIn):
+    logger.info(f"Ingesting {len(payload.readings)} meter readings")
+    return ingest_meter_readings(reading.dict() for reading in payload.readings)
+
+
+@api_v1.get("/analytics/portfolio", response=PortfolioGroupsOut)
+@replica_reads
+def get_portfolio_analytics_v1(
+    request,
+    group_by: Literal["city", "state", "country", "unit_type"] = "city",
+    year: int = None,
+    unit: str = None,
+):
+    logger.info(f"Getting portfolio analytics by {group_by} with year: {year}")
+    unit = resolve_unit(unit)
+    return {
+        "group_by": group_by,
+        "year": year,
+        "consumption_unit": unit,
+        "groups": portfolio_groups(group_by, year, unit),
+    }
+
+
+@api_v1.get("/analytics/totals", response=PortfolioTotalsOut)
+@replica_reads
+def get_portfolio_totals_v1(request, year: int = None, unit: str = None):
+    logger.info(f"Getting the portfolio totals with year: {year}")
+    unit = resolve_unit(unit)
+    return {
+        "year": year,
+        "consumption_unit": unit,
+        **portfolio_totals(year, unit),
+    }
+
+
+@api_v1.get("/analytics/intensity-ranking", response=IntensityRankingOut)
+@replica_reads
+def get_intensity_ranking_v1(
+    request,
+    year: int = None,
+    limit: int = Query(RANKING_LIMIT_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    unit: str = None,
+):
+    logger.info(f"Getting the intensity ranking with year: {year}, limit: {limit}")
+    unit = resolve_unit(unit)
+    return {
+        "year": year,
+        "consumption_unit": unit,
+        "property_spaces": intensity_ranking(year, limit, unit),
+    }
+
+
+@api_v1.post("/jobs/rebuild-rollups", response={202: JobOut})
+def submit_rebuild_rollups_job_v1(request, payload: RebuildRollupsJobIn):
+    logger.info("Submitting a rollup rebuild")
+    return 202, submit_job("rebuild_rollups", payload.dict(exclude_none=True))
+
+
+@api_v1.post("/jobs/portfolio-report", response={202: JobOut})
+def submit_portfolio_report_job_v1(request, payload: PortfolioReportJobIn):
+    logger.info(f"Submitting a portfolio report from {payload.start_year} to {payload.end_year} by {payload.group_by}")
+    if payload.end_year < payload.start_year:
+        raise BadRequestException("end_year must not be before start_year")
+    if payload.end_year - payload.start_year >= REPORT_YEARS_MAX:
+        raise BadRequestException(f"A report covers at most {REPORT_YEARS_MAX} years")
+    params = payload.dict()
+    params["unit"] = resolve_unit(payload.unit)
+    return 202, submit_job("portfolio_report", params)
+
+
+@api_v1.get("/jobs/{job_id}", response=JobOut)
+def get_job_v1(request, job_id: int):
+    # Read from the primary, a replica may lag behind the worker.
+    return get_object_or_404(Job.objects.defer("result"), id=job_id)
+
+
+@api_v1.get("/jobs/{job_id}/result")
+def get_job_result_v1(request, job_id: int):
+    job = get_object_or_404(Job, id=job_id)
+    if job.status != Job.SUCCEEDED:
+        raise ConflictException(f"Job {job_id} is {job.status}, its result is available once it succeeded.")
+    response = HttpResponse(job.result, content_type=job.result_content_type)
+    response["Content-Disposition"] = f'attachment; filename="{job.result_filename}"'
+    return response
+
+
+@api_v1.post("/jobs/{job_id}/cancel", response=JobOut)
+def cancel_job_v1(request, job_id: int):
+    logger.info(f"Cancelling job: {job_id}")
+    return cancel_job(get_object_or_404(Job.objects.defer("result"), id=job_id))
+
+
+@api_v1.get("/cache-stats", response=CacheStatsOut)
+def get_cache_stats_v1(request):
+    return cache_stats()
+
+
 @api_v1.get("/service-unavailable-exception")
 def simulate_service_unavailable_exception(request):
     raise ServiceUnavailableException("We are simulating a service unavailable exception.")
@@ -113,62 +428,328 @@ def service_unavailable(request, exc):
     )
 
 
-def _generate_property_space_prefetch(year: int = None) -> Prefetch:
+@api_v1.exception_handler(RateLimitExceededException)
+def rate_limit_exceeded(request, exc):
+    logger.warning(f"RateLimitExceededException: {exc.message}")
+    response = api_v1.create_response(
+        request,
+        {"message": f'{exc.message} Please retry later'},
+        status=429,
+    )
+    response["Retry-After"] = str(math.ceil(exc.retry_after))
+    return response
+
+
+@api_v1.exception_handler(ConflictException)
+def conflict(request, exc):
+    logger.warning(f"ConflictException: {exc.message}")
+    return api_v1.create_response(
+        request,
+        {"message": exc.message},
+        status=409,
+    )
+
+
+@api_v1.exception_handler(BadRequestException)
+def bad_request(request, exc):
+    logger.error(f"BadRequestException: {exc.message}")
+    return api_v1.create_response(
+        request,
+        {"message": exc.message},
+        status=400,
+    )
+
+
+def _parse_fields(fields: str) -> Optional[List[str]]:
     """
-    Generate a Prefetch object to be used in the PropertySpace queryset.
-    This prefetch will optimize the queries to get the related data.
+    Parse the `fields` parameter, a comma-separated list of `PropertySpaceOut` fields.
+    Returns the fields in the schema order, or None for every field.
 
     Args:
-        year (int): The year to filter the MeterData queryset.
+        fields (str): The value of the parameter.
     """
-    meterdata_query = (
-        MeterData.objects.all()
-        .annotate(count=Count("unit_space"))
-    )
-    if year != None:
-        meterdata_query = meterdata_query.filter(
-            Q(measurement_start_date__year=year) | Q(measurement_end_date__year=year)
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(PROPERTY_SPACE_OUTPUT_FIELDS)
+    if unknown or not requested:
+        raise BadRequestException(
+            f"Invalid fields: {', '.join(sorted(unknown)) or fields!r}. "
+            f"Available fields: {', '.join(PROPERTY_SPACE_OUTPUT_FIELDS)}"
         )
+    if len(requested) == len(PROPERTY_SPACE_OUTPUT_FIELDS):
+        return None
+    return [field for field in PROPERTY_SPACE_OUTPUT_FIELDS if field in requested]
+
+
+def _annotate_fields(queryset, year: int, fields: List[str], use_rollup: bool = False, unit: str = None):
+    # Only the totals and the columns of the requested fields are computed, e.g. no join
+    # of the address and no subquery of the units and meters for `fields=name`.
+    if fields is None:
+        return annotate_property_space_totals(queryset, year, use_rollup=use_rollup, unit=unit).values(*PROPERTY_SPACE_FIELDS)
+    columns = ["id"]
+    if "name" in fields:
+        columns.append("name")
+    if "address" in fields:
+        columns += ADDRESS_FIELDS
+    totals = [field for field in fields if field in PROPERTY_SPACE_TOTALS]
+    columns += totals
+    return annotate_property_space_totals(queryset, year, use_rollup=use_rollup, totals=totals, unit=unit).values(*columns)
+
+
+def _property_space_queryset(property_space_id: int, year: int, fields: List[str] = None, unit: str = None):
+    return _annotate_fields(PropertySpace.objects.filter(id=property_space_id), year, fields, use_rollup=True, unit=unit)
+
+
+def _property_space_response(
+    request, property_space_id: int, property_space: dict, fields: List[str] = None, unit: str = None
+) -> HttpResponse:
+    if property_space is None:
+        logger.error(f"Property space not found: {property_space_id}")
+        raise Http404
+    logger.info(f"Property space found: {property_space_id}")
+    with timed("aggregation"):
+        data = _generate_property_space_dict(property_space, fields, unit)
+    with timed("serialization"):
+        return api_v1.create_response(request, data, status=200)
+
+
+def _render_property_space(
+    request, property_space_id: int, year: int, fields: List[str] = None, unit: str = None
+) -> HttpResponse:
+    """
+    Render the response of a property space, called on a cache miss.
+
+    Args:
+        request (HttpRequest): The request.
+        property_space_id (int): The property space ID.
+        year (int): The year to filter the MeterData on.
+        fields (List[str]): The fields of the response, every field if None.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    with timed("aggregation"):
+        property_space = _property_space_queryset(property_space_id, year, fields, unit).first()
+    return _property_space_response(request, property_space_id, property_space, fields, unit)
 
-    return Prefetch(
-        "unitspace_set",
-        queryset=UnitSpace.objects.prefetch_related(
-            Prefetch(
-                "meterdata_set",
-                queryset=meterdata_query
-            )
-        )
-    )
+
+async def _arender_property_space(
+    request, property_space_id: int, year: int, fields: List[str] = None, unit: str = None
+) -> HttpResponse:
+    """
+    Async version of `_render_property_space`.
+
+    Args:
+        request (HttpRequest): The request.
+        property_space_id (int): The property space ID.
+        year (int): The year to filter the MeterData on.
+        fields (List[str]): The fields of the response, every field if None.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    with timed("aggregation"):
+        property_space = await _property_space_queryset(property_space_id, year, fields, unit).afirst()
+    return _property_space_response(request, property_space_id, property_space, fields, unit)
 
 
-def _generate_property_space_dict(property_space: PropertySpace) -> PropertySpaceOut:
+def _parse_ids(ids: str) -> List[int]:
     """
-    Generate a dictionary with the property space data.
-    
+    Parse the `ids` parameter, a comma-separated list of property space IDs.
+    Returns the IDs in the requested order, repeated IDs included.
+
     Args:
-        property_space (PropertySpace): The property space object.
-    """
-
-    name = property_space.name
-    address = property_space.address
-    number_of_units = property_space.unitspace_set.count()
-    total_area = sum(unit.area for unit in property_space.unitspace_set.all())
-    # If a meter is shared between units, 
-    #   the consumption of the meter will be divided by 
-    #   the number of units associated with it.
-    total_consumption = sum(
-        meter.measurement_reading / meter.count 
-        for unit in property_space.unitspace_set.all() 
-        for meter in unit.meterdata_set.all()
+        ids (str): The value of the parameter.
+    """
+    try:
+        property_space_ids = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise BadRequestException(f"Invalid ids: {ids!r}. Expected a comma-separated list of integers")
+    if not property_space_ids:
+        raise BadRequestException("Invalid ids: at least one ID is required")
+    if len(property_space_ids) > BATCH_IDS_MAX:
+        raise BadRequestException(f"Invalid ids: at most {BATCH_IDS_MAX} IDs can be requested at once")
+    return property_space_ids
+
+
+def _property_spaces_by_ids_queryset(property_space_ids: List[int], year: int, fields: List[str] = None, unit: str = None):
+    # One query for every ID, reading the rollups with a year like the detail endpoint.
+    return _annotate_fields(
+        PropertySpace.objects.filter(id__in=set(property_space_ids)), year, fields, use_rollup=True, unit=unit
     )
-    # We are assuming that all meters have the same unit in the scope of the exercise.
-    consumption_unit = "kWh"
 
+
+def _property_spaces_batch_response(
+    request, property_space_ids: List[int], property_spaces: List[dict], fields: List[str] = None, unit: str = None
+) -> HttpResponse:
+    logger.info(f"Found {len(property_spaces)} of {len(set(property_space_ids))} property spaces")
+    with timed("aggregation"):
+        found = {
+            property_space["id"]: _generate_property_space_dict(property_space, fields, unit)
+            for property_space in property_spaces
+        }
+        data = {
+            "results": [
+                {
+                    "id": property_space_id,
+                    "found": property_space_id in found,
+                    "property_space": found.get(property_space_id),
+                }
+                for property_space_id in property_space_ids
+            ],
+        }
+    with timed("serialization"):
+        return api_v1.create_response(request, data, status=200)
+
+
+def _property_spaces_queryset(year: int, fields: List[str] = None, unit: str = None):
+    return _annotate_fields(PropertySpace.objects.all(), year, fields, unit=unit)
+
+
+def _property_spaces_response(
+    request,
+    property_spaces: List[dict],
+    next_cursor: str,
+    fields: List[str] = None,
+    unit: str = None,
+    envelope: bool = False,
+) -> HttpResponse:
+    logger.info(f"Found {len(property_spaces)} property spaces")
+    with timed("aggregation"):
+        data = [_generate_property_space_dict(property_space, fields, unit) for property_space in property_spaces]
+    if envelope:
+        data = {"property_spaces": data, "next_cursor": next_cursor}
+    with timed("serialization"):
+        response = api_v1.create_response(request, data, status=200)
+    # By default the body stays a plain list, the cursor of the next page is returned in a header.
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return response
+
+
+def _render_property_spaces(
+    request,
+    year: int,
+    limit: int,
+    cursor: str,
+    fields: List[str] = None,
+    unit: str = None,
+    envelope: bool = False,
+) -> HttpResponse:
+    """
+    Render a page of property spaces, called on a cache miss.
+
+    Args:
+        request (HttpRequest): The request.
+        year (int): The year to filter the MeterData on.
+        limit (int): The page size.
+        cursor (str): The cursor of the page.
+        fields (List[str]): The fields of the response, every field if None.
+        unit (str): The unit of the consumption, the default unit if None.
+        envelope (bool): Return the page in an object with its next cursor, rather than a plain list.
+    """
+    with timed("aggregation"):
+        property_spaces, next_cursor = paginate_by_id(_property_spaces_queryset(year, fields, unit), limit, cursor)
+    return _property_spaces_response(request, property_spaces, next_cursor, fields, unit, envelope)
+
+
+async def _arender_property_spaces(
+    request,
+    year: int,
+    limit: int,
+    cursor: str,
+    fields: List[str] = None,
+    unit: str = None,
+    envelope: bool = False,
+) -> HttpResponse:
+    """
+    Async version of `_render_property_spaces`.
+
+    Args:
+        request (HttpRequest): The request.
+        year (int): The year to filter the MeterData on.
+        limit (int): The page size.
+        cursor (str): The cursor of the page.
+        fields (List[str]): The fields of the response, every field if None.
+        unit (str): The unit of the consumption, the default unit if None.
+        envelope (bool): Return the page in an object with its next cursor, rather than a plain list.
+    """
+    with timed("aggregation"):
+        property_spaces, next_cursor = await apaginate_by_id(_property_spaces_queryset(year, fields, unit), limit, cursor)
+    return _property_spaces_response(request, property_spaces, next_cursor, fields, unit, envelope)
+
+
+def _stream_property_spaces_ndjson(year: int, batch_size: int, unit: str = None):
+    """
+    Yield every property space as a line of JSON.
+    The property spaces are fetched in keyset batches, so memory stays bounded
+    by the batch size whatever the size of the portfolio.
+
+    Args:
+        year (int): The year to filter the MeterData on.
+        batch_size (int): The number of property spaces fetched per query.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    queryset = _property_spaces_queryset(year, unit=unit)
+    cursor = None
+    while True:
+        property_spaces, cursor = paginate_by_id(queryset, batch_size, cursor)
+        for property_space in property_spaces:
+            # Compact separators and raw UTF-8, like the JSON serialization of pydantic.
+            record = _generate_property_space_dict(property_space, unit=unit)
+            yield json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+        if cursor is None:
+            break
+
+
+def _generate_property_space_dict(property_space: dict, fields: List[str] = None, unit: str = None) -> dict:
+    """
+    Generate a dictionary with the property space data, in the shape of `PropertySpaceOut`.
+    The dictionary only holds plain types, so it is rendered by the C JSON encoder
+    without validating a schema per row.
+
+    Args:
+        property_space (dict): The property space row, with the `PROPERTY_SPACE_FIELDS` values.
+        fields (List[str]): The fields to generate, every field if None.
+        unit (str): The unit the consumption was converted to, the default unit if None.
+    """
+    # The readings are converted to this unit by the aggregation query.
+    consumption_unit = unit or default_unit()
+    if fields is not None:
+        return _generate_property_space_fields(property_space, fields, consumption_unit)
+
+    # The keys follow the order of the schema fields and the values get the schema types,
+    # so the output is the same as the one of the schema.
     return {
-        "name": name,
-        "address": address,
-        "number_of_units": number_of_units,
-        "total_area": total_area,
-        "total_consumption": total_consumption,
+        "name": property_space["name"],
+        "address": _generate_address_dict(property_space),
+        "number_of_units": int(property_space["number_of_units"]),
+        "total_area": float(property_space["total_area"]),
+        "total_consumption": float(property_space["total_consumption"]),
         "consumption_unit": consumption_unit
     }
+
+
+def _generate_address_dict(property_space: dict) -> dict:
+    return {
+        "street": property_space["address__street"],
+        "city": property_space["address__city"],
+        "state": property_space["address__state"],
+        "country": property_space["address__country"],
+        "postal_code": property_space["address__postal_code"],
+    }
+
+
+def _generate_property_space_fields(property_space: dict, fields: List[str], consumption_unit: str) -> dict:
+    # The subset of `_generate_property_space_dict`, in the same order, for the `fields` parameter.
+    data = {}
+    if "name" in fields:
+        data["name"] = property_space["name"]
+    if "address" in fields:
+        data["address"] = _generate_address_dict(property_space)
+    if "number_of_units" in fields:
+        data["number_of_units"] = int(property_space["number_of_units"])
+    if "total_area" in fields:
+        data["total_area"] = float(property_space["total_area"])
+    if "total_consumption" in fields:
+        data["total_consumption"] = float(property_space["total_consumption"])
+    if "consumption_unit" in fields:
+        data["consumption_unit"] = consumption_unit
+    return data
@@ -1,7 +1,8 @@
 # Description: Schema for PropertySpace endpoints
 from ninja import Schema, ModelSchema, Field
 from api.models import PropertySpace
-from typing import Optional
+from datetime import datetime
+from typing import Dict, List, Literal, Optional, Union
 from typing_extensions import Annotated
 
 class AddressSchema(Schema):
@@ -26,3 +27,188 @@ class PropertySpaceOut(Schema):
 	total_area: float
 	total_consumption: float
 	consumption_unit: str
+
+class PropertySpaceFieldsOut(Schema):
+	"""
+	A property space restricted to the fields of the `fields` parameter, the others are left out.
+	"""
+	name: Optional[str] = None
+	address: Optional[AddressSchema] = None
+	number_of_units: Optional[int] = None
+	total_area: Optional[float] = None
+	total_consumption: Optional[float] = None
+	consumption_unit: Optional[str] = None
+
+class PropertySpacesPageOut(Schema):
+	# Returned by the list with `envelope=true`, the cursor is null on the last page.
+	property_spaces: List[Union[PropertySpaceOut, PropertySpaceFieldsOut]]
+	next_cursor: Optional[str] = None
+
+class PropertySpaceBatchItemOut(Schema):
+	"""
+	A property space requested by ID, `property_space` is None when it was not found.
+	"""
+	id: int
+	found: bool
+	property_space: Optional[Union[PropertySpaceOut, PropertySpaceFieldsOut]] = None
+
+class PropertySpacesBatchOut(Schema):
+	# In the order of the requested IDs.
+	results: List[PropertySpaceBatchItemOut]
+
+class MeterReadingIn(Schema):
+	meter_number: str = Field(min_length=1, max_length=128)
+	meter_provider_name: str = Field(max_length=128)
+	meter_source: str = Field(max_length=128)
+	measurement_reading: float
+	measurement_unit: str = 'kWh'
+	measurement_start_date: datetime
+	measurement_end_date: datetime
+	unit_space_ids: List[int] = []
+
+class MeterReadingsBulkIn(Schema):
+	readings: List[MeterReadingIn] = Field(max_length=10000)
+
+class MeterReadingError(Schema):
+	index: int
+	message: str
+
+class MeterReadingsBulkOut(Schema):
+	created: int
+	duplicates: int
+	errors: List[MeterReadingError]
+
+class CacheStatsOut(Schema):
+	hits: int
+	misses: int
+	hit_ratio: float
+	timeout: int
+
+
+class ConsumptionBucketOut(Schema):
+	period: str
+	start: datetime
+	end: datetime
+	total_consumption: float
+
+class ConsumptionSeriesOut(Schema):
+	property_space_id: int
+	granularity: str
+	prorated: bool
+	consumption_unit: str
+	buckets: List[ConsumptionBucketOut]
+
+class PortfolioGroupOut(Schema):
+	group: Dict[str, str]
+	property_count: int
+	unit_count: int
+	total_area: float
+	total_consumption: float
+	intensity: Optional[float]
+
+class PortfolioGroupsOut(Schema):
+	group_by: str
+	year: Optional[int]
+	consumption_unit: str
+	groups: List[PortfolioGroupOut]
+
+class PortfolioTotalsOut(Schema):
+	year: Optional[int]
+	consumption_unit: str
+	property_count: int
+	number_of_units: int
+	total_area: float
+	total_consumption: float
+	# "columnar" when served by the in-memory snapshot, "database" otherwise.
+	source: str
+
+class IntensityRankingItemOut(Schema):
+	rank: int
+	id: int
+	name: str
+	city: str
+	state: str
+	country: str
+	total_area: float
+	total_consumption: float
+	intensity: float
+
+class IntensityRankingOut(Schema):
+	year: Optional[int]
+	consumption_unit: str
+	property_spaces: List[IntensityRankingItemOut]
+
+class UnitSpaceImportIn(Schema):
+	external_id: Optional[str] = Field(None, min_length=1, max_length=128)
+	name: str = Field(min_length=1, max_length=128)
+	unit_type: Literal['COMMON_AREA', 'VACANT', 'LEASED'] = 'COMMON_AREA'
+	area: float = Field(ge=0)
+
+class PropertySpaceImportIn(Schema):
+	external_id: str = Field(min_length=1, max_length=128)
+	name: str = Field(min_length=2, max_length=128)
+	address: AddressSchema
+	units: List[UnitSpaceImportIn] = []
+
+class PropertySpacesImportIn(Schema):
+	properties: List[PropertySpaceImportIn] = Field(max_length=10000)
+	upsert: bool = False
+
+class PropertySpacesImportOut(Schema):
+	created: int
+	updated: int
+	units_created: int
+	units_updated: int
+	property_spaces: Dict[str, int]
+	unit_spaces: Dict[str, Dict[str, int]]
+
+class PropertySpacesDeleteIn(Schema):
+	ids: List[int] = Field(min_length=1, max_length=10000)
+
+class PropertySpacesDeleteOut(Schema):
+	deleted: int
+	unit_spaces: int
+	meters: int
+	addresses: int
+	not_found: List[int]
+
+class PropertySpaceChangeOut(Schema):
+	"""
+	A change of the change feed: the property space as it is now, or a tombstone when it was deleted.
+	"""
+	id: int
+	change_seq: int
+	updated_at: datetime
+	deleted: bool
+	property_space: Optional[PropertySpaceOut] = None
+
+class PropertySpaceChangesOut(Schema):
+	changes: List[PropertySpaceChangeOut]
+	next_cursor: str
+	has_more: bool
+
+class RebuildRollupsJobIn(Schema):
+	batch_size: Optional[int] = Field(None, ge=1, le=10000)
+
+class PortfolioReportJobIn(Schema):
+	start_year: int
+	end_year: int
+	group_by: Literal['city', 'state', 'country', 'unit_type'] = 'city'
+	unit: Optional[str] = None
+	format: Literal['json', 'csv'] = 'json'
+
+class JobOut(Schema):
+	id: int
+	kind: str
+	# "queued", "running", "succeeded", "failed" or "cancelled".
+	status: str
+	params: dict
+	attempts: int
+	max_attempts: int
+	progress: Optional[float]
+	error: str
+	cancel_requested: bool
+	created_at: datetime
+	run_after: datetime
+	started_at: Optional[datetime]
+	finished_at: Optional[datetime]
@@ -4,3 +4,20 @@ class ServiceUnavailableException(Exception):
 	def __init__(self, message):
 		self.message = message
 		super().__init__(self.message)
+
+class BadRequestException(Exception):
+	def __init__(self, message):
+		self.message = message
+		super().__init__(self.message)
+
+class ConflictException(Exception):
+	def __init__(self, message):
+		self.message = message
+		super().__init__(self.message)
+
+class RateLimitExceededException(Exception):
+	def __init__(self, message, retry_after):
+		self.message = message
+		# Seconds until the client can retry.
+		self.retry_after = retry_after
+		super().__init__(self.message)
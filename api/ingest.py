@@ -0,0 +1,190 @@
+# Description: Batched ingestion of meter readings.
+# Readings are written with multi-row INSERT statements, their unit space links with a
+# bulk insert into the many-to-many through table, one transaction per batch. Readings
+# are deduplicated on (meter_number, measurement_start_date, measurement_end_date) by the
+# unique constraint itself, with ON CONFLICT DO NOTHING, so a retried batch is a no-op
+# even when the retries run concurrently, and only the readings actually inserted are
+# linked and added to the rollups. The statements are written directly rather than with
+# `bulk_create`, which cannot return the inserted rows with ON CONFLICT and spends most
+# of the ingestion time preparing the values one by one.
+# Invalid rows are reported without failing the batch.
+
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, List, Tuple
+from django.db import connections, router, transaction
+from django.utils import timezone
+from api.models import MeterData, MeterDataUnitSpace, UnitSpace
+from api.rollups import add_new_meters_to_rollups
+from api.shares import set_new_meter_share
+from api.signals import notify_property_spaces_changed
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = 1000
+
+MEASUREMENT_UNITS = {unit for unit, _ in MeterData.UNIT_CHOICES}
+
+# The MeterData fields written by the ingestion, and the unique key of a reading.
+METER_FIELDS = [
+    "meter_number", "meter_provider_name", "meter_source", "measurement_reading", "measurement_unit",
+    "measurement_start_date", "measurement_end_date", "share_count", "share_reading", "updated_at",
+]
+READING_KEY = ["meter_number", "measurement_start_date", "measurement_end_date"]
+
+
+class NewReading:
+    """
+    A reading to insert, with the MeterData attributes read by the rollups and the shares.
+    Lighter than a model instance, which costs more to build than the INSERT of its row.
+    """
+    __slots__ = ["pk", *METER_FIELDS]
+
+    def __init__(self, **fields):
+        self.pk = None
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+def _aware(value):
+    if timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+def ingest_meter_readings(readings: Iterable[dict], batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """
+    Insert a batch of meter readings and their unit space links.
+    Returns the number of created readings, the number of skipped duplicates
+    and the list of per-row errors, with the row index in the batch.
+
+    Args:
+        readings (Iterable[dict]): The readings, with the MeterData fields and `unit_space_ids`.
+        batch_size (int): The number of rows per INSERT statement.
+    """
+    readings = list(readings)
+    errors = []
+
+    requested_unit_ids = {unit_id for reading in readings for unit_id in reading.get("unit_space_ids", [])}
+    unit_property_space_ids = dict(
+        UnitSpace.objects.filter(id__in=requested_unit_ids).values_list("id", "property_space_id")
+    )
+
+    meters: List[NewReading] = []
+    meter_unit_ids: List[set] = []
+    batch_keys = set()
+    duplicates = 0
+    for index, reading in enumerate(readings):
+        unit_space_ids = set(reading.get("unit_space_ids", []))
+        start = _aware(reading["measurement_start_date"])
+        end = _aware(reading["measurement_end_date"])
+        # Not `unit_space_ids - keys()`, which iterates over every key of the batch for each row.
+        unknown_unit_ids = {unit_id for unit_id in unit_space_ids if unit_id not in unit_property_space_ids}
+        if unknown_unit_ids:
+            errors.append({"index": index, "message": f"Unit spaces not found: {sorted(unknown_unit_ids)}"})
+            continue
+        measurement_unit = reading.get("measurement_unit", "kWh")
+        if measurement_unit not in MEASUREMENT_UNITS:
+            errors.append({"index": index, "message": f"Invalid measurement unit: {measurement_unit}"})
+            continue
+        if end < start:
+            errors.append({"index": index, "message": "measurement_end_date is before measurement_start_date"})
+            continue
+        # The readings already stored are skipped by the INSERT, the repeated ones of the batch here.
+        key = (reading["meter_number"], start, end)
+        if key in batch_keys:
+            duplicates += 1
+            continue
+        batch_keys.add(key)
+        meters.append(NewReading(
+            meter_number=reading["meter_number"],
+            meter_provider_name=reading["meter_provider_name"],
+            meter_source=reading["meter_source"],
+            measurement_reading=reading["measurement_reading"],
+            measurement_unit=measurement_unit,
+            measurement_start_date=start,
+            measurement_end_date=end,
+        ))
+        set_new_meter_share(meters[-1], len(unit_space_ids))
+        meter_unit_ids.append(unit_space_ids)
+
+    using = router.db_for_write(MeterData)
+    with transaction.atomic(using=using):
+        inserted = _insert_new_meters(connections[using], meters, batch_size)
+        duplicates += len(meters) - len(inserted)
+        meter_unit_ids = [unit_ids for meter, unit_ids in zip(meters, meter_unit_ids) if meter.pk is not None]
+        _insert_links(connections[using], inserted, meter_unit_ids, batch_size)
+        # The rows are inserted without the model signals, the stored aggregates are updated explicitly.
+        property_space_ids, years = add_new_meters_to_rollups(inserted, [
+            [unit_property_space_ids[unit_id] for unit_id in unit_ids]
+            for unit_ids in meter_unit_ids
+        ])
+        notify_property_spaces_changed(property_space_ids, years, rollups_updated=True)
+
+    logger.info(f"Ingested {len(inserted)} meter readings, {duplicates} duplicates, {len(errors)} errors")
+    return {"created": len(inserted), "duplicates": duplicates, "errors": errors}
+
+
+def _returned_datetime(value) -> datetime:
+    # SQLite returns the stored UTC datetimes naive, PostgreSQL returns them aware.
+    return value if timezone.is_aware(value) else timezone.make_aware(value, dt_timezone.utc)
+
+
+def _insert_new_meters(connection, meters: List[NewReading], batch_size: int) -> List[NewReading]:
+    """
+    Insert the readings with INSERT ... ON CONFLICT DO NOTHING on their unique key, and set
+    the primary key of the inserted ones. Returns the inserted readings, the others already
+    existed, e.g. stored by a concurrent retry of the batch.
+
+    Args:
+        connection: The connection of the database written to.
+        meters (List[NewReading]): The readings to insert, without repeated keys.
+        batch_size (int): The number of rows per INSERT statement.
+    """
+    ops = connection.ops
+    fields = [MeterData._meta.get_field(name) for name in METER_FIELDS]
+    table = ops.quote_name(MeterData._meta.db_table)
+    columns = ", ".join(ops.quote_name(field.column) for field in fields)
+    key = ", ".join(ops.quote_name(MeterData._meta.get_field(name).column) for name in READING_KEY)
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    updated_at = ops.adapt_datetimefield_value(timezone.now())
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(meters), batch_size):
+            by_key: Dict[Tuple, NewReading] = {}
+            params = []
+            for meter in meters[start:start + batch_size]:
+                by_key[(meter.meter_number, meter.measurement_start_date, meter.measurement_end_date)] = meter
+                params += [
+                    meter.meter_number, meter.meter_provider_name, meter.meter_source,
+                    meter.measurement_reading, meter.measurement_unit,
+                    ops.adapt_datetimefield_value(meter.measurement_start_date),
+                    ops.adapt_datetimefield_value(meter.measurement_end_date),
+                    meter.share_count, meter.share_reading, updated_at,
+                ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row] * len(by_key))} "
+                f"ON CONFLICT ({key}) DO NOTHING RETURNING {ops.quote_name('id')}, {key}",
+                params,
+            )
+            for meter_id, meter_number, start_date, end_date in cursor.fetchall():
+                by_key[(meter_number, _returned_datetime(start_date), _returned_datetime(end_date))].pk = meter_id
+    return [meter for meter in meters if meter.pk is not None]
+
+
+def _insert_links(connection, meters: List[NewReading], meter_unit_ids: List[set], batch_size: int) -> None:
+    # The links of new readings, which cannot conflict with existing ones.
+    links = [(meter.pk, unit_id) for meter, unit_ids in zip(meters, meter_unit_ids) for unit_id in unit_ids]
+    ops = connection.ops
+    table = ops.quote_name(MeterDataUnitSpace._meta.db_table)
+    columns = ", ".join(
+        ops.quote_name(MeterDataUnitSpace._meta.get_field(name).column) for name in ("meterdata", "unitspace")
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(links), batch_size):
+            batch = links[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join(['(%s, %s)'] * len(batch))}",
+                [value for link in batch for value in link],
+            )
@@ -0,0 +1,384 @@
+# Description: Background jobs, stored in the Job table and run by the `run_jobs` worker command.
+# A request submits a job and gets its ID back. The workers poll the table, there is no
+# broker: a job is claimed with a conditional update, so two workers never run the same
+# job, and it runs on the thread pool of the worker. Its result is stored with the job.
+# A failed job is retried with an exponential backoff, up to its `max_attempts`. A queued
+# job is cancelled at once, a running one stops at the next checkpoint of its handler.
+# The worker sends the heartbeats of its running jobs and relays their cancellation from
+# its own thread, and so its own connection: a handler inside a long transaction (like
+# the rollup rebuild) is still seen alive and can still be cancelled, which rolls it back.
+# The `attempts` count set by a claim identifies the run: a run queued again as stale, e.g.
+# while its heartbeats failed on a locked database, still stores its outcome unless another
+# run claimed the job since, which then owns it.
+
+import csv
+import io
+import json
+import os
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from api.analytics import portfolio_groups, portfolio_totals
+from api.exceptions import BadRequestException, ConflictException
+from api.models import Job
+from api.rollups import REBUILD_BATCH_SIZE, rebuild_rollups
+from api.units import resolve_unit
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# The queued jobs tried per claim, a job claimed by another worker in between is skipped.
+CLAIM_CANDIDATES = 10
+
+# The longest range of years of a portfolio report.
+REPORT_YEARS_MAX = 50
+
+STALE_ERROR = "The worker stopped responding"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobResult(NamedTuple):
+    content: str
+    content_type: str = "application/json"
+    filename: str = "result.json"
+
+
+class JobContext:
+    """
+    Passed to the handler of a running job, to report its progress and stop it once cancelled.
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+        self.progress: Optional[float] = job.progress
+        self._cancelled = threading.Event()
+        if job.cancel_requested:
+            self._cancelled.set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def checkpoint(self, progress: float = None) -> None:
+        """
+        Record the progress of the job, and raise JobCancelled if it was cancelled.
+        Handlers call it between batches of work.
+
+        Args:
+            progress (float): The fraction of the work done, between 0 and 1.
+        """
+        if progress is not None:
+            self.progress = progress
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Job {self.job.pk} was cancelled")
+
+
+JobHandler = Callable[[JobContext, dict], JobResult]
+
+# The handler of each kind of job, called with the context and the params of the job.
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """
+    Register the decorated function as the handler of a kind of job.
+
+    Args:
+        kind (str): The kind of job.
+    """
+    def register(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def submit_job(kind: str, params: dict = None, max_attempts: int = None) -> Job:
+    """
+    Queue a job, the workers run it as soon as one is free.
+
+    Args:
+        kind (str): The kind of job.
+        params (dict): The params passed to the handler, JSON serializable.
+        max_attempts (int): The number of runs before the job fails, JOB_MAX_ATTEMPTS if None.
+    """
+    if kind not in JOB_HANDLERS:
+        raise BadRequestException(f"Invalid job kind: {kind}. Available kinds: {', '.join(JOB_HANDLERS)}")
+    job = Job.objects.create(
+        kind=kind,
+        params=params or {},
+        max_attempts=max_attempts or getattr(settings, "JOB_MAX_ATTEMPTS", 3),
+    )
+    logger.info(f"Submitted job {job.pk}: {kind}")
+    return job
+
+
+def cancel_job(job: Job) -> Job:
+    """
+    Cancel a job. A queued job is cancelled at once, a running job when its handler
+    reaches its next checkpoint. Raises ConflictException if the job already finished.
+
+    Args:
+        job (Job): The job to cancel.
+    """
+    cancelled = (
+        Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.CANCELLED, cancel_requested=True, finished_at=timezone.now()
+        )
+        or Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(cancel_requested=True)
+    )
+    job.refresh_from_db()
+    if not cancelled:
+        raise ConflictException(f"Job {job.pk} already {job.status}")
+    logger.info(f"Cancelling job {job.pk}, now {job.status}")
+    return job
+
+
+def claim_job(worker: str) -> Optional[Job]:
+    """
+    Claim the next queued job due to run, skipping the kinds at their JOB_CONCURRENCY_LIMITS.
+    Returns None when there is no job to run.
+    The limits are checked before the claim: workers claiming at the same moment may exceed
+    them, a single worker never does.
+
+    Args:
+        worker (str): The name of the claiming worker.
+    """
+    limits = getattr(settings, "JOB_CONCURRENCY_LIMITS", {})
+    running = dict(Job.objects.filter(status=Job.RUNNING).values_list("kind").annotate(Count("id")))
+    at_limit = [kind for kind, limit in limits.items() if running.get(kind, 0) >= limit]
+    now = timezone.now()
+    candidates = list(
+        Job.objects
+        .filter(status=Job.QUEUED, run_after__lte=now)
+        .exclude(kind__in=at_limit)
+        .order_by("run_after", "id")
+        .values_list("id", flat=True)[:CLAIM_CANDIDATES]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            attempts=F("attempts") + 1,
+            worker=worker,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def _current_run(job: Job):
+    # The job, unless it was claimed again or cancelled since this run started. Queued again
+    # or failed as stale, it is still the job of this run until another run claims it.
+    return Job.objects.filter(
+        Q(status__in=[Job.RUNNING, Job.QUEUED]) | Q(status=Job.FAILED, error=STALE_ERROR),
+        pk=job.pk,
+        attempts=job.attempts,
+    )
+
+
+def _finish(job: Job, status: str, **fields) -> None:
+    _current_run(job).update(status=status, finished_at=timezone.now(), **fields)
+
+
+def run_job(context: JobContext) -> Job:
+    """
+    Run a claimed job in the current thread and store its outcome.
+    A failed job is queued again after the backoff if attempts are left, except when its
+    params are invalid (BadRequestException), which no retry fixes.
+
+    Args:
+        context (JobContext): The context of the claimed job.
+    """
+    job = context.job
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise BadRequestException(f"Invalid job kind: {job.kind}")
+        context.checkpoint()
+        result = handler(context, job.params)
+    except JobCancelled:
+        logger.info(f"Job {job.pk} ({job.kind}) cancelled")
+        _finish(job, Job.CANCELLED, progress=context.progress)
+    except Exception as exc:
+        error = getattr(exc, "message", None) or f"{type(exc).__name__}: {exc}"
+        if job.attempts < job.max_attempts and not isinstance(exc, BadRequestException):
+            backoff = getattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 30) * 2 ** (job.attempts - 1)
+            logger.exception(f"Job {job.pk} ({job.kind}) failed, retrying in {backoff} seconds")
+            _current_run(job).update(
+                status=Job.QUEUED,
+                run_after=timezone.now() + timedelta(seconds=backoff),
+                heartbeat_at=None,
+                error=error,
+            )
+        else:
+            logger.exception(f"Job {job.pk} ({job.kind}) failed after {job.attempts} attempts")
+            _finish(job, Job.FAILED, error=error)
+    else:
+        logger.info(f"Job {job.pk} ({job.kind}) succeeded")
+        _finish(
+            job,
+            Job.SUCCEEDED,
+            progress=1.0,
+            error="",
+            result=result.content,
+            result_content_type=result.content_type,
+            result_filename=result.filename,
+        )
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale_jobs() -> int:
+    """
+    Queue again the running jobs without a heartbeat for JOB_STALE_SECONDS, their worker
+    stopped. They fail once out of attempts, and the cancelled ones are marked so.
+    Returns the number of stale jobs.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=getattr(settings, "JOB_STALE_SECONDS", 60)),
+    )
+    count = stale.filter(cancel_requested=True).update(status=Job.CANCELLED, finished_at=now)
+    count += stale.filter(attempts__lt=F("max_attempts")).update(
+        status=Job.QUEUED, run_after=now, heartbeat_at=None, error=STALE_ERROR
+    )
+    count += stale.update(status=Job.FAILED, finished_at=now, error=STALE_ERROR)
+    if count:
+        logger.warning(f"Found {count} stale jobs")
+    return count
+
+
+class JobWorker:
+    """
+    Claims the queued jobs and runs them on a thread pool, see the `run_jobs` command.
+    """
+
+    def __init__(self, threads: int = None, poll_interval: float = None, name: str = None):
+        self.threads = threads or getattr(settings, "JOB_WORKER_THREADS", 4)
+        self.poll_interval = getattr(settings, "JOB_POLL_SECONDS", 1) if poll_interval is None else poll_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        """
+        Stop claiming jobs, `run` returns once the running ones finish.
+        """
+        self._stopped.set()
+
+    def run(self, once: bool = False) -> int:
+        """
+        Run the jobs until `stop` is called. Returns the number of jobs run.
+
+        Args:
+            once (bool): Return as soon as no job is running or due to run.
+        """
+        ran = 0
+        running: Dict[Future, JobContext] = {}
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job") as pool:
+            while True:
+                try:
+                    # Raised by a failed heartbeat, the stale jobs are not requeued: the jobs of this
+                    # worker would look stale too. They are once the heartbeats go through again.
+                    self._heartbeat(running.values())
+                    requeue_stale_jobs()
+                    while not self._stopped.is_set() and len(running) < self.threads:
+                        job = claim_job(self.name)
+                        if job is None:
+                            break
+                        context = JobContext(job)
+                        running[pool.submit(self._run, context)] = context
+                        ran += 1
+                except DatabaseError as exc:
+                    # E.g. SQLite locked by the transaction of a job, tried again at the next poll.
+                    logger.warning(f"Job worker {self.name} could not poll the jobs: {exc}")
+                if not running:
+                    if once or self._stopped.is_set():
+                        return ran
+                    self._stopped.wait(self.poll_interval)
+                    continue
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+
+    def _run(self, context: JobContext) -> Job:
+        try:
+            return run_job(context)
+        except Exception:
+            # The outcome could not be stored, the job is queued again once stale.
+            logger.exception(f"Job worker {self.name} could not run job {context.job.pk}")
+        finally:
+            # The connections of the pool thread, the next job of the thread opens new ones.
+            connections.close_all()
+
+    def _heartbeat(self, contexts: Iterable[JobContext]) -> None:
+        contexts = {context.job.pk: context for context in contexts}
+        if not contexts:
+            return
+        now = timezone.now()
+        for job_id, context in contexts.items():
+            Job.objects.filter(pk=job_id, status=Job.RUNNING, attempts=context.job.attempts).update(
+                heartbeat_at=now, progress=context.progress
+            )
+        for job_id in Job.objects.filter(pk__in=contexts, cancel_requested=True).values_list("id", flat=True):
+            contexts[job_id].cancel()
+
+
+@job_handler("rebuild_rollups")
+def _rebuild_rollups_job(context: JobContext, params: dict) -> JobResult:
+    count = rebuild_rollups(
+        batch_size=params.get("batch_size") or REBUILD_BATCH_SIZE,
+        progress=lambda done, total: context.checkpoint(done / total),
+    )
+    return JobResult(json.dumps({"rollup_rows": count}), filename="rebuild-rollups.json")
+
+
+@job_handler("portfolio_report")
+def _portfolio_report_job(context: JobContext, params: dict) -> JobResult:
+    unit = resolve_unit(params.get("unit"))
+    group_by = params.get("group_by", "city")
+    years = range(params["start_year"], params["end_year"] + 1)
+    report = []
+    for position, year in enumerate(years):
+        totals = portfolio_totals(year, unit)
+        totals.pop("source")
+        report.append({"year": year, "totals": totals, "groups": portfolio_groups(group_by, year, unit)})
+        context.checkpoint((position + 1) / len(years))
+
+    if params.get("format") == "csv":
+        return JobResult(_portfolio_report_csv(report), "text/csv", "portfolio-report.csv")
+    content = json.dumps({
+        "group_by": group_by,
+        "consumption_unit": unit,
+        "start_year": years.start,
+        "end_year": years.stop - 1,
+        "years": report,
+    })
+    return JobResult(content, filename="portfolio-report.json")
+
+
+def _portfolio_report_csv(report: list) -> str:
+    # One row per year and group, the group columns depend on `group_by`.
+    group_columns = next((list(group["group"]) for year in report for group in year["groups"]), [])
+    metrics = ["property_count", "unit_count", "total_area", "total_consumption", "intensity"]
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["year", *group_columns, *metrics])
+    for year in report:
+        for group in year["groups"]:
+            writer.writerow([
+                year["year"],
+                *(group["group"][column] for column in group_columns),
+                *("" if group[metric] is None else group[metric] for metric in metrics),
+            ])
+    return output.getvalue()
@@ -0,0 +1,71 @@
+# Description: Run the endpoint benchmark suite in a test database and write a JSON report.
+
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from api.benchmarks import BENCHMARK_ITERATIONS, BENCHMARK_SIZES, compare_reports, run_endpoint_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every api_v1 endpoint on synthetic datasets, in a test database, "
+        "and optionally compare the report with a previous one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=BENCHMARK_SIZES,
+            help="Numbers of meter readings of the datasets.",
+        )
+        parser.add_argument("--iterations", type=int, default=BENCHMARK_ITERATIONS, help="Measured calls per endpoint.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the dataset generator.")
+        parser.add_argument("--endpoints", nargs="+", help="Only run these endpoints.")
+        parser.add_argument("--output", default="benchmark-report.json", help="Path of the JSON report.")
+        parser.add_argument("--compare", help="Previous report to compare with. Regressions fail the command.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Accepted relative increase of the latency and memory when comparing.",
+        )
+
+    def handle(self, *args, **options):
+        if not os.getenv("AUTH_TOKEN"):
+            raise CommandError("AUTH_TOKEN must be set")
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read the report {options['compare']}: {error}")
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            report = run_endpoint_benchmarks(
+                sizes=options["sizes"],
+                iterations=options["iterations"],
+                seed=options["seed"],
+                endpoints=options["endpoints"],
+                progress=self.stdout.write,
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        with open(options["output"], "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if baseline is not None:
+            regressions = compare_reports(baseline, report, options["tolerance"])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions compared with {options['compare']}")
+            self.stdout.write(self.style.SUCCESS(f"No regression compared with {options['compare']}"))
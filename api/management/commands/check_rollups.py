@@ -0,0 +1,27 @@
+# Description: Compare the PropertySpaceYearlyRollup table with the live computation.
+
+from django.core.management.base import BaseCommand, CommandError
+from api.rollups import check_rollup_consistency
+
+
+class Command(BaseCommand):
+    help = "Check the yearly consumption rollup table against the meter history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "property_space_ids",
+            nargs="*",
+            type=int,
+            help="Property spaces to check, all of them if omitted.",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = check_rollup_consistency(options["property_space_ids"] or None)
+        for mismatch in mismatches:
+            self.stdout.write(
+                f"property space {mismatch['property_space_id']}, year {mismatch['year']}, "
+                f"{mismatch['measurement_unit']}: expected {mismatch['expected']}, stored {mismatch['stored']}"
+            )
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} inconsistent rollup rows, run rebuild_rollups to fix them")
+        self.stdout.write(self.style.SUCCESS("Rollup table is consistent"))
@@ -0,0 +1,28 @@
+# Description: Create an API key and print it. Only its hash is stored, it cannot be shown again.
+
+from django.core.management.base import BaseCommand
+from api.auth import create_api_key
+
+
+class Command(BaseCommand):
+    help = "Create an API key for a client."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", help="Name of the client.")
+        parser.add_argument(
+            "--rate-limit",
+            type=int,
+            default=None,
+            help="Requests per minute, API_RATE_LIMIT_PER_MINUTE by default.",
+        )
+        parser.add_argument(
+            "--burst",
+            type=int,
+            default=None,
+            help="Requests allowed at once, API_RATE_LIMIT_BURST by default.",
+        )
+
+    def handle(self, *args, **options):
+        api_key, key = create_api_key(options["name"], options["rate_limit"], options["burst"])
+        self.stdout.write(self.style.SUCCESS(f"Created API key {api_key.id} for {api_key.name}"))
+        self.stdout.write(key)
@@ -0,0 +1,53 @@
+# Description: Generate a deterministic synthetic dataset for load testing.
+
+from django.core.management.base import BaseCommand, CommandError
+from api.synthetic import GENERATE_BATCH_SIZE, generate_synthetic_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Create property spaces, unit spaces and meter readings with seeded random values. "
+        "Run it with another seed to add more data to the same database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--properties", type=int, default=1000, help="Number of property spaces.")
+        parser.add_argument("--units-per-property", type=int, default=4, help="Number of unit spaces per property space.")
+        parser.add_argument("--readings", type=int, default=100000, help="Number of meter readings.")
+        parser.add_argument(
+            "--shared-fraction",
+            type=float,
+            default=0.1,
+            help="Fraction of the readings shared between 2 or 3 unit spaces.",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+        parser.add_argument("--start-year", type=int, default=2020, help="First year of the readings.")
+        parser.add_argument("--years", type=int, default=5, help="Number of years the readings are spread over.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=GENERATE_BATCH_SIZE,
+            help="Number of readings written per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options["shared_fraction"] <= 1:
+            raise CommandError("--shared-fraction must be between 0 and 1")
+        if options["properties"] < 1 or options["units_per_property"] < 1 or options["years"] < 1:
+            raise CommandError("--properties, --units-per-property and --years must be positive")
+
+        counts = generate_synthetic_data(
+            properties=options["properties"],
+            units_per_property=options["units_per_property"],
+            readings=options["readings"],
+            shared_fraction=options["shared_fraction"],
+            seed=options["seed"],
+            start_year=options["start_year"],
+            years=options["years"],
+            batch_size=options["batch_size"],
+            progress=lambda done: self.stdout.write(f"{done} readings"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['property_spaces']} property spaces, {counts['unit_spaces']} unit spaces, "
+            f"{counts['meter_readings']} readings and {counts['meter_links']} meter links"
+        ))
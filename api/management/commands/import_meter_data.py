@@ -0,0 +1,178 @@
+# Description: Stream CSV files of meter readings into the database.
+#
+# Expected columns: meter_number, meter_provider_name, meter_source, measurement_reading,
+# measurement_unit, measurement_start_date, measurement_end_date, unit_space_ids
+# (`unit_space_ids` is a list of UnitSpace ids separated by ";").
+
+import csv
+import json
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from api.ingest import ingest_meter_readings
+from api.models import MeterData, MeterDataUnitSpace
+
+
+def _deferrable_indexes():
+    """
+    Return the secondary indexes that can be dropped during a load, as (model, index) pairs.
+    Unique constraints are kept since the deduplication relies on them.
+    """
+    return [(model, index) for model in [MeterData, MeterDataUnitSpace] for index in model._meta.indexes]
+
+
+def _existing_index_names(models) -> set:
+    """
+    Return the names of the indexes and constraints present in the database on the tables of the models.
+    An interrupted load leaves its indexes dropped: the drop and the rebuild only touch what is there.
+
+    Args:
+        models (Iterable): The models whose tables are introspected.
+    """
+    with connection.cursor() as cursor:
+        return {
+            name
+            for table in {model._meta.db_table for model in models}
+            for name in connection.introspection.get_constraints(cursor, table)
+        }
+
+
+def _parse_row(row: dict) -> dict:
+    start = parse_datetime(row["measurement_start_date"])
+    end = parse_datetime(row["measurement_end_date"])
+    if start is None or end is None:
+        raise ValueError("invalid measurement date")
+    return {
+        "meter_number": row["meter_number"],
+        "meter_provider_name": row["meter_provider_name"],
+        "meter_source": row["meter_source"],
+        "measurement_reading": float(row["measurement_reading"]),
+        "measurement_unit": row.get("measurement_unit") or "kWh",
+        "measurement_start_date": start,
+        "measurement_end_date": end,
+        "unit_space_ids": [int(unit_id) for unit_id in (row.get("unit_space_ids") or "").split(";") if unit_id],
+    }
+
+
+class Command(BaseCommand):
+    help = "Import meter readings and their unit space links from CSV files, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="CSV files to import, one at a time.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of rows written per transaction.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Checkpoint file recording the progress. An interrupted import resumes from it.",
+        )
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help="Drop the secondary indexes of the meter data tables during the load and rebuild them afterward.",
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.checkpoint_path = options["checkpoint"]
+        checkpoint = self._read_checkpoint()
+
+        indexes = _deferrable_indexes() if options["defer_indexes"] else []
+        if indexes:
+            existing = _existing_index_names(model for model, _ in indexes)
+            dropped = [(model, index) for model, index in indexes if index.name in existing]
+            self.stdout.write(f"Dropping {len(dropped)} indexes")
+            with connection.schema_editor() as schema_editor:
+                for model, index in dropped:
+                    schema_editor.remove_index(model, index)
+        try:
+            totals = {"created": 0, "duplicates": 0, "errors": 0}
+            for path in options["files"]:
+                path = os.path.abspath(path)
+                if path in checkpoint["completed"]:
+                    self.stdout.write(f"{path}: already imported, skipping")
+                    continue
+                skip_rows = checkpoint["rows"] if checkpoint["current"] == path else 0
+                self._import_file(path, skip_rows, checkpoint, totals)
+                checkpoint["completed"].append(path)
+                checkpoint["current"], checkpoint["rows"] = None, 0
+                self._write_checkpoint(checkpoint)
+        finally:
+            if indexes:
+                # Including the indexes a previous interrupted run dropped and did not rebuild.
+                existing = _existing_index_names(model for model, _ in indexes)
+                missing = [(model, index) for model, index in indexes if index.name not in existing]
+                self.stdout.write(f"Rebuilding {len(missing)} indexes")
+                with connection.schema_editor() as schema_editor:
+                    for model, index in missing:
+                        schema_editor.add_index(model, index)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['created']} readings, "
+            f"{totals['duplicates']} duplicates, {totals['errors']} errors"
+        ))
+
+    def _import_file(self, path: str, skip_rows: int, checkpoint: dict, totals: dict):
+        if skip_rows:
+            self.stdout.write(f"{path}: resuming after row {skip_rows}")
+        started = time.perf_counter()
+        batch, line_numbers = [], []
+        row_number = skip_rows
+
+        with open(path, newline="") as csv_file:
+            for row_number, row in enumerate(csv.DictReader(csv_file), start=1):
+                if row_number <= skip_rows:
+                    continue
+                try:
+                    batch.append(_parse_row(row))
+                    line_numbers.append(row_number)
+                except (KeyError, TypeError, ValueError) as error:
+                    totals["errors"] += 1
+                    self.stderr.write(f"{path}, row {row_number}: {error}")
+                if (row_number - skip_rows) % self.batch_size == 0:
+                    self._write_batch(path, batch, line_numbers, totals)
+                    batch, line_numbers = [], []
+                    self._save_progress(path, row_number, skip_rows, started, checkpoint)
+
+        self._write_batch(path, batch, line_numbers, totals)
+        self._save_progress(path, row_number, skip_rows, started, checkpoint)
+
+    def _write_batch(self, path: str, batch: list, line_numbers: list, totals: dict):
+        if not batch:
+            return
+        result = ingest_meter_readings(batch)
+        totals["created"] += result["created"]
+        totals["duplicates"] += result["duplicates"]
+        totals["errors"] += len(result["errors"])
+        for error in result["errors"]:
+            self.stderr.write(f"{path}, row {line_numbers[error['index']]}: {error['message']}")
+
+    def _save_progress(self, path: str, rows_done: int, skip_rows: int, started: float, checkpoint: dict):
+        checkpoint["current"], checkpoint["rows"] = path, rows_done
+        self._write_checkpoint(checkpoint)
+        elapsed = time.perf_counter() - started
+        rate = (rows_done - skip_rows) / elapsed if elapsed else 0
+        self.stdout.write(f"{path}: {rows_done} rows, {rate:.0f} rows/s")
+
+    def _read_checkpoint(self) -> dict:
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path) as checkpoint_file:
+                    return json.load(checkpoint_file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read the checkpoint {self.checkpoint_path}: {error}")
+        return {"completed": [], "current": None, "rows": 0}
+
+    def _write_checkpoint(self, checkpoint: dict):
+        if not self.checkpoint_path:
+            return
+        # Write then rename, so that an interruption never leaves a truncated checkpoint.
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temporary_path, self.checkpoint_path)
@@ -0,0 +1,30 @@
+# Description: Rebuild the PropertySpaceYearlyRollup table from the meter history.
+
+from django.core.management.base import BaseCommand
+from api.jobs import submit_job
+from api.rollups import REBUILD_BATCH_SIZE, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the yearly consumption rollup table from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REBUILD_BATCH_SIZE,
+            help="Number of property spaces recomputed per query.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the rebuild as a background job, run by `run_jobs`, instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = submit_job("rebuild_rollups", {"batch_size": options["batch_size"]})
+            self.stdout.write(self.style.SUCCESS(f"Queued the rebuild as job {job.pk}"))
+            return
+        count = rebuild_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup rows"))
@@ -0,0 +1,47 @@
+# Description: Run the queued background jobs (see `api.jobs`).
+
+import signal
+from django.core.management.base import BaseCommand
+from api.jobs import JobWorker
+
+
+class Command(BaseCommand):
+    help = "Run the queued background jobs on a thread pool, until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=None,
+            help="Number of jobs run at once, JOB_WORKER_THREADS by default.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Seconds between two polls of the job table, JOB_POLL_SECONDS by default.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no job is running or due to run, instead of waiting for new jobs.",
+        )
+
+    def handle(self, *args, **options):
+        worker = JobWorker(threads=options["threads"], poll_interval=options["poll_interval"])
+
+        # The running jobs finish before the worker exits, a second signal kills it.
+        def stop(signum, frame):
+            signal.signal(signum, signal.SIG_DFL)
+            self.stdout.write("Stopping, waiting for the running jobs")
+            worker.stop()
+
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+        self.stdout.write(f"Job worker {worker.name} running {worker.threads} threads")
+        try:
+            ran = worker.run(once=options["once"])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs"))
@@ -1,14 +1,25 @@
-# Gloabl exception handler middleware for non-ninja endpoints, if any
+# Gloabl exception handler middleware for non-ninja endpoints, if any,
+# the per-request instrumentation middleware and the read replica stickiness middleware
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.http import JsonResponse, Http404
 from django.core import exceptions
+from django.utils.deprecation import MiddlewareMixin
+from api.db_router import RoutingState, routing_state
+import logging
 
-class GlobalExceptionHandlerMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
 
-    def __call__(self, request):
-        response = self.get_response(request)
-        return response
+logger = logging.getLogger(__name__)
+
+class GlobalExceptionHandlerMiddleware(MiddlewareMixin):
+    # MiddlewareMixin runs it in the mode of the handler, sync or async.
 
     def process_exception(self, request, exception):
         # 404
@@ -23,4 +34,186 @@ class GlobalExceptionHandlerMiddleware:
         response_data = {
             "error": str(exception),
         }
-        return JsonResponse(response_data, status=500)
\ No newline at end of file
+        return JsonResponse(response_data, status=500)
+
+
+class _RequestTimings:
+    """
+    Timings collected during a request: the queries and the time of the named phases.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.phases = {}
+
+
+_current_timings: ContextVar = ContextVar("request_timings", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    # Left installed on the connections, it records the query in the timings of the request
+    # in the context. The context follows the queries of the async views to the thread
+    # `sync_to_async` runs them in, unlike a wrapper installed on the connections of the request thread.
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - started
+        timings.queries += 1
+
+
+def _install_query_recorder():
+    # Every database, the read-only endpoints can read from a replica. The connections are per thread.
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if _record_query not in wrappers:
+            # First, since `connection.execute_wrapper` removes the last wrapper on exit.
+            wrappers.insert(0, _record_query)
+
+
+@contextmanager
+def timed(phase: str):
+    """
+    Time a phase of the request, e.g. "aggregation" or "serialization".
+    The time spent in queries during the phase is reported as database time, not as phase time.
+    It does nothing when the instrumentation is disabled.
+
+    Args:
+        phase (str): The name of the phase, reported in the Server-Timing header.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    started, db_time = time.perf_counter(), timings.db_time
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (timings.db_time - db_time)
+        timings.phases[phase] = timings.phases.get(phase, 0.0) + elapsed
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Record the number of queries, the database time and the time of the phases timed with `timed`.
+    They are returned in a Server-Timing header and logged, with a warning when the number of
+    queries is over REQUEST_QUERY_BUDGET. The middleware is removed when REQUEST_INSTRUMENTATION_ENABLED is off.
+    For streamed responses, only the work done before the first chunk is recorded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_INSTRUMENTATION_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.query_budget = getattr(settings, "REQUEST_QUERY_BUDGET", None)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        _install_query_recorder()
+        timings = _RequestTimings()
+        token = _current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        self._report(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # In the thread of the ORM calls of the async views.
+        await sync_to_async(_install_query_recorder)()
+        timings = _RequestTimings()
+        token = _current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        self._report(request, response, timings, time.perf_counter() - started)
+        return response
+
+    def _report(self, request, response, timings: _RequestTimings, total: float):
+        metrics = [f'db;dur={timings.db_time * 1000:.2f};desc="{timings.queries} queries"']
+        metrics += [f"{phase};dur={elapsed * 1000:.2f}" for phase, elapsed in timings.phases.items()]
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        response["Server-Timing"] = ", ".join(metrics)
+
+        over_budget = self.query_budget is not None and timings.queries > self.query_budget
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": timings.queries,
+            "db_ms": round(timings.db_time * 1000, 2),
+            **{f"{phase}_ms": round(elapsed * 1000, 2) for phase, elapsed in timings.phases.items()},
+            "total_ms": round(total * 1000, 2),
+            "over_query_budget": over_budget,
+        }
+        if over_budget:
+            logger.warning(
+                f"Query budget exceeded: {request.method} {request.path} ran {timings.queries} queries, "
+                f"budget {self.query_budget}",
+                extra=fields,
+            )
+        else:
+            logger.info(f"{request.method} {request.path} timings", extra=fields)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Keep the reads of a client on the primary database for DATABASE_PRIMARY_STICKY_SECONDS
+    after a request of that client wrote to it, so that it reads its own writes.
+    The clients are identified by their Authorization header, or by their address,
+    and the window is stored in the cache, shared by the processes with a shared backend.
+    The middleware is removed when there are no DATABASE_REPLICAS.
+    """
+
+    KEY_PREFIX = "db-primary-sticky"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "DATABASE_REPLICAS", None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, "DATABASE_PRIMARY_STICKY_SECONDS", 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _client_key(self, request) -> str:
+        client = request.META.get("HTTP_AUTHORIZATION") or request.META.get("REMOTE_ADDR", "")
+        return f"{self.KEY_PREFIX}:{hashlib.blake2b(client.encode(), digest_size=16).hexdigest()}"
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = self._client_key(request)
+        state = RoutingState(pinned=cache.get(key) is not None)
+        with routing_state(state):
+            response = self.get_response(request)
+        if state.wrote and self.sticky_seconds:
+            cache.set(key, True, self.sticky_seconds)
+        return response
+
+    async def __acall__(self, request):
+        key = self._client_key(request)
+        state = RoutingState(pinned=await cache.aget(key) is not None)
+        # The context, and the state with it, is copied to the threads of the ORM calls.
+        with routing_state(state):
+            response = await self.get_response(request)
+        if state.wrote and self.sticky_seconds:
+            await cache.aset(key, True, self.sticky_seconds)
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertySpaceYearlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('measurement_unit', models.CharField(choices=[('kWh', 'kWh'), ('therms', 'Therms')], default='kWh', max_length=32)),
+                ('total_consumption', models.FloatField(default=0)),
+                ('meter_count', models.IntegerField(default=0)),
+                ('total_area', models.FloatField(default=0)),
+                ('property_space', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.propertyspace')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='propertyspaceyearlyrollup',
+            constraint=models.UniqueConstraint(fields=('property_space', 'year', 'measurement_unit'), name='unique_property_space_yearly_rollup'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_readings(apps, schema_editor):
+    # Keep the first of the readings sharing a (meter_number, measurement_start_date, measurement_end_date)
+    # key, move the unit space links of the others to it, and delete the others.
+    MeterData = apps.get_model('api', 'MeterData')
+    Link = MeterData._meta.get_field('unit_space').remote_field.through
+    duplicates = (
+        MeterData.objects
+        .values('meter_number', 'measurement_start_date', 'measurement_end_date')
+        .annotate(count=Count('id'), kept_id=Min('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in list(duplicates):
+        removed_ids = list(
+            MeterData.objects
+            .filter(
+                meter_number=duplicate['meter_number'],
+                measurement_start_date=duplicate['measurement_start_date'],
+                measurement_end_date=duplicate['measurement_end_date'],
+            )
+            .exclude(id=duplicate['kept_id'])
+            .values_list('id', flat=True)
+        )
+        linked_ids = set(Link.objects.filter(meterdata_id=duplicate['kept_id']).values_list('unitspace_id', flat=True))
+        moved_ids = set(
+            Link.objects.filter(meterdata_id__in=removed_ids).values_list('unitspace_id', flat=True)
+        ) - linked_ids
+        Link.objects.bulk_create([
+            Link(meterdata_id=duplicate['kept_id'], unitspace_id=unit_space_id) for unit_space_id in moved_ids
+        ])
+        Link.objects.filter(meterdata_id__in=removed_ids).delete()
+        MeterData.objects.filter(id__in=removed_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # The deletions fire the deferred foreign key checks, which PostgreSQL refuses to have pending
+    # when the table is altered: the merge is committed on its own before the constraint is added.
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_property_space_yearly_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_readings, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='meterdata',
+            constraint=models.UniqueConstraint(fields=('meter_number', 'measurement_start_date', 'measurement_end_date'), name='unique_meter_data_reading'),
+        ),
+    ]
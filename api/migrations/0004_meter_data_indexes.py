@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_meter_data_unique_reading'),
+    ]
+
+    operations = [
+        # The auto-created many-to-many table becomes an explicit model so that it can declare indexes.
+        # The table already exists, only the migration state changes.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='MeterDataUnitSpace',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('meterdata', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.meterdata')),
+                        ('unitspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.unitspace')),
+                    ],
+                    options={
+                        'db_table': 'api_meterdata_unit_space',
+                        'unique_together': {('meterdata', 'unitspace')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='meterdata',
+                    name='unit_space',
+                    field=models.ManyToManyField(through='api.MeterDataUnitSpace', to='api.unitspace'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='meterdataunitspace',
+            index=models.Index(fields=['unitspace', 'meterdata'], name='meterdata_unitspace_unit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meterdata',
+            index=models.Index(fields=['measurement_start_date', 'measurement_end_date'], name='meterdata_start_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meterdata',
+            index=models.Index(fields=['measurement_end_date'], name='meterdata_end_idx'),
+        ),
+    ]
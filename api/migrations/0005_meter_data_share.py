@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:17
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+
+def backfill_meter_shares(apps, schema_editor):
+    MeterData = apps.get_model('api', 'MeterData')
+    MeterDataUnitSpace = apps.get_model('api', 'MeterDataUnitSpace')
+    MeterData.objects.update(share_count=Coalesce(
+        Subquery(
+            MeterDataUnitSpace.objects
+            .filter(meterdata_id=OuterRef('pk'))
+            .values('meterdata_id')
+            .annotate(count=Count('id'))
+            .values('count')
+        ),
+        Value(0),
+    ))
+    MeterData.objects.update(share_reading=Case(
+        When(share_count=0, then=Value(0.0)),
+        default=F('measurement_reading') / F('share_count'),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_meter_data_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meterdata',
+            name='share_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meterdata',
+            name='share_reading',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_meter_shares, migrations.RunPython.noop),
+    ]
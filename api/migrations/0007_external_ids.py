@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_api_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertyspace',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=128, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='unitspace',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='unitspace',
+            constraint=models.UniqueConstraint(fields=('property_space', 'external_id'), name='unique_unit_space_external_id'),
+        ),
+    ]
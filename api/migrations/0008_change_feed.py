@@ -0,0 +1,68 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+def create_change_sequence(apps, schema_editor):
+    # The existing property spaces keep the change_seq 0, they are returned by a sync from the start.
+    apps.get_model('api', 'ChangeSequence').objects.using(schema_editor.connection.alias).create(pk=1, value=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_external_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PropertySpaceTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('property_space_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='meterdata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='propertyspace',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='propertyspace',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='unitspace',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='propertyspace',
+            index=models.Index(fields=['change_seq', 'id'], name='propertyspace_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertyspacetombstone',
+            index=models.Index(fields=['change_seq', 'property_space_id'], name='tombstone_change_seq_idx'),
+        ),
+        migrations.RunPython(create_change_sequence, migrations.RunPython.noop),
+    ]
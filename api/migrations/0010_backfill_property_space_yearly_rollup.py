@@ -0,0 +1,62 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:40
+
+from django.db import migrations
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear
+
+
+def backfill_rollups(apps, schema_editor):
+    # Same computation as `api.rollups.compute_rollups`, with the models of this migration:
+    # the shares of the readings, grouped by the year they start in and by the year they end in.
+    MeterDataUnitSpace = apps.get_model('api', 'MeterDataUnitSpace')
+    PropertySpaceYearlyRollup = apps.get_model('api', 'PropertySpaceYearlyRollup')
+    UnitSpace = apps.get_model('api', 'UnitSpace')
+
+    links = MeterDataUnitSpace.objects.annotate(
+        start_year=ExtractYear('meterdata__measurement_start_date'),
+        end_year=ExtractYear('meterdata__measurement_end_date'),
+    )
+    rollups = {}
+    for grouped in [
+        links.annotate(year=F('start_year')),
+        links.exclude(end_year=F('start_year')).annotate(year=F('end_year')),
+    ]:
+        rows = (
+            grouped
+            .values('unitspace__property_space_id', 'year', 'meterdata__measurement_unit')
+            .annotate(total_consumption=Sum('meterdata__share_reading'), meter_count=Count('meterdata_id', distinct=True))
+        )
+        for row in rows:
+            key = (row['unitspace__property_space_id'], row['year'], row['meterdata__measurement_unit'])
+            rollup = rollups.setdefault(key, {'total_consumption': 0.0, 'meter_count': 0})
+            rollup['total_consumption'] += row['total_consumption']
+            rollup['meter_count'] += row['meter_count']
+
+    total_areas = dict(
+        UnitSpace.objects
+        .values('property_space_id')
+        .annotate(total_area=Sum('area'))
+        .values_list('property_space_id', 'total_area')
+    )
+    PropertySpaceYearlyRollup.objects.all().delete()
+    PropertySpaceYearlyRollup.objects.bulk_create([
+        PropertySpaceYearlyRollup(
+            property_space_id=property_space_id,
+            year=year,
+            measurement_unit=measurement_unit,
+            total_area=total_areas.get(property_space_id, 0.0),
+            **values,
+        )
+        for (property_space_id, year, measurement_unit), values in rollups.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
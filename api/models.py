@@ -1,6 +1,7 @@
 # Definition of the models using Django ORM
 
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
 
 class Address(models.Model):
     street = models.CharField(max_length=64)
@@ -8,6 +9,7 @@ class Address(models.Model):
     state = models.CharField(max_length=64)
     country = models.CharField(max_length=64)
     postal_code = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 class PropertySpace(models.Model):
     name = models.CharField(max_length=128)
@@ -15,6 +17,25 @@ class PropertySpace(models.Model):
         Address,
         on_delete=models.CASCADE,
     )
+    # Identifier of the property space in the client system, used by the topology import.
+    external_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
+    # Position of the last change of the property space output (its fields, address, units or meters)
+    # in the change feed, and its time. They are maintained by `api.changes`.
+    change_seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # The change feed is paginated on (change_seq, id).
+            models.Index(fields=['change_seq', 'id'], name='propertyspace_change_seq_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The change sequence value, taken in `pre_save`, is committed with the row:
+        # taken in a transaction of its own, a later value could be committed first.
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
 
 class UnitSpace(models.Model):
     UNIT_TYPE_CHOICES = [
@@ -30,6 +51,17 @@ class UnitSpace(models.Model):
         PropertySpace,
         on_delete=models.CASCADE,
     )
+    # Identifier of the unit space in the client system, unique within its property space.
+    external_id = models.CharField(max_length=128, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['property_space', 'external_id'],
+                name='unique_unit_space_external_id',
+            ),
+        ]
 
 class MeterData(models.Model):
     UNIT_CHOICES = [
@@ -44,10 +76,161 @@ class MeterData(models.Model):
     measurement_unit = models.CharField(max_length=32, choices=UNIT_CHOICES, default='kWh')
     measurement_start_date = models.DateTimeField()
     measurement_end_date = models.DateTimeField()
-    unit_space = models.ManyToManyField(UnitSpace)
+    unit_space = models.ManyToManyField(UnitSpace, through='MeterDataUnitSpace')
+    # Denormalized number of unit spaces sharing the meter, and the reading of each share.
+    # They are maintained by `api.shares.refresh_meter_shares`.
+    share_count = models.PositiveIntegerField(default=0)
+    share_reading = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            # A reading is identified by its meter and measurement period, retried ingestions are deduplicated on it.
+            models.UniqueConstraint(
+                fields=['meter_number', 'measurement_start_date', 'measurement_end_date'],
+                name='unique_meter_data_reading',
+            ),
+        ]
+        indexes = [
+            # The year filter is a range on the start date or a range on the end date.
+            models.Index(fields=['measurement_start_date', 'measurement_end_date'], name='meterdata_start_end_idx'),
+            models.Index(fields=['measurement_end_date'], name='meterdata_end_idx'),
+        ]
 
     def __str__(self):
         return "%s (%s)" % (
             self.meter_provider_name,
             ", ".join(unit_space.name for unit_space in self.unit_space.all()),
         )
+
+class MeterDataUnitSpace(models.Model):
+    """
+    Link between a meter and the unit spaces it is shared between.
+    It keeps the table and columns of the auto-created many-to-many table.
+    """
+    meterdata = models.ForeignKey(
+        MeterData,
+        on_delete=models.CASCADE,
+    )
+    unitspace = models.ForeignKey(
+        UnitSpace,
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        db_table = 'api_meterdata_unit_space'
+        unique_together = [['meterdata', 'unitspace']]
+        indexes = [
+            # The totals join the links from the unit spaces of a property space to their meters.
+            models.Index(fields=['unitspace', 'meterdata'], name='meterdata_unitspace_unit_idx'),
+        ]
+
+class PropertySpaceYearlyRollup(models.Model):
+    """
+    Stored aggregate of the consumption of a property space for a year and a measurement unit.
+    It is maintained by the signal handlers in `api/signals.py` and can be rebuilt
+    with the `rebuild_rollups` management command.
+    """
+    property_space = models.ForeignKey(
+        PropertySpace,
+        on_delete=models.CASCADE,
+    )
+    year = models.IntegerField()
+    measurement_unit = models.CharField(max_length=32, choices=MeterData.UNIT_CHOICES, default='kWh')
+    total_consumption = models.FloatField(default=0)
+    meter_count = models.IntegerField(default=0)
+    total_area = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['property_space', 'year', 'measurement_unit'],
+                name='unique_property_space_yearly_rollup',
+            ),
+        ]
+
+class PropertySpaceTombstone(models.Model):
+    """
+    Record of a deleted property space, returned by the change feed so that
+    the clients syncing the property spaces delete it too.
+    """
+    property_space_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_seq', 'property_space_id'], name='tombstone_change_seq_idx'),
+        ]
+
+class ChangeSequence(models.Model):
+    """
+    Counter of the change feed, with a single row. Every change takes the next value
+    in the transaction of the change (see `api.changes.next_change_seq`).
+    """
+    value = models.BigIntegerField(default=0)
+
+class Job(models.Model):
+    """
+    Background job, run by the `run_jobs` worker command (see `api.jobs`).
+    The result is stored with the job and downloaded from the API.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    kind = models.CharField(max_length=64)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # A queued job is not claimed before this time, e.g. while waiting to be retried.
+    run_after = models.DateTimeField(default=timezone.now)
+    cancel_requested = models.BooleanField(default=False)
+    progress = models.FloatField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    result = models.TextField(null=True, blank=True)
+    result_content_type = models.CharField(max_length=128, blank=True, default='')
+    result_filename = models.CharField(max_length=128, blank=True, default='')
+    worker = models.CharField(max_length=128, blank=True, default='')
+    # Updated by the worker while the job runs, a job without a recent heartbeat lost its worker.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The workers claim the queued jobs in order of run_after.
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+class ApiKey(models.Model):
+    """
+    Key of an API client. Only the SHA-256 hash of the key is stored, the key itself
+    is shown once when it is created (see `api.auth.create_api_key`).
+    The rate limit of the key defaults to API_RATE_LIMIT_PER_MINUTE and API_RATE_LIMIT_BURST.
+    """
+    name = models.CharField(max_length=128)
+    # The first characters of the key, to tell the keys apart without storing them.
+    prefix = models.CharField(max_length=8)
+    key_hash = models.CharField(max_length=64, unique=True)
+    is_active = models.BooleanField(default=True)
+    rate_limit_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    rate_limit_burst = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix}...)"
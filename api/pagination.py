@@ -0,0 +1,77 @@
+# Description: Keyset (cursor) pagination keyed on the primary key.
+# Pages are fetched with `id > last_id ORDER BY id LIMIT n`, which is resolved
+# through the primary key index, so page 500 costs the same as page 1.
+
+import base64
+import binascii
+from typing import List, Optional, Tuple
+from django.db.models import QuerySet
+from api.exceptions import BadRequestException
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encode the id of the last item of a page into an opaque cursor.
+
+    Args:
+        last_id (int): The id of the last item of the page.
+    """
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decode an opaque cursor back into the id of the last item of the previous page.
+
+    Args:
+        cursor (str): The cursor returned with the previous page.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, last_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(last_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise BadRequestException(f"Invalid cursor: {cursor}")
+
+
+def _page_queryset(queryset: QuerySet, limit: int, cursor: str = None) -> QuerySet:
+    if cursor:
+        queryset = queryset.filter(id__gt=decode_cursor(cursor))
+    # Fetch one extra row to know whether there is a next page without a count() query.
+    return queryset.order_by("id")[:limit + 1]
+
+
+def _split_page(items: List, limit: int) -> Tuple[List, Optional[str]]:
+    if len(items) > limit:
+        items = items[:limit]
+        # The items are model instances, or dictionaries for a values() queryset.
+        last_id = items[-1]["id"] if isinstance(items[-1], dict) else items[-1].id
+        return items, encode_cursor(last_id)
+    return items, None
+
+
+def paginate_by_id(queryset: QuerySet, limit: int, cursor: str = None) -> Tuple[List, Optional[str]]:
+    """
+    Fetch one page of the queryset ordered by id, a values() queryset must include the id.
+    Returns the items of the page and the cursor of the next page, or None on the last page.
+
+    Args:
+        queryset (QuerySet): The queryset to paginate.
+        limit (int): The maximum number of items in the page.
+        cursor (str): The cursor returned with the previous page.
+    """
+    return _split_page(list(_page_queryset(queryset, limit, cursor)), limit)
+
+
+async def apaginate_by_id(queryset: QuerySet, limit: int, cursor: str = None) -> Tuple[List, Optional[str]]:
+    """
+    Async version of `paginate_by_id`.
+
+    Args:
+        queryset (QuerySet): The queryset to paginate.
+        limit (int): The maximum number of items in the page.
+        cursor (str): The cursor returned with the previous page.
+    """
+    return _split_page([item async for item in _page_queryset(queryset, limit, cursor)], limit)
@@ -0,0 +1,67 @@
+# Description: Fixed-window rate limiter on Django's cache framework.
+# A client may send up to `burst` requests per window of `burst / rate_per_minute` minutes,
+# so the long-term rate is `rate_per_minute`. The windows are fixed, not sliding: a client
+# sending `burst` requests at the end of a window and `burst` more at the start of the next
+# one gets up to twice `burst` through in a short time. The requests of a window are counted
+# in a single cache entry created with `add` and incremented with `incr`, both atomic in the
+# local-memory, Redis and Memcached backends, so concurrent requests cannot all pass. The limit
+# is per process with the local-memory backend and shared by the processes with a shared backend
+# such as Redis.
+
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+from api.exceptions import RateLimitExceededException
+
+KEY_PREFIX = "rate-limit"
+
+
+def _cache():
+    return caches[getattr(settings, "RATE_LIMIT_CACHE_ALIAS", "default")]
+
+
+def count_request(client: str, rate_per_minute: int, burst: int) -> float:
+    """
+    Count a request in the current window of the client.
+    Returns 0 if it is within the limit, otherwise the number of seconds until the next window.
+
+    Args:
+        client (str): The client limited, e.g. the ID of the API key.
+        rate_per_minute (int): The number of requests allowed per minute.
+        burst (int): The number of requests allowed per window.
+    """
+    window = burst * 60 / rate_per_minute
+    now = time.time()
+    index = int(now // window)
+    key = f"{KEY_PREFIX}:{client}:{index}"
+    cache = _cache()
+    # The entry of a window expires after it.
+    timeout = math.ceil(window) + 1
+    cache.add(key, 0, timeout=timeout)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Evicted between the add and the increment.
+        cache.add(key, 0, timeout=timeout)
+        count = cache.incr(key)
+    if count <= burst:
+        return 0.0
+    return (index + 1) * window - now
+
+
+def check_rate_limit(client: str, rate_per_minute: int, burst: int) -> None:
+    """
+    Count a request of the client, or raise RateLimitExceededException when its window is full.
+
+    Args:
+        client (str): The client limited, e.g. the ID of the API key.
+        rate_per_minute (int): The number of requests allowed per minute.
+        burst (int): The number of requests allowed per window.
+    """
+    retry_after = count_request(client, rate_per_minute, burst)
+    if retry_after:
+        raise RateLimitExceededException(
+            f"Rate limit of {rate_per_minute} requests per minute exceeded.",
+            retry_after,
+        )
@@ -0,0 +1,260 @@
+# Description: Cache of the rendered property space responses, on Django's cache framework.
+# Detail entries are keyed by property space, generation and year. Changing a
+# property space deletes the entries of the affected years, or moves it to a new
+# generation when every year is affected. List pages cover many property spaces,
+# so any change moves the list to a new generation.
+# Each entry stores the rendered body with its ETag, so a conditional request
+# is answered with a 304 without recomputing the response.
+# A detail response restricted to some fields is keyed by its fields too. Without
+# the consumption it does not depend on the year and only changes with the generation;
+# with it, it is keyed by a generation of the year, which is dropped with the year entries.
+# The responses in another unit than the default one are keyed by their unit the same way.
+# With read replicas, a response read from a replica is not stored: it may predate a
+# write whose invalidation already ran. A client reading its own writes from the primary
+# skips the lookup, and stores the response it renders.
+
+import hashlib
+import uuid
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from api.db_router import pinned_to_primary, read_from_replica
+from api.units import default_unit
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "property-spaces"
+
+# The response headers replayed from the cache, along with the body.
+CACHED_HEADERS = ["Content-Type", "X-Next-Cursor"]
+
+
+def _cache():
+    return caches[getattr(settings, "RESPONSE_CACHE_ALIAS", "default")]
+
+
+def _timeout() -> int:
+    return getattr(settings, "RESPONSE_CACHE_TIMEOUT", 300)
+
+
+def _generation_key(name: str) -> str:
+    return f"{KEY_PREFIX}:generation:{name}"
+
+
+def _generation(name: str) -> str:
+    # A missing generation (never set or evicted) gets a new random value,
+    # so the entries of an evicted generation can never be read again.
+    return _cache().get_or_set(_generation_key(name), uuid.uuid4().hex, timeout=None)
+
+
+def _year_key(year: int = None) -> str:
+    return "all" if year is None else str(year)
+
+
+def _fields_key(fields: List[str] = None) -> str:
+    return "" if fields is None else ":" + ",".join(fields)
+
+
+def _unit_key(unit: str = None) -> str:
+    return "" if unit is None or unit == default_unit() else f":unit={unit}"
+
+
+def detail_cache_key(property_space_id: int, year: int = None, fields: List[str] = None, unit: str = None) -> str:
+    """
+    Return the cache key of a property space response.
+
+    Args:
+        property_space_id (int): The property space ID.
+        year (int): The year filter, None for every year.
+        fields (List[str]): The fields of the response, every field if None.
+        unit (str): The unit of the consumption, the default unit if None.
+    """
+    generation = _generation(f"detail:{property_space_id}")
+    if fields is None and not _unit_key(unit):
+        return _detail_key(property_space_id, generation, year)
+    if fields is not None and "total_consumption" not in fields:
+        return f"{KEY_PREFIX}:detail:{property_space_id}:{generation}:static{_unit_key(unit)}{_fields_key(fields)}"
+    # The responses in another unit or restricted to some fields are invalidated with the year generation.
+    year_generation = _generation(_year_generation_name(property_space_id, year))
+    return f"{_detail_key(property_space_id, generation, year)}:{year_generation}{_unit_key(unit)}{_fields_key(fields)}"
+
+
+def _detail_key(property_space_id: int, generation: str, year: int = None) -> str:
+    return f"{KEY_PREFIX}:detail:{property_space_id}:{generation}:{_year_key(year)}"
+
+
+def _year_generation_name(property_space_id: int, year: int = None) -> str:
+    return f"detail:{property_space_id}:{_year_key(year)}"
+
+
+def list_cache_key(
+    year: int = None,
+    limit: int = None,
+    cursor: str = None,
+    fields: List[str] = None,
+    unit: str = None,
+    envelope: bool = False,
+) -> str:
+    """
+    Return the cache key of a property space list page.
+
+    Args:
+        year (int): The year filter, None for every year.
+        limit (int): The page size.
+        cursor (str): The page cursor.
+        fields (List[str]): The fields of the response, every field if None.
+        unit (str): The unit of the consumption, the default unit if None.
+        envelope (bool): Whether the page is returned in an object with its next cursor.
+    """
+    key = _list_key(_generation("list"), year, limit, cursor) + _unit_key(unit) + _fields_key(fields)
+    return key + ":envelope" if envelope else key
+
+
+def _list_key(generation: str, year: int, limit: int, cursor: str) -> str:
+    return f"{KEY_PREFIX}:list:{generation}:{_year_key(year)}:{limit}:{cursor or ''}"
+
+
+def _count(counter: str) -> None:
+    cache = _cache()
+    key = f"{KEY_PREFIX}:stats:{counter}"
+    # `incr` fails on a missing key, `add` only sets it when missing.
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between the two calls, the count restarts.
+        cache.set(key, 1, timeout=None)
+
+
+def cache_stats() -> dict:
+    """
+    Return the hit and miss counts of the response cache since it was last cleared.
+    """
+    counts = _cache().get_many([f"{KEY_PREFIX}:stats:hits", f"{KEY_PREFIX}:stats:misses"])
+    hits = counts.get(f"{KEY_PREFIX}:stats:hits", 0)
+    misses = counts.get(f"{KEY_PREFIX}:stats:misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        "timeout": _timeout(),
+    }
+
+
+def cached_response(request: HttpRequest, key: str, render: Callable[[], HttpResponse]) -> HttpResponse:
+    """
+    Return the cached response for a key, rendering and storing it on a miss.
+    Returns a 304 when the `If-None-Match` header matches the ETag of the response.
+
+    Args:
+        request (HttpRequest): The request.
+        key (str): The cache key, from `detail_cache_key` or `list_cache_key`.
+        render (Callable[[], HttpResponse]): Renders the response, only called on a miss.
+    """
+    cache = _cache()
+    entry = None if pinned_to_primary() else cache.get(key)
+    if entry is None:
+        _count("misses")
+        response = render()
+        entry = _entry(response)
+        if _storable(response):
+            cache.set(key, entry, _timeout())
+        return _respond(request, entry, "MISS")
+    _count("hits")
+    return _respond(request, entry, "HIT")
+
+
+async def acached_response(
+    request: HttpRequest,
+    cache_key: Callable[[], str],
+    render: Callable[[], Awaitable[HttpResponse]],
+) -> HttpResponse:
+    """
+    Async version of `cached_response`.
+    The cache backends run their async methods in a thread, so the key, the lookup
+    and the counter are done in a single thread hop.
+
+    Args:
+        request (HttpRequest): The request.
+        cache_key (Callable[[], str]): Returns the cache key, e.g. a `detail_cache_key` call.
+        render (Callable[[], Awaitable[HttpResponse]]): Renders the response, only awaited on a miss.
+    """
+    key, entry = await sync_to_async(_lookup)(cache_key)
+    if entry is None:
+        response = await render()
+        entry = _entry(response)
+        if _storable(response):
+            await _cache().aset(key, entry, _timeout())
+        return _respond(request, entry, "MISS")
+    return _respond(request, entry, "HIT")
+
+
+def _lookup(cache_key: Callable[[], str]) -> Tuple[str, Optional[dict]]:
+    key = cache_key()
+    entry = None if pinned_to_primary() else _cache().get(key)
+    _count("misses" if entry is None else "hits")
+    return key, entry
+
+
+def _storable(response: HttpResponse) -> bool:
+    # Errors are not cached, e.g. a 404 on a property space about to be created.
+    return response.status_code == 200 and not read_from_replica()
+
+
+def _entry(response: HttpResponse) -> dict:
+    return {
+        "etag": quote_etag(hashlib.blake2b(response.content, digest_size=16).hexdigest()),
+        "content": response.content,
+        "headers": {header: response[header] for header in CACHED_HEADERS if response.has_header(header)},
+    }
+
+
+def _respond(request: HttpRequest, entry: dict, status: str) -> HttpResponse:
+    if entry["etag"] in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry["content"])
+        for header, value in entry["headers"].items():
+            response[header] = value
+    response["ETag"] = entry["etag"]
+    response["X-Cache"] = status
+    return response
+
+
+def invalidate_property_spaces(property_space_ids: Iterable[int], years: Iterable[int] = None) -> None:
+    """
+    Invalidate the cached responses of the given property spaces and every list page.
+
+    Args:
+        property_space_ids (Iterable[int]): The changed property spaces.
+        years (Iterable[int]): The affected years, every year if None.
+    """
+    cache = _cache()
+    property_space_ids = set(property_space_ids)
+    cache.set(_generation_key("list"), uuid.uuid4().hex, timeout=None)
+    if years is None:
+        cache.set_many(
+            {_generation_key(f"detail:{property_space_id}"): uuid.uuid4().hex for property_space_id in property_space_ids},
+            timeout=None,
+        )
+    else:
+        generations = cache.get_many([_generation_key(f"detail:{property_space_id}") for property_space_id in property_space_ids])
+        # The unfiltered totals include every year.
+        years = list(years) + [None]
+        cache.delete_many([
+            _detail_key(property_space_id, generation, year)
+            for property_space_id in property_space_ids
+            if (generation := generations.get(_generation_key(f"detail:{property_space_id}")))
+            for year in years
+        ] + [
+            # The responses in another unit or restricted to some fields, including the consumption.
+            _generation_key(_year_generation_name(property_space_id, year))
+            for property_space_id in property_space_ids
+            for year in years
+        ])
+    logger.debug(f"Invalidated the cached responses of {len(property_space_ids)} property spaces")
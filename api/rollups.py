@@ -0,0 +1,272 @@
+# Description: Maintenance of the PropertySpaceYearlyRollup table.
+# A reading belongs to the year it starts in and to the year it ends in, which
+# matches the `year` filter of the API. The rollup rows of a property space are
+# recomputed with grouped queries whenever its meters or units change.
+
+import math
+import operator
+from collections import Counter
+from functools import reduce
+from typing import Callable, Dict, Iterable, List, Sequence, Set, Tuple
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from api.aggregations import meter_year_filter, meter_years
+from api.models import MeterData, MeterDataUnitSpace, PropertySpace, PropertySpaceYearlyRollup, UnitSpace
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 500
+
+# The number of rollup rows per INSERT statement, 6 parameters each.
+UPSERT_BATCH_SIZE = 150
+
+RollupKey = Tuple[int, int, str]
+
+
+def compute_rollups(property_space_ids: Iterable[int] = None, years: Iterable[int] = None) -> Dict[RollupKey, dict]:
+    """
+    Compute the rollup values from the meter history.
+    Returns a dictionary keyed by (property_space_id, year, measurement_unit).
+
+    Args:
+        property_space_ids (Iterable[int]): The property spaces to compute, all of them if None.
+        years (Iterable[int]): The years to compute, all of them if None.
+    """
+    links = MeterDataUnitSpace.objects.all()
+    if property_space_ids is not None:
+        links = links.filter(unitspace__property_space_id__in=list(property_space_ids))
+    if years is not None:
+        years = set(years)
+        links = links.filter(reduce(operator.or_, [
+            meter_year_filter(year, prefix="meterdata__") for year in years
+        ], Q(pk__in=[])))
+    links = links.annotate(
+        start_year=ExtractYear("meterdata__measurement_start_date"),
+        end_year=ExtractYear("meterdata__measurement_end_date"),
+    )
+
+    # Readings are grouped by the year they start in, then by the year they end in
+    # for the readings spanning two years, so that no reading is counted twice in a year.
+    grouped_by_start = links.annotate(year=F("start_year"))
+    grouped_by_end = links.exclude(end_year=F("start_year")).annotate(year=F("end_year"))
+
+    rollups = {}
+    for grouped in [grouped_by_start, grouped_by_end]:
+        rows = (
+            grouped
+            .values("unitspace__property_space_id", "year", "meterdata__measurement_unit")
+            .annotate(
+                total_consumption=Sum("meterdata__share_reading"),
+                meter_count=Count("meterdata_id", distinct=True),
+            )
+        )
+        for row in rows:
+            # A reading of a requested year may start or end in another year, which is not refreshed.
+            if years is not None and row["year"] not in years:
+                continue
+            key = (row["unitspace__property_space_id"], row["year"], row["meterdata__measurement_unit"])
+            rollup = rollups.setdefault(key, {"total_consumption": 0.0, "meter_count": 0})
+            rollup["total_consumption"] += row["total_consumption"]
+            rollup["meter_count"] += row["meter_count"]
+
+    areas = UnitSpace.objects.values("property_space_id").annotate(total_area=Sum("area"))
+    if property_space_ids is not None:
+        areas = areas.filter(property_space_id__in=list(property_space_ids))
+    total_areas = {row["property_space_id"]: row["total_area"] for row in areas}
+    for (property_space_id, _, _), rollup in rollups.items():
+        rollup["total_area"] = total_areas.get(property_space_id, 0.0)
+
+    return rollups
+
+
+def refresh_rollups(property_space_ids: Iterable[int], years: Iterable[int] = None) -> None:
+    """
+    Recompute the rollup rows of the given property spaces.
+
+    Args:
+        property_space_ids (Iterable[int]): The property spaces to refresh.
+        years (Iterable[int]): The years to refresh, all of them if None.
+    """
+    # Skip the property spaces that no longer exist, e.g. deleted in the same transaction.
+    property_space_ids = list(
+        PropertySpace.objects.filter(id__in=list(property_space_ids)).values_list("id", flat=True)
+    )
+    if not property_space_ids:
+        return
+    years = None if years is None else list(years)
+
+    with transaction.atomic():
+        stale = PropertySpaceYearlyRollup.objects.filter(property_space_id__in=property_space_ids)
+        if years is not None:
+            stale = stale.filter(year__in=years)
+        stale.delete()
+        PropertySpaceYearlyRollup.objects.bulk_create([
+            PropertySpaceYearlyRollup(
+                property_space_id=property_space_id,
+                year=year,
+                measurement_unit=measurement_unit,
+                **values,
+            )
+            for (property_space_id, year, measurement_unit), values
+            in compute_rollups(property_space_ids, years).items()
+        ])
+
+
+def add_new_meters_to_rollups(
+    meters: Sequence[MeterData],
+    meter_property_space_ids: Sequence[List[int]],
+) -> Tuple[Set[int], Set[int]]:
+    """
+    Add newly created meters to the rollup rows without recomputing the history.
+    New meters do not change the share of the existing meters, so their
+    contribution can be added to the stored values.
+    Returns the affected property spaces and years.
+
+    Args:
+        meters (Sequence[MeterData]): The new meters, with their share set, or `api.ingest.NewReading` records.
+        meter_property_space_ids (Sequence[List[int]]): For each meter, the property space of each unit linked to it.
+    """
+    tz = timezone.get_current_timezone()
+    deltas: Dict[RollupKey, dict] = {}
+    for meter, property_space_ids in zip(meters, meter_property_space_ids):
+        if not property_space_ids:
+            continue
+        years = meter_years(meter.measurement_start_date, meter.measurement_end_date, tz)
+        for property_space_id, unit_count in Counter(property_space_ids).items():
+            for year in years:
+                delta = deltas.setdefault(
+                    (property_space_id, year, meter.measurement_unit),
+                    {"total_consumption": 0.0, "meter_count": 0},
+                )
+                delta["total_consumption"] += meter.share_reading * unit_count
+                delta["meter_count"] += 1
+
+    property_space_ids = {property_space_id for property_space_id, _, _ in deltas}
+    years = {year for _, year, _ in deltas}
+    if not deltas:
+        return property_space_ids, years
+
+    # The area is only written when the row is created; an existing row keeps its own.
+    total_areas = dict(
+        UnitSpace.objects
+        .filter(property_space_id__in=property_space_ids)
+        .values("property_space_id")
+        .annotate(total_area=Sum("area"))
+        .values_list("property_space_id", "total_area")
+    )
+    _upsert_rollup_deltas(deltas, total_areas)
+
+    return property_space_ids, years
+
+
+def _upsert_rollup_deltas(deltas: Dict[RollupKey, dict], total_areas: Dict[int, float]) -> None:
+    """
+    Add the deltas to the rollup rows with INSERT ... ON CONFLICT DO UPDATE on their unique key,
+    creating the missing rows. The addition is done by the database, so two ingests creating or
+    updating the same row concurrently both count, where a read-modify-write would lose one of
+    them or fail on the unique constraint.
+
+    Args:
+        deltas (Dict[RollupKey, dict]): The consumption and meter count to add, by rollup key.
+        total_areas (Dict[int, float]): The area of each property space, for the rows created.
+    """
+    using = router.db_for_write(PropertySpaceYearlyRollup)
+    connection = connections[using]
+    ops = connection.ops
+    meta = PropertySpaceYearlyRollup._meta
+    table = ops.quote_name(meta.db_table)
+    column = {
+        name: ops.quote_name(meta.get_field(name).column)
+        for name in ["property_space", "year", "measurement_unit", "total_consumption", "meter_count", "total_area"]
+    }
+    key = ", ".join(column[name] for name in ["property_space", "year", "measurement_unit"])
+    row = "(" + ", ".join(["%s"] * len(column)) + ")"
+    items = list(deltas.items())
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for (property_space_id, year, measurement_unit), delta in batch:
+                params += [
+                    property_space_id, year, measurement_unit, delta["total_consumption"],
+                    delta["meter_count"], total_areas.get(property_space_id, 0.0),
+                ]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(column.values())}) VALUES {', '.join([row] * len(batch))} "
+                f"ON CONFLICT ({key}) DO UPDATE SET "
+                f"{column['total_consumption']} = {table}.{column['total_consumption']} + "
+                f"excluded.{column['total_consumption']}, "
+                f"{column['meter_count']} = {table}.{column['meter_count']} + excluded.{column['meter_count']}",
+                params,
+            )
+
+
+def rebuild_rollups(batch_size: int = REBUILD_BATCH_SIZE, progress: Callable[[int, int], None] = None) -> int:
+    """
+    Rebuild the whole rollup table from scratch.
+    Returns the number of rollup rows created.
+
+    Args:
+        batch_size (int): The number of property spaces recomputed per query.
+        progress (Callable[[int, int], None]): Called with the number of property spaces done and
+            the total after each batch. An exception raised by it rolls the rebuild back.
+    """
+    with transaction.atomic():
+        PropertySpaceYearlyRollup.objects.all().delete()
+        property_space_ids = list(PropertySpace.objects.order_by("id").values_list("id", flat=True))
+        for start in range(0, len(property_space_ids), batch_size):
+            refresh_rollups(property_space_ids[start:start + batch_size])
+            if progress:
+                progress(min(start + batch_size, len(property_space_ids)), len(property_space_ids))
+    return PropertySpaceYearlyRollup.objects.count()
+
+
+def check_rollup_consistency(property_space_ids: Iterable[int] = None) -> List[dict]:
+    """
+    Compare the rollup table with the live computation from the meter history.
+    Returns the list of mismatching rollup keys, empty when the table is consistent.
+
+    Args:
+        property_space_ids (Iterable[int]): The property spaces to check, all of them if None.
+    """
+    property_space_ids = None if property_space_ids is None else list(property_space_ids)
+    expected = compute_rollups(property_space_ids)
+
+    stored_rows = PropertySpaceYearlyRollup.objects.all()
+    if property_space_ids is not None:
+        stored_rows = stored_rows.filter(property_space_id__in=property_space_ids)
+    stored = {
+        (row.property_space_id, row.year, row.measurement_unit): {
+            "total_consumption": row.total_consumption,
+            "meter_count": row.meter_count,
+            "total_area": row.total_area,
+        }
+        for row in stored_rows
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        expected_values = expected.get(key)
+        stored_values = stored.get(key)
+        if expected_values and stored_values and all(
+            math.isclose(expected_values[field], stored_values[field], rel_tol=1e-9, abs_tol=1e-6)
+            for field in ["total_consumption", "meter_count", "total_area"]
+        ):
+            continue
+        property_space_id, year, measurement_unit = key
+        mismatches.append({
+            "property_space_id": property_space_id,
+            "year": year,
+            "measurement_unit": measurement_unit,
+            "expected": expected_values,
+            "stored": stored_values,
+        })
+
+    if mismatches:
+        logger.warning(f"Found {len(mismatches)} inconsistent rollup rows")
+    return mismatches
@@ -0,0 +1,50 @@
+# Description: Maintenance of the denormalized share of the meters.
+# A meter shared between several unit spaces is divided equally among them.
+# `MeterData.share_count` stores the number of unit spaces linked to the meter and
+# `MeterData.share_reading` the reading of each share, so the totals do not have to
+# count the links of every meter on every read.
+
+from typing import Iterable
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from api.models import MeterData, MeterDataUnitSpace
+
+
+def refresh_meter_shares(meter_ids: Iterable[int] = None) -> None:
+    """
+    Recompute `share_count` and `share_reading` of the given meters with two set-based UPDATEs.
+    Code linking meters to unit spaces in bulk must call it, the model signals call it otherwise.
+
+    Args:
+        meter_ids (Iterable[int]): The meters to refresh, all of them if None.
+    """
+    meters = MeterData.objects.all()
+    if meter_ids is not None:
+        meters = meters.filter(id__in=list(meter_ids))
+    meters.update(share_count=Coalesce(
+        Subquery(
+            MeterDataUnitSpace.objects
+            .filter(meterdata_id=OuterRef("pk"))
+            .values("meterdata_id")
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        Value(0),
+    ))
+    meters.update(share_reading=Case(
+        When(share_count=0, then=Value(0.0)),
+        default=F("measurement_reading") / F("share_count"),
+        output_field=FloatField(),
+    ))
+
+
+def set_new_meter_share(meter: MeterData, share_count: int) -> None:
+    """
+    Set the share of a meter that is not saved yet, e.g. before a bulk_create.
+
+    Args:
+        meter (MeterData): The unsaved meter.
+        share_count (int): The number of unit spaces it will be linked to.
+    """
+    meter.share_count = share_count
+    meter.share_reading = meter.measurement_reading / share_count if share_count else 0.0
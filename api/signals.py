@@ -0,0 +1,275 @@
+# Description: Signal handlers tracking the changes that affect the property space totals.
+# Model changes are translated into a `property_space_totals_changed` signal carrying
+# the affected property spaces and years. Code writing in bulk (bypassing the model
+# signals) must send it as well through `notify_meters_changed` or
+# `notify_property_spaces_changed`.
+# The same signal moves the property spaces forward in the change feed (`api.changes`).
+# The API key handlers drop the changed keys from the in-process key cache.
+
+from typing import Iterable, Set
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from api.aggregations import meter_years
+from api.auth import forget_api_key
+from api.changes import next_change_seq, record_tombstones, touch_property_spaces
+from api.models import Address, ApiKey, MeterData, MeterDataUnitSpace, PropertySpace, UnitSpace
+from api.response_cache import invalidate_property_spaces
+from api.rollups import refresh_rollups
+from api.shares import refresh_meter_shares
+
+
+# Sent with `property_space_ids`, `years` (None meaning every year) and `rollups_updated`.
+property_space_totals_changed = Signal()
+
+
+def notify_property_spaces_changed(
+    property_space_ids: Iterable[int],
+    years: Iterable[int] = None,
+    rollups_updated: bool = False,
+) -> None:
+    """
+    Send `property_space_totals_changed` for the given property spaces.
+
+    Args:
+        property_space_ids (Iterable[int]): The affected property spaces.
+        years (Iterable[int]): The affected years, every year if None.
+        rollups_updated (bool): Whether the sender already updated the rollup table.
+    """
+    property_space_ids = set(property_space_ids)
+    if not property_space_ids:
+        return
+    property_space_totals_changed.send(
+        sender=PropertySpace,
+        property_space_ids=property_space_ids,
+        years=None if years is None else set(years),
+        rollups_updated=rollups_updated,
+    )
+
+
+def notify_meters_changed(meter_ids: Iterable[int], property_space_ids: Iterable[int] = (), years: Iterable[int] = ()) -> None:
+    """
+    Send `property_space_totals_changed` for the property spaces linked to the given meters.
+    Changing the links of a meter changes the share of every unit linked to it,
+    so every property space linked to the meter is affected.
+
+    Args:
+        meter_ids (Iterable[int]): The changed meters.
+        property_space_ids (Iterable[int]): Extra affected property spaces, e.g. the ones a meter was unlinked from.
+        years (Iterable[int]): Extra affected years, e.g. the years a meter was moved from.
+    """
+    meter_ids = list(meter_ids)
+    property_space_ids = set(property_space_ids)
+    years = set(years)
+    property_space_ids.update(
+        MeterDataUnitSpace.objects
+        .filter(meterdata_id__in=meter_ids)
+        .values_list("unitspace__property_space_id", flat=True)
+    )
+    for start, end in MeterData.objects.filter(id__in=meter_ids).values_list(
+        "measurement_start_date", "measurement_end_date"
+    ):
+        years.update(meter_years(start, end))
+    notify_property_spaces_changed(property_space_ids, years)
+
+
+def _property_space_ids_being_deleted(origin) -> Set[int]:
+    """
+    Return the property spaces deleted by the deletion that triggered a cascade.
+    """
+    if isinstance(origin, PropertySpace):
+        return {origin.pk}
+    if isinstance(origin, QuerySet) and origin.model is PropertySpace:
+        return set(origin.values_list("id", flat=True))
+    if isinstance(origin, Address):
+        return set(PropertySpace.objects.filter(address_id=origin.pk).values_list("id", flat=True))
+    return set()
+
+
+@receiver(pre_save, sender=MeterData)
+def _capture_meter_data_years(sender, instance, raw=False, **kwargs):
+    instance._previous_years = set()
+    if raw or instance.pk is None:
+        return
+    previous = MeterData.objects.filter(pk=instance.pk).values(
+        "measurement_start_date", "measurement_end_date"
+    ).first()
+    if previous:
+        instance._previous_years = meter_years(
+            previous["measurement_start_date"], previous["measurement_end_date"]
+        )
+
+
+def _refresh_instance_share(meter: MeterData) -> None:
+    """
+    Refresh the stored share of a meter and of the instance in memory,
+    so that a later save() of the instance does not write a stale share back.
+    """
+    refresh_meter_shares([meter.pk])
+    meter.share_count, meter.share_reading = (
+        MeterData.objects.filter(pk=meter.pk).values_list("share_count", "share_reading").get()
+    )
+
+
+@receiver(post_save, sender=MeterData)
+def _meter_data_saved(sender, instance, created, raw=False, **kwargs):
+    # A new meter has no unit yet, its links are handled by `_meter_links_changed`.
+    if raw or created:
+        return
+    _refresh_instance_share(instance)
+    notify_meters_changed([instance.pk], years=getattr(instance, "_previous_years", ()))
+
+
+@receiver(pre_delete, sender=MeterData)
+def _capture_meter_data_links(sender, instance, **kwargs):
+    instance._previous_property_space_ids = set(
+        instance.unit_space.values_list("property_space_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=MeterData)
+def _meter_data_deleted(sender, instance, **kwargs):
+    notify_property_spaces_changed(
+        getattr(instance, "_previous_property_space_ids", ()),
+        meter_years(instance.measurement_start_date, instance.measurement_end_date),
+    )
+
+
+@receiver(m2m_changed, sender=MeterDataUnitSpace)
+def _meter_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # The cleared links are gone once post_clear is sent, remember them beforehand.
+        if reverse:
+            instance._cleared_meter_ids = set(instance.meterdata_set.values_list("id", flat=True))
+        else:
+            instance._cleared_property_space_ids = set(
+                instance.unit_space.values_list("property_space_id", flat=True)
+            )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if reverse:
+        # `instance` is a UnitSpace, `pk_set` holds MeterData ids.
+        meter_ids = instance._cleared_meter_ids if action == "post_clear" else pk_set
+        refresh_meter_shares(meter_ids)
+        notify_meters_changed(meter_ids, property_space_ids=[instance.property_space_id])
+    else:
+        # `instance` is a MeterData, `pk_set` holds UnitSpace ids.
+        if action == "post_clear":
+            property_space_ids = instance._cleared_property_space_ids
+        else:
+            property_space_ids = UnitSpace.objects.filter(id__in=pk_set).values_list("property_space_id", flat=True)
+        _refresh_instance_share(instance)
+        notify_meters_changed([instance.pk], property_space_ids=property_space_ids)
+
+
+@receiver(pre_save, sender=UnitSpace)
+def _capture_unit_space_property(sender, instance, raw=False, **kwargs):
+    instance._previous_property_space_id = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_property_space_id = (
+        UnitSpace.objects.filter(pk=instance.pk).values_list("property_space_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=UnitSpace)
+def _unit_space_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    property_space_ids = {instance.property_space_id}
+    if getattr(instance, "_previous_property_space_id", None):
+        property_space_ids.add(instance._previous_property_space_id)
+    if created or property_space_ids == {instance.property_space_id}:
+        # Only the area and the number of units changed.
+        notify_property_spaces_changed(property_space_ids)
+    else:
+        # The unit moved to another property space along with its meters.
+        notify_meters_changed(
+            instance.meterdata_set.values_list("id", flat=True),
+            property_space_ids=property_space_ids,
+        )
+        # The area and the number of units of both property spaces changed for every year.
+        notify_property_spaces_changed(property_space_ids)
+
+
+@receiver(pre_delete, sender=UnitSpace)
+def _capture_unit_space_meters(sender, instance, **kwargs):
+    instance._previous_meter_ids = set(instance.meterdata_set.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=UnitSpace)
+def _unit_space_deleted(sender, instance, origin=None, **kwargs):
+    # The links of the unit are deleted with it, the meters it shared are now divided between fewer units.
+    deleted_property_space_ids = _property_space_ids_being_deleted(origin)
+    property_space_ids = {instance.property_space_id} - deleted_property_space_ids
+    meter_ids = getattr(instance, "_previous_meter_ids", set())
+    if meter_ids:
+        refresh_meter_shares(meter_ids)
+        property_space_ids.update(
+            MeterDataUnitSpace.objects
+            .filter(meterdata_id__in=meter_ids)
+            .exclude(unitspace__property_space_id__in=deleted_property_space_ids)
+            .values_list("unitspace__property_space_id", flat=True)
+        )
+    notify_property_spaces_changed(property_space_ids)
+
+
+@receiver(property_space_totals_changed)
+def _refresh_rollups_on_change(sender, property_space_ids, years, rollups_updated=False, **kwargs):
+    if not rollups_updated:
+        refresh_rollups(property_space_ids, years)
+
+
+def _invalidate_cached_responses(property_space_ids: Iterable[int], years: Iterable[int] = None) -> None:
+    property_space_ids = set(property_space_ids)
+    years = None if years is None else set(years)
+    invalidate_property_spaces(property_space_ids, years)
+    # A request running before the commit may cache the old values again, invalidate once more after it.
+    transaction.on_commit(lambda: invalidate_property_spaces(property_space_ids, years))
+
+
+@receiver(property_space_totals_changed)
+def _invalidate_cache_on_change(sender, property_space_ids, years, **kwargs):
+    _invalidate_cached_responses(property_space_ids, years)
+
+
+@receiver(property_space_totals_changed)
+def _touch_on_change(sender, property_space_ids, **kwargs):
+    touch_property_spaces(property_space_ids)
+
+
+@receiver(pre_save, sender=PropertySpace)
+def _take_property_space_change_seq(sender, instance, raw=False, **kwargs):
+    # Saved with the row, instead of a second update.
+    if not raw:
+        instance.change_seq = next_change_seq()
+
+
+@receiver(post_save, sender=PropertySpace)
+@receiver(post_delete, sender=PropertySpace)
+def _property_space_changed(sender, instance, **kwargs):
+    _invalidate_cached_responses([instance.pk])
+
+
+@receiver(post_delete, sender=PropertySpace)
+def _property_space_deleted(sender, instance, **kwargs):
+    record_tombstones([instance.pk])
+
+
+@receiver(post_save, sender=Address)
+def _address_changed(sender, instance, created=False, raw=False, **kwargs):
+    # A new address has no property space yet.
+    if raw or created:
+        return
+    property_space_ids = set(PropertySpace.objects.filter(address_id=instance.pk).values_list("id", flat=True))
+    _invalidate_cached_responses(property_space_ids)
+    touch_property_spaces(property_space_ids)
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def _api_key_changed(sender, instance, **kwargs):
+    forget_api_key(instance.key_hash)
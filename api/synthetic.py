@@ -0,0 +1,144 @@
+# Description: Deterministic synthetic dataset for load testing and benchmarks.
+# The same arguments and seed always produce the same property spaces, units and
+# readings, so benchmark runs on an empty database can be compared with each other.
+# Rows are written with `bulk_create`, bypassing the model signals, and the stored
+# aggregates are computed once at the end.
+
+import random
+from datetime import datetime, timedelta
+from typing import Callable, List
+from django.db import transaction
+from django.utils import timezone
+from api.models import Address, MeterData, MeterDataUnitSpace, PropertySpace, UnitSpace
+from api.rollups import REBUILD_BATCH_SIZE, refresh_rollups
+from api.shares import set_new_meter_share
+from api.signals import notify_property_spaces_changed
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+GENERATE_BATCH_SIZE = 5000
+
+# (city, state, country) of the generated addresses.
+LOCATIONS = [
+    ("San Francisco", "CA", "USA"),
+    ("Los Angeles", "CA", "USA"),
+    ("Seattle", "WA", "USA"),
+    ("New York", "NY", "USA"),
+    ("Austin", "TX", "USA"),
+    ("Chicago", "IL", "USA"),
+    ("Toronto", "ON", "Canada"),
+    ("Vancouver", "BC", "Canada"),
+]
+
+UNIT_TYPES = [unit_type for unit_type, _ in UnitSpace.UNIT_TYPE_CHOICES]
+
+
+def generate_synthetic_data(
+    properties: int,
+    units_per_property: int = 4,
+    readings: int = 1000,
+    shared_fraction: float = 0.1,
+    seed: int = 0,
+    start_year: int = 2020,
+    years: int = 5,
+    batch_size: int = GENERATE_BATCH_SIZE,
+    progress: Callable[[int], None] = None,
+) -> dict:
+    """
+    Create property spaces with their addresses and units, and meter readings linked to the units.
+    Returns the number of created rows per model.
+
+    Args:
+        properties (int): The number of property spaces.
+        units_per_property (int): The number of unit spaces per property space.
+        readings (int): The number of meter readings.
+        shared_fraction (float): The fraction of the readings shared between 2 or 3 unit spaces.
+        seed (int): The seed of the random generator.
+        start_year (int): The first year of the readings.
+        years (int): The number of years the readings are spread over.
+        batch_size (int): The number of rows per INSERT statement and per transaction for the readings.
+        progress (Callable[[int], None]): Called with the number of readings created after each batch.
+    """
+    rng = random.Random(seed)
+
+    with transaction.atomic():
+        addresses = Address.objects.bulk_create([
+            Address(
+                street=f"{rng.randint(1, 9999)} Synthetic St",
+                city=city,
+                state=state,
+                country=country,
+                postal_code=f"{rng.randint(10000, 99999)}",
+            )
+            for city, state, country in (rng.choice(LOCATIONS) for _ in range(properties))
+        ], batch_size=batch_size)
+        property_spaces = PropertySpace.objects.bulk_create([
+            PropertySpace(address=address, name=f"synthetic property space {seed}-{index}")
+            for index, address in enumerate(addresses)
+        ], batch_size=batch_size)
+        unit_spaces = UnitSpace.objects.bulk_create([
+            UnitSpace(
+                name=f"unit space {index}",
+                unit_type=rng.choice(UNIT_TYPES),
+                area=float(rng.randrange(100, 5000, 50)),
+                property_space=property_space,
+            )
+            for property_space in property_spaces
+            for index in range(units_per_property)
+        ], batch_size=batch_size)
+    unit_ids = [unit_space.id for unit_space in unit_spaces]
+
+    first_day = timezone.make_aware(datetime(start_year, 1, 1))
+    days = (timezone.make_aware(datetime(start_year + years, 1, 1)) - first_day).days
+    links = 0
+    for batch_start in range(0, readings if unit_ids else 0, batch_size):
+        meters: List[MeterData] = []
+        meter_unit_ids: List[List[int]] = []
+        for index in range(batch_start, min(batch_start + batch_size, readings)):
+            if rng.random() < shared_fraction:
+                linked_units = rng.sample(unit_ids, min(len(unit_ids), rng.choice([2, 3])))
+            else:
+                linked_units = [rng.choice(unit_ids)]
+            start = first_day + timedelta(days=rng.randrange(days - 31))
+            meters.append(MeterData(
+                meter_number=f"SYN-{seed}-{index:08d}",
+                meter_provider_name=f"provider {index % 20}",
+                meter_source="synthetic",
+                measurement_reading=round(rng.uniform(10, 10000), 2),
+                measurement_unit="kWh",
+                measurement_start_date=start,
+                measurement_end_date=start + timedelta(days=rng.randint(27, 30), hours=23, minutes=59),
+            ))
+            set_new_meter_share(meters[-1], len(linked_units))
+            meter_unit_ids.append(linked_units)
+
+        with transaction.atomic():
+            MeterData.objects.bulk_create(meters, batch_size=batch_size)
+            through = [
+                MeterDataUnitSpace(meterdata_id=meter.id, unitspace_id=unit_id)
+                for meter, linked_units in zip(meters, meter_unit_ids)
+                for unit_id in linked_units
+            ]
+            MeterDataUnitSpace.objects.bulk_create(through, batch_size=batch_size)
+        links += len(through)
+        if progress:
+            progress(batch_start + len(meters))
+
+    # bulk_create bypasses the model signals, the stored aggregates are computed explicitly.
+    # The readings are only linked to the new units, so no other property space is affected.
+    property_space_ids = [property_space.id for property_space in property_spaces]
+    for start in range(0, len(property_space_ids), REBUILD_BATCH_SIZE):
+        refresh_rollups(property_space_ids[start:start + REBUILD_BATCH_SIZE])
+    notify_property_spaces_changed(property_space_ids, rollups_updated=True)
+
+    counts = {
+        "addresses": len(addresses),
+        "property_spaces": len(property_spaces),
+        "unit_spaces": len(unit_spaces),
+        "meter_readings": readings if unit_ids else 0,
+        "meter_links": links,
+    }
+    logger.info(f"Generated synthetic data: {counts}")
+    return counts
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+from unittest import skipUnless
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from api.aggregations import annotate_property_space_totals, meter_year_filter
+from api.rollups import check_rollup_consistency
+from api.models import Address, PropertySpace, UnitSpace, MeterData, MeterDataUnitSpace
+import os
+import random
+
+
+def _python_totals(property_space, year=None):
+    """
+    Reference implementation walking every unit and meter in Python.
+    """
+    units = list(property_space.unitspace_set.all())
+    total_consumption = 0
+    for unit in units:
+        for meter in unit.meterdata_set.all():
+            if year is not None \
+                and meter.measurement_start_date.year != year \
+                and meter.measurement_end_date.year != year:
+                continue
+            total_consumption += meter.measurement_reading / meter.unit_space.count()
+    return {
+        "number_of_units": len(units),
+        "total_area": sum(unit.area for unit in units),
+        "total_consumption": total_consumption,
+    }
+
+
+class AggregationsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        units = []
+        for i in range(40):
+            address = Address.objects.create(
+                street=f"{i} Synthetic St", city="Oakland", state="CA", country="USA", postal_code="94607"
+            )
+            property_space = PropertySpace.objects.create(address=address, name=f"synthetic {i}")
+            # Some properties have no units at all.
+            for j in range(rng.randint(0, 4)):
+                units.append(UnitSpace.objects.create(
+                    name=f"unit {i}-{j}", area=rng.randint(100, 5000), property_space=property_space
+                ))
+
+        for i in range(400):
+            year = rng.randint(2019, 2023)
+            end_year = year + (1 if rng.random() < 0.1 else 0)
+            meter = MeterData.objects.create(
+                meter_number=str(i),
+                meter_provider_name="provider",
+                meter_source="source",
+                measurement_reading=rng.uniform(1, 10000),
+                measurement_start_date=datetime(year, rng.randint(1, 12), 1, tzinfo=timezone.utc),
+                measurement_end_date=datetime(end_year, 12, 31, tzinfo=timezone.utc),
+            )
+            # A fraction of the meters are shared between units, possibly across properties.
+            meter.unit_space.add(*rng.sample(units, 3 if rng.random() < 0.2 else 1))
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def test_totals_match_python_computation(self):
+        for year in [None, 2019, 2021, 2024]:
+            annotated = annotate_property_space_totals(PropertySpace.objects.order_by("id"), year)
+            for property_space in annotated:
+                expected = _python_totals(property_space, year)
+                self.assertEqual(property_space.number_of_units, expected["number_of_units"])
+                self.assertAlmostEqual(property_space.total_area, expected["total_area"])
+                self.assertAlmostEqual(property_space.total_consumption, expected["total_consumption"], places=6)
+
+    def test_rollups_match_totals(self):
+        self.assertEqual(check_rollup_consistency(), [])
+        for year in [2019, 2021, 2024]:
+            annotated = annotate_property_space_totals(PropertySpace.objects.order_by("id"), year)
+            from_rollup = annotate_property_space_totals(PropertySpace.objects.order_by("id"), year, use_rollup=True)
+            for live, rollup in zip(annotated, from_rollup):
+                self.assertAlmostEqual(live.total_consumption, rollup.total_consumption, places=6)
+
+    def test_list_runs_in_constant_number_of_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/property-spaces?year=2021')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 40)
+
+    def test_detail_runs_in_one_query(self):
+        property_space = PropertySpace.objects.order_by("id").first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/property-spaces/{property_space.id}')
+        self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', "The query plans are checked on SQLite")
+class IndexUsageTestCase(TestCase):
+
+    def test_year_filter_uses_date_indexes(self):
+        plan = MeterData.objects.filter(meter_year_filter(2022)).explain()
+        self.assertIn("USING INDEX meterdata_start_end_idx", plan)
+        self.assertIn("USING INDEX meterdata_end_idx", plan)
+
+    def test_totals_join_uses_link_index(self):
+        plan = annotate_property_space_totals(PropertySpace.objects.all(), 2022).explain()
+        self.assertIn("USING COVERING INDEX meterdata_unitspace_unit_idx", plan)
+        links_plan = MeterDataUnitSpace.objects.filter(unitspace_id=1).values("meterdata_id").explain()
+        self.assertIn("USING COVERING INDEX meterdata_unitspace_unit_idx", links_plan)
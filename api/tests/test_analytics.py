@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.analytics import intensity_ranking, portfolio_groups
+from api.models import Address, PropertySpace
+import os
+
+
+class PortfolioAnalyticsTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        Address.objects.filter(id=3).update(city="Seattle", state="WA")
+        return super().setUp()
+
+    def _summary(self, groups):
+        return [
+            (tuple(group['group'].values()), group['property_count'], group['unit_count'],
+             group['total_area'], group['total_consumption'], group['intensity'])
+            for group in groups
+        ]
+
+    def test_groups_by_location(self):
+        self.assertEqual(self._summary(portfolio_groups("city")), [
+            (("San Francisco", "CA", "USA"), 2, 4, 10000, 13000, 1.3),
+            (("Seattle", "WA", "USA"), 1, 1, 5000, 8000, 1.6),
+        ])
+        self.assertEqual(self._summary(portfolio_groups("state", 2022)), [
+            (("CA", "USA"), 2, 4, 10000, 8000, 0.8),
+            (("WA", "USA"), 1, 1, 5000, 3000, 0.6),
+        ])
+        self.assertEqual(self._summary(portfolio_groups("country")), [(("USA",), 3, 5, 15000, 21000, 1.4)])
+        self.assertEqual(portfolio_groups("city")[0]['group'], {"city": "San Francisco", "state": "CA", "country": "USA"})
+
+    def test_groups_by_unit_type(self):
+        self.assertEqual(self._summary(portfolio_groups("unit_type")), [
+            (("COMMON_AREA",), 3, 3, 10000, 16000, 1.6),
+            (("LEASED",), 1, 1, 3000, 3000, 1.0),
+            (("VACANT",), 1, 1, 2000, 2000, 1.0),
+        ])
+        self.assertEqual(
+            [group['total_consumption'] for group in portfolio_groups("unit_type", 2022)],
+            [6000, 3000, 2000],
+        )
+
+    def test_group_without_area(self):
+        address = Address.objects.create(street="1 Empty St", city="Toronto", state="ON", country="Canada", postal_code="M5V")
+        PropertySpace.objects.create(name="empty", address=address)
+        groups = portfolio_groups("country")
+        self.assertEqual(self._summary(groups)[0], (("Canada",), 1, 0, 0, 0, None))
+
+    def test_intensity_ranking(self):
+        address = Address.objects.create(street="1 Empty St", city="Toronto", state="ON", country="Canada", postal_code="M5V")
+        PropertySpace.objects.create(name="empty", address=address)
+        ranking = intensity_ranking()
+        self.assertEqual([(item['rank'], item['id'], item['intensity']) for item in ranking], [(1, 2, 1.75), (2, 3, 1.6), (3, 1, 1.0)])
+        self.assertEqual(ranking[1]['city'], "Seattle")
+        self.assertEqual([item['id'] for item in intensity_ranking(2022, limit=2)], [1, 2])
+
+    def test_single_query(self):
+        for group_by in ["city", "state", "country", "unit_type"]:
+            for year in [None, 2022]:
+                with CaptureQueriesContext(connection) as queries:
+                    portfolio_groups(group_by, year)
+                self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            intensity_ranking(2022)
+        self.assertEqual(len(queries), 1)
+
+    def test_endpoints(self):
+        response = self.client.get('/api/v1/analytics/portfolio?group_by=country&year=2022')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "group_by": "country",
+            "year": 2022,
+            "consumption_unit": "kWh",
+            "groups": [{
+                "group": {"country": "USA"},
+                "property_count": 3,
+                "unit_count": 5,
+                "total_area": 15000,
+                "total_consumption": 11000,
+                "intensity": 11000 / 15000,
+            }],
+        })
+        response = self.client.get('/api/v1/analytics/intensity-ranking?limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['property_spaces'][0]['name'], "property space 2")
+        self.assertEqual(self.client.get('/api/v1/analytics/portfolio?group_by=street').status_code, 422)
+        self.assertEqual(self.client.get('/api/v1/analytics/intensity-ranking?limit=0').status_code, 422)
@@ -1,5 +1,8 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
-from api.models import PropertySpace
+from django.test.utils import CaptureQueriesContext
+from api.models import Address, PropertySpace
 import os
 import json
 
@@ -8,6 +11,8 @@ class ApiV1TestCase(TestCase):
 
     def setUp(self) -> None:
         self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        # The cached responses outlive the test transactions.
+        cache.clear()
         return super().setUp()
 
     def test_get_property_space_detail(self):
@@ -81,6 +86,78 @@ class ApiV1TestCase(TestCase):
         self.assertEqual(response.json()[1]['total_consumption'], 0)
         self.assertEqual(response.json()[2]['total_consumption'], 5000)
     
+    def test_get_property_spaces_paginated(self):
+        response = self.client.get('/api/v1/property-spaces?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()], ["property space 1", "property space 2"])
+        next_cursor = response['X-Next-Cursor']
+        response = self.client.get(f'/api/v1/property-spaces?limit=2&cursor={next_cursor}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()], ["property space 3"])
+        self.assertEqual(response.json()[0]['total_consumption'], 8000)
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+    def test_get_property_spaces_paginated_with_envelope(self):
+        response = self.client.get('/api/v1/property-spaces?limit=2&envelope=true')
+        self.assertEqual([item['name'] for item in response.json()['property_spaces']], ["property space 1", "property space 2"])
+        self.assertEqual(response.json()['next_cursor'], response['X-Next-Cursor'])
+        response = self.client.get(f"/api/v1/property-spaces?limit=2&envelope=true&cursor={response.json()['next_cursor']}")
+        self.assertEqual([item['name'] for item in response.json()['property_spaces']], ["property space 3"])
+        self.assertIsNone(response.json()['next_cursor'])
+        # The plain list of the same page is cached apart.
+        self.assertEqual(len(self.client.get('/api/v1/property-spaces?limit=2').json()), 2)
+
+    def test_get_property_spaces_paginated_with_year(self):
+        response = self.client.get('/api/v1/property-spaces?limit=1&year=2022')
+        next_cursor = response['X-Next-Cursor']
+        response = self.client.get(f'/api/v1/property-spaces?limit=1&year=2022&cursor={next_cursor}')
+        self.assertEqual(response.json()[0]['name'], "property space 2")
+        self.assertEqual(response.json()[0]['total_consumption'], 3000)
+
+    def test_get_property_spaces_paginated_uses_keyset(self):
+        next_cursor = self.client.get('/api/v1/property-spaces?limit=1')['X-Next-Cursor']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/v1/property-spaces?limit=1&cursor={next_cursor}')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"api_propertyspace"."id" > 1', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_get_property_spaces_with_invalid_cursor(self):
+        response = self.client.get('/api/v1/property-spaces?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_property_spaces_with_invalid_limit(self):
+        response = self.client.get('/api/v1/property-spaces?limit=0')
+        self.assertEqual(response.status_code, 422)
+
+    def test_export_property_spaces(self):
+        response = self.client.get('/api/v1/property-spaces/export?year=2022')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['name'] for record in records],
+                         ["property space 1", "property space 2", "property space 3"])
+        self.assertEqual([record['total_consumption'] for record in records], [5000, 3000, 3000])
+        self.assertEqual(records[0]['address']['street'], "123 Main St")
+
+    def test_export_property_spaces_streams_in_batches(self):
+        for i in range(7):
+            address = Address.objects.create(street=f"{i} Export St", city="Oakland",
+                                             state="CA", country="USA", postal_code="94607")
+            PropertySpace.objects.create(address=address, name=f"export {i}")
+        response = self.client.get('/api/v1/property-spaces/export?batch_size=2')
+        content = iter(response.streaming_content)
+        # The first record is sent once the first batch is read, before the rest of the dataset.
+        with CaptureQueriesContext(connection) as queries:
+            first_line = next(content)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(json.loads(first_line)['name'], "property space 1")
+        with CaptureQueriesContext(connection) as queries:
+            remaining_lines = list(content)
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(len(remaining_lines), 9)
+
     def test_post_property_space(self):
         response = self.client.post('/api/v1/property-spaces',
                                     data=json.dumps({
@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.test import TestCase
+import os
+
+
+class ApiV1AsyncTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.auth_headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        cache.clear()
+        return super().setUp()
+
+    async def _compare_with_sync(self, path):
+        response = await self.async_client.get(f'/api/v1/async/{path}', headers=self.auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        cache.clear()
+        sync_response = await self.async_client.get(f'/api/v1/{path}', headers=self.auth_headers)
+        self.assertEqual(response.content, sync_response.content)
+        self.assertEqual(response.get('X-Next-Cursor'), sync_response.get('X-Next-Cursor'))
+        return response
+
+    async def test_get_property_space_detail(self):
+        response = await self._compare_with_sync('property-spaces/1')
+        self.assertEqual(response.json()['total_consumption'], 6000)
+        response = await self._compare_with_sync('property-spaces/1?year=2022')
+        self.assertEqual(response.json()['total_consumption'], 5000)
+
+    async def test_get_property_space_not_found(self):
+        response = await self.async_client.get('/api/v1/async/property-spaces/999', headers=self.auth_headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_get_property_spaces(self):
+        response = await self._compare_with_sync('property-spaces?year=2022')
+        self.assertEqual([item['total_consumption'] for item in response.json()], [5000, 3000, 3000])
+        response = await self._compare_with_sync('property-spaces?limit=2')
+        next_page = await self._compare_with_sync(f"property-spaces?limit=2&cursor={response['X-Next-Cursor']}")
+        self.assertEqual([item['name'] for item in next_page.json()], ["property space 3"])
+        response = await self._compare_with_sync('property-spaces?limit=2&envelope=true')
+        self.assertEqual(response.json()['next_cursor'], response['X-Next-Cursor'])
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get('/api/v1/async/property-spaces?cursor=invalid', headers=self.auth_headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get('/api/v1/async/property-spaces/1')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_shares_cache_with_sync_endpoints(self):
+        await self.async_client.get('/api/v1/property-spaces/1', headers=self.auth_headers)
+        response = await self.async_client.get('/api/v1/async/property-spaces/1', headers=self.auth_headers)
+        self.assertEqual(response['X-Cache'], 'HIT')
@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from api.auth import authenticate_api_key, clear_api_key_cache, create_api_key, hash_key
+from api.models import ApiKey
+from api.rate_limit import count_request
+import os
+import threading
+
+
+class ApiKeyTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        cache.clear()
+        clear_api_key_cache()
+        self.api_key, self.key = create_api_key("client")
+        return super().setUp()
+
+    def _get(self, path, key):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_AUTHORIZATION=f'Bearer {key}')
+        return response, len(queries)
+
+    def test_only_the_hash_is_stored(self):
+        self.assertEqual(self.api_key.key_hash, hash_key(self.key))
+        self.assertEqual(self.api_key.prefix, self.key[:8])
+        self.assertFalse(ApiKey.objects.filter(key_hash=self.key).exists())
+
+    def test_lookup_is_cached(self):
+        response, queries = self._get('/api/v1/cache-stats', self.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 1)
+        response, queries = self._get('/api/v1/cache-stats', self.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+
+    def test_unknown_keys_are_cached(self):
+        response, queries = self._get('/api/v1/cache-stats', 'unknown')
+        self.assertEqual((response.status_code, queries), (401, 1))
+        response, queries = self._get('/api/v1/cache-stats', 'unknown')
+        self.assertEqual((response.status_code, queries), (401, 0))
+
+    @override_settings(API_KEY_CACHE_TTL=0)
+    def test_without_cache(self):
+        self._get('/api/v1/cache-stats', self.key)
+        self.assertEqual(self._get('/api/v1/cache-stats', self.key)[1], 1)
+
+    def test_revoked_key(self):
+        self._get('/api/v1/cache-stats', self.key)
+        self.api_key.is_active = False
+        self.api_key.save()
+        self.assertEqual(self._get('/api/v1/cache-stats', self.key)[0].status_code, 401)
+
+    def test_environment_token(self):
+        identity = authenticate_api_key(os.getenv('AUTH_TOKEN'))
+        self.assertEqual(identity.id, "env")
+        self.assertIsNone(authenticate_api_key('Bearer'))
+        with override_settings(AUTH_TOKEN=None):
+            self.assertIsNone(authenticate_api_key(os.getenv('AUTH_TOKEN')))
+
+    async def test_async_endpoint(self):
+        response = await self.async_client.get(
+            '/api/v1/async/property-spaces/1', headers={'Authorization': f'Bearer {self.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get('/api/v1/async/property-spaces/1', headers={'Authorization': 'Bearer unknown'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_create_api_key_command(self):
+        out = StringIO()
+        call_command('create_api_key', 'command client', '--rate-limit', '10', stdout=out)
+        key = out.getvalue().splitlines()[-1]
+        identity = authenticate_api_key(key)
+        self.assertEqual((identity.name, identity.rate_limit_per_minute), ('command client', 10))
+
+
+class RateLimitTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        cache.clear()
+        clear_api_key_cache()
+        self.api_key, self.key = create_api_key("client", rate_limit_per_minute=60, rate_limit_burst=2)
+        # One second before the end of a window of 2 seconds.
+        now = mock.patch('api.rate_limit.time.time', return_value=1001.0)
+        self.now = now.start()
+        self.addCleanup(now.stop)
+        return super().setUp()
+
+    def _get(self, key=None):
+        return self.client.get('/api/v1/cache-stats', HTTP_AUTHORIZATION=f'Bearer {key or self.key}')
+
+    def test_fixed_window(self):
+        # 2 requests per window of 2 seconds.
+        self.now.return_value = 1000.0
+        self.assertEqual(count_request("client", 60, 2), 0)
+        self.assertEqual(count_request("client", 60, 2), 0)
+        self.assertAlmostEqual(count_request("client", 60, 2), 2.0)
+        self.now.return_value = 1001.5
+        self.assertAlmostEqual(count_request("client", 60, 2), 0.5)
+        self.now.return_value = 1002.0
+        self.assertEqual(count_request("client", 60, 2), 0)
+        self.now.return_value = 1100.0
+        self.assertEqual(count_request("client", 60, 2), 0)
+        self.assertEqual(count_request("client", 60, 2), 0)
+        self.assertGreater(count_request("client", 60, 2), 0)
+
+    def test_fixed_window_boundary(self):
+        # Twice the burst passes around the boundary of two windows.
+        self.now.return_value = 1003.9
+        self.assertEqual([count_request("client", 60, 2) for _ in range(2)], [0, 0])
+        self.now.return_value = 1004.0
+        self.assertEqual([count_request("client", 60, 2) for _ in range(2)], [0, 0])
+
+    def test_concurrent_requests(self):
+        # The count is incremented atomically: no more than `burst` concurrent requests pass.
+        barrier = threading.Barrier(20)
+
+        def take():
+            barrier.wait()
+            return count_request("concurrent", 60, 5)
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(lambda _: take(), range(20)))
+        self.assertEqual(results.count(0), 5)
+
+    def test_over_limit_returns_429(self):
+        self.assertEqual(self._get().status_code, 200)
+        self.assertEqual(self._get().status_code, 200)
+        response = self._get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertIn('Rate limit', response.json()['message'])
+
+    def test_limits_are_per_key(self):
+        _, other_key = create_api_key("other", rate_limit_per_minute=60, rate_limit_burst=2)
+        self._get()
+        self._get()
+        self.assertEqual(self._get().status_code, 429)
+        self.assertEqual(self._get(other_key).status_code, 200)
+
+    async def test_async_over_limit(self):
+        headers = {'Authorization': f'Bearer {self.key}'}
+        for _ in range(2):
+            await self.async_client.get('/api/v1/async/property-spaces/1', headers=headers)
+        response = await self.async_client.get('/api/v1/async/property-spaces/1', headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
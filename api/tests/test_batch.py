@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import Address, PropertySpace
+import os
+
+
+class PropertySpacesBatchTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _batch(self, **params):
+        response = self.client.get('/api/v1/property-spaces/batch', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_request_order_and_not_found(self):
+        results = self._batch(ids="3,999,1,3")
+        self.assertEqual([(item['id'], item['found']) for item in results], [(3, True), (999, False), (1, True), (3, True)])
+        self.assertIsNone(results[1]['property_space'])
+        # The same output as the detail endpoint.
+        self.assertEqual(results[0]['property_space'], self.client.get('/api/v1/property-spaces/3').json())
+        self.assertEqual(results[2]['property_space']['total_consumption'], 6000)
+
+    def test_year_fields_and_unit(self):
+        results = self._batch(ids="1,2", year=2022, fields="name,total_consumption")
+        self.assertEqual(
+            [item['property_space'] for item in results],
+            [
+                {"name": "property space 1", "total_consumption": 5000.0},
+                {"name": "property space 2", "total_consumption": 3000.0},
+            ],
+        )
+        results = self._batch(ids="1", unit="therms")
+        self.assertEqual(results[0]['property_space']['consumption_unit'], "therms")
+
+    def test_constant_queries(self):
+        PropertySpace.objects.bulk_create([
+            PropertySpace(
+                name=f"extra {i}",
+                address=Address.objects.create(street="1 Main St", city="Oakland", state="CA", country="USA", postal_code="94607"),
+            )
+            for i in range(50)
+        ])
+        ids = ",".join(str(property_space_id) for property_space_id in PropertySpace.objects.values_list("id", flat=True))
+        for requested in ["1", ids, "2022"]:
+            with CaptureQueriesContext(connection) as queries:
+                self._batch(ids=requested, year=2022)
+            self.assertEqual(len(queries), 1)
+
+    def test_invalid_ids(self):
+        for ids in ["", "1,a", ",".join(["1"] * 1001)]:
+            response = self.client.get('/api/v1/property-spaces/batch', {"ids": ids})
+            self.assertEqual(response.status_code, 400)
+
+    async def test_async(self):
+        headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        response = await self.async_client.get('/api/v1/async/property-spaces/batch?ids=2,999&year=2022', headers=headers)
+        sync_response = await self.async_client.get('/api/v1/property-spaces/batch?ids=2,999&year=2022', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, sync_response.content)
@@ -0,0 +1,38 @@
+import json
+from django.test import TestCase
+from api.benchmarks import compare_reports, run_endpoint_benchmarks
+from api.models import PropertySpace
+
+
+class BenchmarkSuiteTestCase(TestCase):
+
+    def test_report(self):
+        report = run_endpoint_benchmarks(sizes=[200], iterations=2)
+        json.dumps(report)
+        size = report["sizes"]["200"]
+        self.assertEqual(size["dataset"]["meter_readings"], 200)
+        self.assertIn("export_property_spaces", size["endpoints"])
+        self.assertIn("bulk_create_meter_data", size["endpoints"])
+        for name in ["get_property_space_consumption", "portfolio_totals", "property_space_changes",
+                     "get_property_spaces_batch", "bulk_delete_property_spaces", "submit_portfolio_report_job"]:
+            self.assertIn(name, size["endpoints"])
+        detail = size["endpoints"]["get_property_space_year"]
+        self.assertEqual(detail["queries"], 1)
+        self.assertLessEqual(detail["p50_ms"], detail["p95_ms"])
+        self.assertGreater(detail["peak_memory_kb"], 0)
+        # The dataset is rolled back after the run.
+        self.assertFalse(PropertySpace.objects.exists())
+
+    def test_compare_reports(self):
+        result = {"p95_ms": 10.0, "peak_memory_kb": 100.0, "queries": 1}
+        baseline = {"sizes": {"1000": {"endpoints": {"detail": result, "list": result}}}}
+        current = {"sizes": {"1000": {"endpoints": {
+            "detail": {"p95_ms": 11.0, "peak_memory_kb": 100.0, "queries": 1},
+            "list": {"p95_ms": 20.0, "peak_memory_kb": 100.0, "queries": 2},
+            "export": result,
+        }}}}
+        self.assertEqual(compare_reports(baseline, current), [
+            "1000 readings, list: p95_ms 10.0 -> 20.0",
+            "1000 readings, list: queries 1 -> 2",
+        ])
+        self.assertEqual(compare_reports(baseline, baseline), [])
@@ -0,0 +1,271 @@
+# Benchmarks are slow and machine dependent, they only run with RUN_BENCHMARKS=1:
+#   RUN_BENCHMARKS=1 python manage.py test api.tests.test_benchmarks
+from datetime import datetime, timedelta, timezone
+from unittest import skipUnless
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from api.aggregations import annotate_property_space_totals
+from api.analytics import portfolio_totals
+from api.columnar import get_snapshot, np, reset_snapshot
+from api.endpoints.api_v1 import PROPERTY_SPACE_FIELDS, _generate_property_space_dict, api_v1
+from api.deletion import delete_property_spaces
+from api.ingest import ingest_meter_readings
+from api.models import Address, MeterData, PropertySpace, UnitSpace
+from api.synthetic import generate_synthetic_data
+from api.tests.test_serialization import schema_dict
+import asyncio
+import json
+import os
+import random
+import time
+
+
+RUN_BENCHMARKS = bool(os.getenv('RUN_BENCHMARKS'))
+INGEST_TARGET_ROWS_PER_SECOND = float(os.getenv('INGEST_TARGET_ROWS_PER_SECOND', 10000))
+CONCURRENT_REQUESTS = 50
+
+
+def _create_units(number_of_properties, units_per_property):
+    addresses = Address.objects.bulk_create([
+        Address(street=f"{i} Bench St", city="Oakland", state="CA", country="USA", postal_code="94607")
+        for i in range(number_of_properties)
+    ])
+    property_spaces = PropertySpace.objects.bulk_create([
+        PropertySpace(address=address, name=f"bench {address.id}") for address in addresses
+    ])
+    return UnitSpace.objects.bulk_create([
+        UnitSpace(name=f"unit {j}", area=1000, property_space=property_space)
+        for property_space in property_spaces
+        for j in range(units_per_property)
+    ])
+
+
+@skipUnless(RUN_BENCHMARKS, "Set RUN_BENCHMARKS=1 to run the benchmarks")
+class IngestBenchmark(TestCase):
+
+    def test_ingest_throughput(self):
+        rng = random.Random(0)
+        unit_ids = [unit.id for unit in _create_units(200, 5)]
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        batch_size, batches = 5000, 10
+        elapsed = 0
+        for batch in range(batches):
+            readings = [
+                {
+                    "meter_number": f"{batch}-{i}",
+                    "meter_provider_name": "provider",
+                    "meter_source": "source",
+                    "measurement_reading": rng.uniform(1, 10000),
+                    "measurement_start_date": start + timedelta(days=i % 1000),
+                    "measurement_end_date": start + timedelta(days=i % 1000 + 30),
+                    "unit_space_ids": rng.sample(unit_ids, 2 if rng.random() < 0.1 else 1),
+                }
+                for i in range(batch_size)
+            ]
+            started = time.perf_counter()
+            result = ingest_meter_readings(readings)
+            elapsed += time.perf_counter() - started
+            self.assertEqual(result["created"], batch_size)
+        rows_per_second = batch_size * batches / elapsed
+        print(f"\ningest: {rows_per_second:.0f} rows/s")
+        self.assertGreater(rows_per_second, INGEST_TARGET_ROWS_PER_SECOND)
+
+
+def _create_readings(unit_ids, readings_per_unit, rng):
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    ingest_meter_readings([
+        {
+            "meter_number": f"{unit_id}-{i}",
+            "meter_provider_name": "provider",
+            "meter_source": "source",
+            "measurement_reading": rng.uniform(1, 10000),
+            "measurement_start_date": start + timedelta(days=30 * i),
+            "measurement_end_date": start + timedelta(days=30 * i + 29),
+            "unit_space_ids": [unit_id],
+        }
+        for unit_id in unit_ids
+        for i in range(readings_per_unit)
+    ])
+
+
+@skipUnless(RUN_BENCHMARKS, "Set RUN_BENCHMARKS=1 to run the benchmarks")
+class AsyncEndpointsBenchmark(TestCase):
+    """
+    Throughput of the sync and async read endpoints under the ASGI handler,
+    with CONCURRENT_REQUESTS requests in flight and the response cache cleared.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        units = _create_units(CONCURRENT_REQUESTS, 4)
+        _create_readings([unit.id for unit in units], 24, random.Random(0))
+        cls.property_space_ids = sorted({unit.property_space_id for unit in units})
+
+    async def _throughput(self, prefix, rounds=10):
+        headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        elapsed = 0
+        for round_number in range(rounds):
+            await cache.aclear()
+            year = 2020 + round_number % 2
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[
+                self.async_client.get(f'/api/v1/{prefix}property-spaces/{property_space_id}?year={year}', headers=headers)
+                for property_space_id in self.property_space_ids
+            ])
+            elapsed += time.perf_counter() - started
+            self.assertTrue(all(response.status_code == 200 for response in responses))
+        return len(self.property_space_ids) * rounds / elapsed
+
+    async def test_detail_throughput(self):
+        sync_rate = await self._throughput('')
+        async_rate = await self._throughput('async/')
+        print(f"\ndetail at {CONCURRENT_REQUESTS} concurrent requests: sync {sync_rate:.0f} req/s, async {async_rate:.0f} req/s")
+
+
+@skipUnless(RUN_BENCHMARKS, "Set RUN_BENCHMARKS=1 to run the benchmarks")
+class SerializationBenchmark(TestCase):
+    """
+    CPU time to render 10k property spaces, through the response schema and through the values() path.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_synthetic_data(properties=10000, units_per_property=2, readings=10000, seed=0)
+
+    def test_serialization_cpu_per_10k_properties(self):
+        request = RequestFactory().get('/')
+        queryset = annotate_property_space_totals(PropertySpace.objects.order_by("id"), 2022)
+
+        started = time.process_time()
+        property_spaces = list(queryset.select_related("address"))
+        schema_content = api_v1.create_response(
+            request, [schema_dict(property_space).model_dump() for property_space in property_spaces], status=200
+        ).content
+        schema_cpu = time.process_time() - started
+
+        started = time.process_time()
+        rows = list(queryset.values(*PROPERTY_SPACE_FIELDS))
+        fast_content = api_v1.create_response(
+            request, [_generate_property_space_dict(row) for row in rows], status=200
+        ).content
+        fast_cpu = time.process_time() - started
+
+        self.assertEqual(fast_content, schema_content)
+        print(f"\nserialization of {len(rows)} property spaces: schema {schema_cpu * 1000:.0f}ms CPU, "
+              f"values() {fast_cpu * 1000:.0f}ms CPU")
+        self.assertLess(fast_cpu, schema_cpu)
+
+
+@skipUnless(RUN_BENCHMARKS, "Set RUN_BENCHMARKS=1 to run the benchmarks")
+@override_settings(API_RATE_LIMIT_BURST=1_000_000)
+class TopologyImportBenchmark(TestCase):
+    """
+    Property spaces created per second by the per-item endpoint and by the bulk import,
+    which also creates 4 unit spaces per property space.
+    """
+
+    def _address(self, index):
+        return {"street": f"{index} Bench St", "city": "Oakland", "state": "CA", "country": "USA", "postal_code": "94607"}
+
+    def test_import_throughput(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        count = 2000
+
+        started = time.perf_counter()
+        for index in range(count):
+            response = self.client.post(
+                '/api/v1/property-spaces',
+                {"name": f"item {index}", "address": self._address(index)},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+        per_item_rate = count / (time.perf_counter() - started)
+
+        payload = json.dumps({"properties": [
+            {
+                "external_id": f"bulk-{index}",
+                "name": f"bulk {index}",
+                "address": self._address(index),
+                "units": [{"external_id": f"u{unit}", "name": f"unit {unit}", "area": 1000} for unit in range(4)],
+            }
+            for index in range(count)
+        ]})
+        started = time.perf_counter()
+        response = self.client.post('/api/v1/property-spaces/import', payload, content_type='application/json')
+        bulk_rate = count / (time.perf_counter() - started)
+        self.assertEqual(response.json()['created'], count)
+
+        print(f"\nproperty spaces per second: per-item endpoint {per_item_rate:.0f}, "
+              f"bulk import with 4 units each {bulk_rate:.0f}")
+        self.assertGreater(bulk_rate, per_item_rate)
+
+
+@skipUnless(RUN_BENCHMARKS, "Set RUN_BENCHMARKS=1 to run the benchmarks")
+class DeleteBenchmark(TestCase):
+    """
+    Time to delete 500 property spaces with 4 unit spaces and about 40 readings each,
+    one by one with Model.delete() and with the bulk delete.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_synthetic_data(properties=1000, units_per_property=4, readings=40000, seed=0)
+
+    def test_delete_throughput(self):
+        ids = list(PropertySpace.objects.order_by("id").values_list("id", flat=True))
+        count = len(ids) // 2
+
+        started = time.perf_counter()
+        for property_space in PropertySpace.objects.filter(id__in=ids[:count]):
+            property_space.delete()
+        collector_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = delete_property_spaces(ids[count:])
+        bulk_s = time.perf_counter() - started
+
+        self.assertEqual(result["deleted"], len(ids) - count)
+        self.assertFalse(PropertySpace.objects.exists())
+        # Model.delete() leaves the addresses and the meters behind.
+        print(f"\ndelete {count} property spaces: Model.delete() {collector_s:.2f}s, bulk delete {bulk_s:.2f}s, "
+              f"left behind by Model.delete(): {Address.objects.count()} addresses, {MeterData.objects.count()} meters")
+        self.assertLess(bulk_s, collector_s)
+
+
+@skipUnless(RUN_BENCHMARKS and np is not None, "Set RUN_BENCHMARKS=1 and install NumPy to run the benchmarks")
+@override_settings(COLUMNAR_ANALYTICS_ENABLED=True, COLUMNAR_REFRESH_SECONDS=60)
+class ColumnarBenchmark(TestCase):
+    """
+    Time of a portfolio aggregate over 1M readings, from the database and from the columnar snapshot.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_synthetic_data(properties=10000, units_per_property=4, readings=1_000_000, seed=0)
+
+    def tearDown(self):
+        reset_snapshot()
+
+    def test_portfolio_totals_latency(self):
+        with override_settings(COLUMNAR_ANALYTICS_ENABLED=False):
+            started = time.perf_counter()
+            database = portfolio_totals(2022)
+            database_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        snapshot = get_snapshot()
+        load_s = time.perf_counter() - started
+        started = time.perf_counter()
+        first = portfolio_totals(2022)
+        first_ms = (time.perf_counter() - started) * 1000
+        calls = 1000
+        started = time.perf_counter()
+        for _ in range(calls):
+            columnar = portfolio_totals(2022)
+        columnar_ms = (time.perf_counter() - started) * 1000 / calls
+
+        self.assertEqual(columnar["source"], "columnar")
+        self.assertAlmostEqual(columnar["total_consumption"], database["total_consumption"], delta=1e-6 * database["total_consumption"])
+        print(f"\nportfolio totals over 1M readings: database {database_ms:.1f}ms, snapshot load {load_s:.1f}s "
+              f"({snapshot.nbytes / 2 ** 20:.0f} MB), first columnar call {first_ms:.2f}ms, then {columnar_ms:.4f}ms")
+        self.assertLess(columnar_ms, 1)
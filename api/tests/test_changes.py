@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta, timezone
+from django.core.cache import cache
+from unittest import mock
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from api.changes import changes_page, next_change_seq, touch_property_spaces
+from api.models import MeterData, PropertySpace, UnitSpace
+import os
+import threading
+import time
+
+
+class ChangeFeedTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _changes(self, **params):
+        response = self.client.get('/api/v1/property-spaces/changes', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _sync(self):
+        # Read every change up to now, returns the cursor to poll with.
+        data = self._changes(limit=1000)
+        self.assertFalse(data['has_more'])
+        return data['next_cursor']
+
+    def _changed_ids(self, cursor):
+        return [change['id'] for change in self._changes(cursor=cursor)['changes']]
+
+    def test_initial_sync(self):
+        data = self._changes()
+        self.assertEqual([change['id'] for change in data['changes']], [1, 2, 3])
+        self.assertEqual(data['changes'][0]['property_space']['total_consumption'], 6000)
+        self.assertFalse(data['changes'][0]['deleted'])
+
+        # Nothing changed since the last page.
+        data = self._changes(cursor=data['next_cursor'])
+        self.assertEqual(data['changes'], [])
+        self.assertFalse(data['has_more'])
+
+    def test_paginated(self):
+        data = self._changes(limit=2)
+        self.assertEqual([change['id'] for change in data['changes']], [1, 2])
+        self.assertTrue(data['has_more'])
+        data = self._changes(limit=2, cursor=data['next_cursor'])
+        self.assertEqual([change['id'] for change in data['changes']], [3])
+        self.assertFalse(data['has_more'])
+
+    def test_own_and_address_changes(self):
+        cursor = self._sync()
+        response = self.client.put(
+            '/api/v1/property-spaces/2',
+            {
+                "name": "renamed",
+                "address": {"street": "1 New St", "city": "Oakland", "state": "CA", "country": "USA", "postal_code": "94607"},
+            },
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        data = self._changes(cursor=cursor)
+        self.assertEqual([change['id'] for change in data['changes']], [2])
+        self.assertEqual(data['changes'][0]['property_space']['name'], "renamed")
+        self.assertEqual(data['changes'][0]['property_space']['address']['street'], "1 New St")
+
+    def test_child_changes_bump_the_property_space(self):
+        cursor = self._sync()
+        unit = UnitSpace.objects.get(id=1)
+        previous_updated_at = unit.updated_at
+        unit.area = 1500
+        unit.save()
+        self.assertGreater(UnitSpace.objects.get(id=1).updated_at, previous_updated_at)
+        self.assertEqual(self._changed_ids(cursor), [1])
+
+        cursor = self._sync()
+        # Meter 6 is shared between the units of property spaces 2 and 3.
+        meter = MeterData.objects.get(id=6)
+        meter.measurement_reading = 8000
+        meter.save()
+        data = self._changes(cursor=cursor)
+        self.assertEqual([change['id'] for change in data['changes']], [2, 3])
+        self.assertEqual(data['changes'][0]['property_space']['total_consumption'], 8000)
+
+    def test_tombstones(self):
+        cursor = self._sync()
+        response = self.client.delete('/api/v1/property-spaces/1')
+        self.assertEqual(response.status_code, 200)
+        data = self._changes(cursor=cursor)
+        self.assertEqual(len(data['changes']), 1)
+        self.assertEqual(data['changes'][0]['id'], 1)
+        self.assertTrue(data['changes'][0]['deleted'])
+        self.assertIsNone(data['changes'][0]['property_space'])
+
+        # A later change comes after the tombstone.
+        PropertySpace.objects.filter(id=3).get().save()
+        data = self._changes(cursor=cursor)
+        self.assertEqual([(change['id'], change['deleted']) for change in data['changes']], [(1, True), (3, False)])
+
+    def test_updated_since(self):
+        data = self._changes(updated_since=(datetime.now(timezone.utc) + timedelta(minutes=1)).isoformat())
+        self.assertEqual(data['changes'], [])
+        PropertySpace.objects.get(id=3).save()
+        self.assertEqual(self._changed_ids(data['next_cursor']), [3])
+
+        since = datetime.now(timezone.utc)
+        PropertySpace.objects.get(id=2).save()
+        data = self._changes(updated_since=since.isoformat())
+        self.assertEqual([change['id'] for change in data['changes']], [2])
+
+    def test_constant_queries(self):
+        PropertySpace.objects.get(id=2).save()
+        cursor = self._changes(limit=1)['next_cursor']
+        with CaptureQueriesContext(connection) as queries:
+            data = self._changes(cursor=cursor)
+        self.assertEqual([change['id'] for change in data['changes']], [3, 2])
+        # The changed property spaces and the tombstones, through the (change_seq, id) indexes.
+        self.assertEqual(len(queries), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/property-spaces/changes?cursor=nope')
+        self.assertEqual(response.status_code, 400)
+
+
+class ChangeFeedConcurrencyTestCase(TransactionTestCase):
+    # The writers need their own connections, and their own transactions.
+    fixtures = ['api_testing_fixture.json']
+
+    def _read(self, cursor=None):
+        changes, cursor, _ = changes_page(PropertySpace.objects.values("id", "change_seq", "updated_at"), 100, cursor)
+        return [change["id"] for change in changes], cursor
+
+    def test_interleaved_writers(self):
+        # Writer 1 saves property space 1 and takes its change sequence value. Before its row is written,
+        # writer 2 touches property space 2, then a client syncs. Writer 2 waits for writer 1: taken
+        # in one transaction with the row, the value of writer 1 cannot be committed after a higher one.
+        _, cursor = self._read()
+        seen = []
+
+        def second_writer():
+            try:
+                while True:
+                    try:
+                        touch_property_spaces([2])
+                        break
+                    except OperationalError:
+                        # The shared-cache in-memory test database reports the lock instead of waiting.
+                        time.sleep(0.01)
+                seen.append(self._read(cursor))
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=second_writer)
+
+        def take_then_interleave():
+            value = next_change_seq()
+            thread.start()
+            time.sleep(0.2)
+            return value
+
+        with mock.patch("api.signals.next_change_seq", side_effect=take_then_interleave):
+            property_space = PropertySpace.objects.get(id=1)
+            property_space.name = "renamed"
+            property_space.save()
+        thread.join()
+
+        ids, next_cursor = seen[0]
+        later_ids, _ = self._read(next_cursor)
+        self.assertIn(1, ids + later_ids)
+        self.assertIn(2, ids)
@@ -0,0 +1,174 @@
+from datetime import datetime, timezone
+from unittest import mock, skipIf, skipUnless
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from api.aggregations import annotate_property_space_totals
+from api.changes import touch_property_spaces
+from api.columnar import LINK_BYTES, ColumnarSnapshot, get_snapshot, np, reset_snapshot
+from api.ingest import ingest_meter_readings
+from api.models import MeterData, MeterDataUnitSpace, PropertySpace, UnitSpace
+from api.units import conversion_factors, resolve_unit
+import os
+import tracemalloc
+
+
+class PortfolioTotalsTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        reset_snapshot()
+        return super().setUp()
+
+    @override_settings(COLUMNAR_ANALYTICS_ENABLED=False)
+    def test_database_totals(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/analytics/totals')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.json(), {
+            "year": None,
+            "consumption_unit": "kWh",
+            "property_count": 3,
+            "number_of_units": 5,
+            "total_area": 15000.0,
+            "total_consumption": 21000.0,
+            "source": "database",
+        })
+        data = self.client.get('/api/v1/analytics/totals?year=2022').json()
+        self.assertEqual(data['total_consumption'], 11000.0)
+
+    @skipIf(np is not None, "NumPy is installed")
+    @override_settings(COLUMNAR_ANALYTICS_ENABLED=True)
+    def test_without_numpy(self):
+        self.assertIsNone(get_snapshot())
+        self.assertEqual(self.client.get('/api/v1/analytics/totals').json()['source'], "database")
+
+
+@skipUnless(np is not None, "NumPy is not installed")
+@override_settings(COLUMNAR_ANALYTICS_ENABLED=True, COLUMNAR_REFRESH_SECONDS=0)
+class ColumnarSnapshotTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        reset_snapshot()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        reset_snapshot()
+        return super().tearDown()
+
+    def _property_space_totals(self, snapshot, year, unit):
+        # The bins of the snapshot by property space, in the requested unit.
+        columns, factor = snapshot._columns, conversion_factors()[resolve_unit(unit)]
+        return {
+            int(property_space_id): (int(units), float(area), float(consumption) / factor)
+            for property_space_id, units, area, consumption in zip(
+                columns["property_ids"], columns["number_of_units"], columns["total_area"], snapshot._consumption(year)
+            )
+        }
+
+    def assertParity(self):
+        snapshot = get_snapshot()
+        for year in [None, 2021, 2022, 2023, 2024, 2025]:
+            for unit in [None, "therms"]:
+                rows = annotate_property_space_totals(PropertySpace.objects.order_by("id"), year, unit=unit).values(
+                    "id", "number_of_units", "total_area", "total_consumption"
+                )
+                totals = self._property_space_totals(snapshot, year, unit)
+                self.assertEqual(sorted(totals), [row["id"] for row in rows])
+                for row in rows:
+                    number_of_units, total_area, total_consumption = totals[row["id"]]
+                    self.assertEqual(number_of_units, row["number_of_units"])
+                    self.assertAlmostEqual(total_area, row["total_area"])
+                    self.assertAlmostEqual(total_consumption, row["total_consumption"])
+                portfolio = snapshot.portfolio_totals(year, unit)
+                self.assertEqual(portfolio["property_count"], len(rows))
+                self.assertAlmostEqual(portfolio["total_consumption"], sum(row["total_consumption"] for row in rows))
+
+    def test_parity_with_the_orm(self):
+        self.assertParity()
+
+    def test_incremental_refresh(self):
+        self.assertParity()
+        ingest_meter_readings([{
+            "meter_number": "new",
+            "meter_provider_name": "provider",
+            "meter_source": "source",
+            "measurement_reading": 600,
+            "measurement_unit": "therms",
+            "measurement_start_date": datetime(2022, 12, 1, tzinfo=timezone.utc),
+            "measurement_end_date": datetime(2023, 1, 31, tzinfo=timezone.utc),
+            # Unit 3 of property space 1 and unit 4 of property space 2.
+            "unit_space_ids": [3, 4],
+        }])
+        UnitSpace.objects.get(id=5).delete()
+        self.assertParity()
+
+        PropertySpace.objects.get(id=2).delete()
+        self.assertParity()
+
+    def test_no_query_between_refreshes(self):
+        with override_settings(COLUMNAR_REFRESH_SECONDS=60):
+            get_snapshot()
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get('/api/v1/analytics/totals?year=2022').json()
+            self.assertEqual(len(queries), 0)
+        self.assertEqual((data['source'], data['total_consumption']), ("columnar", 11000.0))
+
+    def _load_peak_memory(self) -> int:
+        snapshot = ColumnarSnapshot()
+        with mock.patch("api.columnar.LOAD_CHUNK_SIZE", 100):
+            tracemalloc.start()
+            try:
+                snapshot.load()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    def test_load_stays_within_the_budget(self):
+        # The arrays are filled chunk by chunk: the memory of a load grows with the size of the
+        # snapshot, which the budget is checked against, not with a Python list per column.
+        # The first load also allocates the caches of the process.
+        self._load_peak_memory()
+        baseline = self._load_peak_memory()
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        meters = MeterData.objects.bulk_create([
+            MeterData(
+                meter_number=f"memory-{index}",
+                meter_provider_name="provider",
+                meter_source="source",
+                measurement_reading=10,
+                share_reading=10,
+                measurement_start_date=start,
+                measurement_end_date=start,
+            )
+            for index in range(20000)
+        ])
+        MeterDataUnitSpace.objects.bulk_create([
+            MeterDataUnitSpace(meterdata=meter, unitspace_id=meter.id % 5 + 1) for meter in meters
+        ])
+        added = len(meters) * LINK_BYTES
+        self.assertLess(self._load_peak_memory() - baseline, 1.2 * added)
+
+    def test_memory_budget(self):
+        with override_settings(COLUMNAR_MEMORY_BUDGET_MB=0):
+            self.assertIsNone(get_snapshot())
+            self.assertEqual(self.client.get('/api/v1/analytics/totals').json()['source'], "database")
+        self.assertIsNotNone(get_snapshot())
+
+    def test_over_budget_is_remembered_until_the_data_changes(self):
+        with override_settings(COLUMNAR_MEMORY_BUDGET_MB=0):
+            self.assertIsNone(get_snapshot())
+            with CaptureQueriesContext(connection) as queries:
+                self.assertIsNone(get_snapshot())
+            # Only the change sequence is read, the rows are not counted again.
+            self.assertEqual(len(queries), 1)
+            touch_property_spaces([1])
+            with CaptureQueriesContext(connection) as queries:
+                self.assertIsNone(get_snapshot())
+            self.assertGreater(len(queries), 1)
@@ -0,0 +1,143 @@
+from collections import Counter
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import RequestFactory, TestCase, override_settings
+from api.auth import create_api_key
+from api.db_router import ReplicaRouter, _weighted_sequence, use_replicas
+from api.middleware import ReplicaRoutingMiddleware
+from api.models import PropertySpace
+import os
+
+REPLICA = "replica"
+
+
+@override_settings(DATABASE_REPLICAS={REPLICA: 1}, DATABASE_PRIMARY_STICKY_SECONDS=60)
+class ReplicaRoutingTestCase(TestCase):
+    """
+    The primary is the test database and the replica a second in-memory SQLite database,
+    loaded with the same fixture. The replica rows are then changed, so that the responses
+    tell which database they were read from.
+    The replica is added after the test databases are set up, it is not rolled back between the tests.
+    """
+    fixtures = ['api_testing_fixture.json']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'],
+            'NAME': 'file:memorydb_replica?mode=memory&cache=shared',
+        }
+        call_command('migrate', database=REPLICA, verbosity=0)
+        call_command('loaddata', *cls.fixtures, database=REPLICA, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        PropertySpace.objects.using(REPLICA).filter(id=1).update(name="replica name")
+        return super().setUp()
+
+    def test_read_endpoints_use_the_replica(self):
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1').json()['name'], "replica name")
+        self.assertEqual(self.client.get('/api/v1/property-spaces').json()[0]['name'], "replica name")
+        export = b"".join(self.client.get('/api/v1/property-spaces/export').streaming_content)
+        self.assertIn(b"replica name", export)
+
+    async def test_async_read_endpoints_use_the_replica(self):
+        headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        response = await self.async_client.get('/api/v1/async/property-spaces/1', headers=headers)
+        self.assertEqual(response.json()['name'], "replica name")
+
+    def test_change_feed_uses_the_primary(self):
+        changes = self.client.get('/api/v1/property-spaces/changes').json()['changes']
+        self.assertEqual(changes[0]['property_space']['name'], "property space 1")
+
+    def test_writes_use_the_primary(self):
+        response = self.client.put('/api/v1/property-spaces/1', {"name": "updated"}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PropertySpace.objects.get(id=1).name, "updated")
+        self.assertEqual(PropertySpace.objects.using(REPLICA).get(id=1).name, "replica name")
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        self.client.put('/api/v1/property-spaces/2', {"name": "updated"}, content_type='application/json')
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1').json()['name'], "property space 1")
+        self.assertEqual(self.client.get('/api/v1/property-spaces/2').json()['name'], "updated")
+        # The sticky window ends.
+        cache.delete(ReplicaRoutingMiddleware(lambda request: None)._client_key(
+            RequestFactory().get('/', HTTP_AUTHORIZATION=self.client.defaults['HTTP_AUTHORIZATION'])
+        ))
+        # Another key than the response rendered from the primary above, which was cached.
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1?year=2022').json()['name'], "replica name")
+
+    def test_replica_responses_are_not_cached(self):
+        _, key = create_api_key("other client")
+        self.client.put('/api/v1/property-spaces/1', {"name": "updated"}, content_type='application/json')
+        # Another client reads from the replica, which has not caught up with the write.
+        response = self.client.get('/api/v1/property-spaces/1', HTTP_AUTHORIZATION='Bearer ' + key)
+        self.assertEqual(response.json()['name'], "replica name")
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1').json()['name'], "updated")
+
+    async def test_async_reads_stick_to_the_primary_after_a_write(self):
+        headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        await self.async_client.put(
+            '/api/v1/property-spaces/2', {"name": "updated"}, content_type='application/json', headers=headers
+        )
+        response = await self.async_client.get('/api/v1/async/property-spaces/1', headers=headers)
+        self.assertEqual(response.json()['name'], "property space 1")
+
+    @override_settings(DATABASE_PRIMARY_STICKY_SECONDS=0)
+    def test_without_sticky_window(self):
+        self.client.put('/api/v1/property-spaces/2', {"name": "updated"}, content_type='application/json')
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1').json()['name'], "replica name")
+
+    def test_outside_of_read_only_views(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(PropertySpace), 'default')
+        with use_replicas():
+            self.assertEqual(router.db_for_read(PropertySpace), REPLICA)
+        self.assertEqual(router.db_for_write(PropertySpace), 'default')
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_without_replicas(self):
+        with use_replicas():
+            self.assertEqual(ReplicaRouter().db_for_read(PropertySpace), 'default')
+
+
+class ReplicaSelectionTestCase(TestCase):
+
+    def test_weighted_round_robin(self):
+        self.assertEqual(_weighted_sequence({"a": 2, "b": 1}), ["a", "b", "a"])
+        with override_settings(DATABASE_REPLICAS={"a": 3, "b": 1}):
+            router = ReplicaRouter()
+            reads = []
+            for _ in range(8):
+                with use_replicas():
+                    reads.append(router.db_for_read(PropertySpace))
+        self.assertEqual(Counter(reads), {"a": 6, "b": 2})
+
+    @override_settings(DATABASE_REPLICAS={"a": 1, "b": 1})
+    def test_one_replica_per_view(self):
+        router = ReplicaRouter()
+        for _ in range(2):
+            with use_replicas():
+                reads = {router.db_for_read(PropertySpace) for _ in range(5)}
+                with use_replicas():
+                    reads.add(router.db_for_read(PropertySpace))
+            self.assertEqual(len(reads), 1)
+
+    @override_settings(DATABASE_REPLICAS={"a": 1, "b": 0}, DATABASE_REPLICA_SELECTION="random")
+    def test_random_selection(self):
+        router = ReplicaRouter()
+        reads = set()
+        for _ in range(20):
+            with use_replicas():
+                reads.add(router.db_for_read(PropertySpace))
+        self.assertEqual(reads, {"a"})
@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.deletion import delete_property_spaces
+from api.models import (
+    Address, MeterData, MeterDataUnitSpace, PropertySpace, PropertySpaceTombstone, PropertySpaceYearlyRollup, UnitSpace,
+)
+from api.rollups import check_rollup_consistency
+import os
+
+
+class BulkDeleteTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def assertNoOrphans(self):
+        self.assertFalse(Address.objects.filter(propertyspace__isnull=True).exists())
+        self.assertFalse(MeterData.objects.filter(unit_space__isnull=True).exists())
+        self.assertFalse(MeterDataUnitSpace.objects.exclude(unitspace__in=UnitSpace.objects.all()).exists())
+        self.assertFalse(PropertySpaceYearlyRollup.objects.exclude(property_space__in=PropertySpace.objects.all()).exists())
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_bulk_delete(self):
+        # Cached before the deletion.
+        self.assertEqual(self.client.get('/api/v1/property-spaces/3').json()['total_consumption'], 8000)
+        response = self.client.post(
+            '/api/v1/property-spaces/bulk-delete', {"ids": [1, 2, 999]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "deleted": 2,
+            "unit_spaces": 4,
+            # Meter 6 is shared with property space 3 and kept.
+            "meters": 4,
+            "addresses": 2,
+            "not_found": [999],
+        })
+        self.assertEqual(list(PropertySpace.objects.values_list("id", flat=True)), [3])
+        self.assertEqual(list(MeterData.objects.order_by("id").values_list("id", "share_count")), [(5, 1), (6, 1)])
+        self.assertNoOrphans()
+        # Meter 6 is now entirely in property space 3.
+        self.assertEqual(self.client.get('/api/v1/property-spaces/3').json()['total_consumption'], 11000)
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1').status_code, 404)
+        self.assertEqual(
+            sorted(PropertySpaceTombstone.objects.values_list("property_space_id", flat=True)), [1, 2]
+        )
+
+    def test_batches(self):
+        result = delete_property_spaces([3, 1, 2], batch_size=1)
+        self.assertEqual((result["deleted"], result["meters"], result["addresses"]), (3, 6, 3))
+        self.assertFalse(UnitSpace.objects.exists())
+        self.assertNoOrphans()
+
+    def test_single_delete_removes_the_address(self):
+        address_id = PropertySpace.objects.get(id=2).address_id
+        self.assertEqual(self.client.delete('/api/v1/property-spaces/2').status_code, 200)
+        self.assertFalse(Address.objects.filter(id=address_id).exists())
+        self.assertNoOrphans()
+        self.assertEqual(self.client.delete('/api/v1/property-spaces/2').status_code, 404)
+
+    def test_constant_queries(self):
+        # A property space with many units and meters is deleted with as many queries as one with a single unit.
+        address = Address.objects.create(street="1 Main St", city="Oakland", state="CA", country="USA", postal_code="94607")
+        large = PropertySpace.objects.create(name="large", address=address)
+        units = UnitSpace.objects.bulk_create([
+            UnitSpace(name=f"unit {i}", area=100, property_space=large) for i in range(50)
+        ])
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        meters = MeterData.objects.bulk_create([
+            MeterData(
+                meter_number=f"large-{i}",
+                meter_provider_name="provider",
+                meter_source="source",
+                measurement_reading=100,
+                measurement_start_date=start,
+                measurement_end_date=start,
+            )
+            for i in range(50)
+        ])
+        MeterDataUnitSpace.objects.bulk_create([
+            MeterDataUnitSpace(meterdata=meter, unitspace=unit) for meter, unit in zip(meters, units)
+        ])
+
+        with CaptureQueriesContext(connection) as small_queries:
+            delete_property_spaces([1])
+        with CaptureQueriesContext(connection) as large_queries:
+            result = delete_property_spaces([large.id])
+        self.assertEqual((result["unit_spaces"], result["meters"]), (50, 50))
+        self.assertEqual(len(large_queries), len(small_queries))
+        self.assertNoOrphans()
+
+    def test_invalid_payload(self):
+        response = self.client.post('/api/v1/property-spaces/bulk-delete', {"ids": []}, content_type='application/json')
+        self.assertEqual(response.status_code, 422)
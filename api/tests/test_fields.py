@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import MeterData, UnitSpace
+import os
+
+
+class SparseFieldsTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        return response, queries[0]['sql']
+
+    def test_detail_fields(self):
+        response, sql = self._get('/api/v1/property-spaces/1?fields=name,address,number_of_units')
+        self.assertEqual(response.json(), {
+            "name": "property space 1",
+            "address": {
+                "street": "123 Main St",
+                "city": "San Francisco",
+                "state": "CA",
+                "country": "USA",
+                "postal_code": "94105",
+            },
+            "number_of_units": 3,
+        })
+        self.assertIn('"api_unitspace"', sql)
+        self.assertNotIn('"api_meterdata', sql)
+        self.assertNotIn('"api_propertyspaceyearlyrollup"', sql)
+
+    def test_address_only_skips_the_units(self):
+        response, sql = self._get('/api/v1/property-spaces/1?fields=address,name')
+        self.assertEqual(list(response.json()), ["name", "address"])
+        self.assertIn('"api_address"', sql)
+        self.assertNotIn('"api_unitspace"', sql)
+        self.assertNotIn('"api_meterdata', sql)
+
+    def test_name_only_skips_the_address(self):
+        response, sql = self._get('/api/v1/property-spaces?fields=name')
+        self.assertEqual(response.json(), [{"name": "property space 1"}, {"name": "property space 2"}, {"name": "property space 3"}])
+        self.assertNotIn('"api_address"', sql)
+        self.assertNotIn('"api_unitspace"', sql)
+
+    def test_consumption(self):
+        response, sql = self._get('/api/v1/property-spaces?year=2022&fields=total_consumption,consumption_unit')
+        self.assertEqual([item['total_consumption'] for item in response.json()], [5000, 3000, 3000])
+        self.assertEqual(response.json()[0], {"total_consumption": 5000, "consumption_unit": "kWh"})
+        self.assertNotIn('"api_address"', sql)
+        self.assertNotIn('SUM(U0."area")', sql)
+
+    def test_every_field_is_the_full_response(self):
+        full = self.client.get('/api/v1/property-spaces/1?year=2022')
+        every_field = self.client.get(
+            '/api/v1/property-spaces/1?year=2022&fields=consumption_unit,total_consumption,total_area,number_of_units,address,name'
+        )
+        self.assertEqual(every_field['X-Cache'], 'HIT')
+        self.assertEqual(every_field.content, full.content)
+
+    def test_pagination(self):
+        response = self.client.get('/api/v1/property-spaces?fields=name&limit=2')
+        next_page = self.client.get(f"/api/v1/property-spaces?fields=name&limit=2&cursor={response['X-Next-Cursor']}")
+        self.assertEqual(next_page.json(), [{"name": "property space 3"}])
+
+    async def test_async_endpoints(self):
+        headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        response = await self.async_client.get('/api/v1/async/property-spaces/1?fields=name', headers=headers)
+        self.assertEqual(response.json(), {"name": "property space 1"})
+        response = await self.async_client.get('/api/v1/async/property-spaces?fields=number_of_units', headers=headers)
+        self.assertEqual(response.json(), [{"number_of_units": 3}, {"number_of_units": 1}, {"number_of_units": 1}])
+
+    def test_invalid_fields(self):
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1?fields=name,id').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/property-spaces?fields=,').status_code, 400)
+
+    def test_cache_invalidation(self):
+        url = '/api/v1/property-spaces/1?fields=name,number_of_units'
+        consumption_url = '/api/v1/property-spaces/1?year=2022&fields=total_consumption'
+        self.client.get(url)
+        self.client.get(consumption_url)
+        # A reading only changes the consumption.
+        meter = MeterData.objects.get(id=2)
+        meter.measurement_reading = 2500
+        meter.save()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        response = self.client.get(consumption_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json(), {"total_consumption": 5500})
+
+        # Moving a unit changes the number of units, for every year.
+        unit = UnitSpace.objects.get(id=3)
+        unit.property_space_id = 2
+        unit.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['number_of_units'], 2)
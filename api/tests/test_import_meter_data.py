@@ -0,0 +1,123 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from api.ingest import ingest_meter_readings
+from api.models import MeterData
+from api.rollups import check_rollup_consistency
+import csv
+import json
+import os
+import tempfile
+
+
+FIELDS = [
+    "meter_number", "meter_provider_name", "meter_source", "measurement_reading",
+    "measurement_unit", "measurement_start_date", "measurement_end_date", "unit_space_ids",
+]
+
+
+def _meter_data_index_names():
+    with connection.cursor() as cursor:
+        return set(connection.introspection.get_constraints(cursor, MeterData._meta.db_table))
+
+
+class CsvFileMixin:
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.directory.name, "readings.csv")
+        self.checkpoint_path = os.path.join(self.directory.name, "checkpoint.json")
+        with open(self.csv_path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(FIELDS)
+            for i in range(25):
+                writer.writerow([
+                    f"csv-{i}", "provider", "source", 100, "kWh",
+                    "2022-07-01T00:00:00Z", "2022-07-31T23:59:59Z", "4;5" if i % 5 == 0 else "1",
+                ])
+            writer.writerow(["csv-bad", "provider", "source", "not a number", "kWh",
+                             "2022-07-01T00:00:00Z", "2022-07-31T23:59:59Z", "1"])
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        return super().tearDown()
+
+
+class ImportMeterDataTestCase(CsvFileMixin, TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def test_import_meter_data(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_meter_data", self.csv_path, "--batch-size", "10", stdout=stdout, stderr=stderr)
+        self.assertEqual(MeterData.objects.filter(meter_number__startswith="csv-").count(), 25)
+        self.assertEqual(set(MeterData.objects.get(meter_number="csv-5").unit_space.values_list("id", flat=True)), {4, 5})
+        self.assertIn("rows/s", stdout.getvalue())
+        self.assertIn("row 26", stderr.getvalue())
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_import_meter_data_resumes_from_checkpoint(self):
+        calls = []
+
+        def interrupted_ingest(readings):
+            calls.append(len(readings))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return ingest_meter_readings(readings)
+
+        with mock.patch("api.management.commands.import_meter_data.ingest_meter_readings", interrupted_ingest):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("import_meter_data", self.csv_path, "--batch-size", "10",
+                             "--checkpoint", self.checkpoint_path, stdout=StringIO())
+        with open(self.checkpoint_path) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)["rows"], 10)
+        self.assertEqual(MeterData.objects.filter(meter_number__startswith="csv-").count(), 10)
+
+        stdout = StringIO()
+        with mock.patch("api.management.commands.import_meter_data.ingest_meter_readings",
+                        wraps=ingest_meter_readings) as ingest:
+            call_command("import_meter_data", self.csv_path, "--batch-size", "10",
+                         "--checkpoint", self.checkpoint_path, stdout=stdout, stderr=StringIO())
+        self.assertIn("resuming after row 10", stdout.getvalue())
+        # The rows imported before the interruption are not read again.
+        self.assertEqual(sum(len(call.args[0]) for call in ingest.call_args_list), 15)
+        self.assertEqual(MeterData.objects.filter(meter_number__startswith="csv-").count(), 25)
+
+        # A completed file is skipped on the next run.
+        stdout = StringIO()
+        call_command("import_meter_data", self.csv_path, "--checkpoint", self.checkpoint_path, stdout=stdout)
+        self.assertIn("already imported", stdout.getvalue())
+
+
+class ImportMeterDataDeferredIndexesTestCase(CsvFileMixin, TransactionTestCase):
+    # The schema editor cannot run inside the transaction of a TestCase on SQLite.
+    fixtures = ['api_testing_fixture.json']
+
+    def test_import_meter_data_with_deferred_indexes(self):
+        indexes_during_load = []
+
+        def ingest(readings):
+            indexes_during_load.append(_meter_data_index_names())
+            return ingest_meter_readings(readings)
+
+        with mock.patch("api.management.commands.import_meter_data.ingest_meter_readings", ingest):
+            call_command("import_meter_data", self.csv_path, "--defer-indexes",
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertNotIn("meterdata_start_end_idx", indexes_during_load[0])
+        self.assertIn("unique_meter_data_reading", indexes_during_load[0])
+        self.assertIn("meterdata_start_end_idx", _meter_data_index_names())
+        self.assertIn("meterdata_end_idx", _meter_data_index_names())
+        self.assertEqual(MeterData.objects.filter(meter_number__startswith="csv-").count(), 25)
+
+    def test_resume_after_interrupted_deferred_load(self):
+        # A killed run leaves the indexes dropped: the next run neither fails nor leaves them missing.
+        index = MeterData._meta.indexes[0]
+        with connection.schema_editor() as schema_editor:
+            schema_editor.remove_index(MeterData, index)
+        self.assertNotIn(index.name, _meter_data_index_names())
+
+        call_command("import_meter_data", self.csv_path, "--defer-indexes", stdout=StringIO(), stderr=StringIO())
+        self.assertIn(index.name, _meter_data_index_names())
+        self.assertEqual(MeterData.objects.filter(meter_number__startswith="csv-").count(), 25)
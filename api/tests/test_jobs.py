@@ -0,0 +1,183 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from api.jobs import JOB_HANDLERS, JobContext, JobResult, JobWorker, claim_job, requeue_stale_jobs, run_job, submit_job
+from api.models import Job, PropertySpaceYearlyRollup
+from api.rollups import check_rollup_consistency
+import os
+
+
+def _run_next_job(context_class=JobContext) -> Job:
+    job = claim_job("test")
+    return run_job(context_class(job))
+
+
+class JobsTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _submit_report(self, **payload):
+        payload = {"start_year": 2021, "end_year": 2022, **payload}
+        return self.client.post('/api/v1/jobs/portfolio-report', payload, content_type='application/json')
+
+    def test_portfolio_report(self):
+        response = self._submit_report(group_by="country")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+        self.assertEqual(response.json()['status'], "queued")
+        self.assertEqual(self.client.get(f'/api/v1/jobs/{job_id}/result').status_code, 409)
+
+        _run_next_job()
+        data = self.client.get(f'/api/v1/jobs/{job_id}').json()
+        self.assertEqual((data['status'], data['attempts'], data['progress']), ("succeeded", 1, 1.0))
+        response = self.client.get(f'/api/v1/jobs/{job_id}/result')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('portfolio-report.json', response['Content-Disposition'])
+        report = response.json()
+        self.assertEqual([year['year'] for year in report['years']], [2021, 2022])
+        self.assertEqual(report['years'][1]['totals']['total_consumption'], 11000.0)
+        self.assertEqual(report['years'][1]['groups'][0]['group'], {"country": "USA"})
+
+    def test_portfolio_report_csv(self):
+        job_id = self._submit_report(start_year=2022, group_by="unit_type", format="csv").json()['id']
+        _run_next_job()
+        response = self.client.get(f'/api/v1/jobs/{job_id}/result')
+        self.assertEqual(response['Content-Type'], "text/csv")
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], "year,unit_type,property_count,unit_count,total_area,total_consumption,intensity")
+        self.assertTrue(all(line.startswith("2022,") for line in lines[1:]))
+
+    def test_invalid_report(self):
+        self.assertEqual(self._submit_report(start_year=2023).status_code, 400)
+        self.assertEqual(self._submit_report(end_year=2100).status_code, 400)
+        self.assertEqual(self._submit_report(unit="litres").status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_rebuild_rollups(self):
+        PropertySpaceYearlyRollup.objects.all().delete()
+        response = self.client.post('/api/v1/jobs/rebuild-rollups', {"batch_size": 2}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = _run_next_job()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(check_rollup_consistency(), [])
+        result = self.client.get(f'/api/v1/jobs/{job.pk}/result').json()
+        self.assertEqual(result['rollup_rows'], PropertySpaceYearlyRollup.objects.count())
+
+    def test_cancel_queued(self):
+        job_id = self._submit_report().json()['id']
+        response = self.client.post(f'/api/v1/jobs/{job_id}/cancel')
+        self.assertEqual(response.json()['status'], "cancelled")
+        self.assertIsNone(claim_job("test"))
+        self.assertEqual(self.client.post(f'/api/v1/jobs/{job_id}/cancel').status_code, 409)
+
+    def test_cancel_running(self):
+        job_id = self._submit_report().json()['id']
+        context = JobContext(claim_job("test"))
+        response = self.client.post(f'/api/v1/jobs/{job_id}/cancel')
+        self.assertEqual((response.json()['status'], response.json()['cancel_requested']), ("running", True))
+        # The worker relays the cancellation to the handler with the heartbeat.
+        JobWorker(name="test")._heartbeat([context])
+        self.assertEqual(run_job(context).status, Job.CANCELLED)
+
+    def test_cancelled_rebuild_is_rolled_back(self):
+        rollups = PropertySpaceYearlyRollup.objects.count()
+        PropertySpaceYearlyRollup.objects.filter(property_space_id=3).delete()
+        submit_job("rebuild_rollups", {"batch_size": 1})
+
+        class CancelledAfterFirstBatch(JobContext):
+            def checkpoint(self, progress=None):
+                if progress:
+                    self.cancel()
+                super().checkpoint(progress)
+
+        job = _run_next_job(CancelledAfterFirstBatch)
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertLess(PropertySpaceYearlyRollup.objects.count(), rollups)
+
+    def test_retries(self):
+        handler = mock.Mock(side_effect=[RuntimeError("boom"), JobResult('{"ok": true}')])
+        with mock.patch.dict(JOB_HANDLERS, {"flaky": handler}):
+            job = submit_job("flaky", max_attempts=2)
+            job = _run_next_job()
+            self.assertEqual((job.status, job.attempts, job.error), (Job.QUEUED, 1, "RuntimeError: boom"))
+            self.assertGreater(job.run_after, timezone.now())
+            # Not claimed before its backoff.
+            self.assertIsNone(claim_job("test"))
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            job = _run_next_job()
+        self.assertEqual((job.status, job.attempts, job.error, job.result), (Job.SUCCEEDED, 2, "", '{"ok": true}'))
+
+    def test_invalid_params_are_not_retried(self):
+        submit_job("portfolio_report", {"start_year": 2021, "end_year": 2021, "unit": "litres"})
+        job = _run_next_job()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+        self.assertIn("Invalid unit", job.error)
+
+    @override_settings(JOB_CONCURRENCY_LIMITS={"rebuild_rollups": 1})
+    def test_concurrency_limits(self):
+        first = submit_job("rebuild_rollups")
+        submit_job("rebuild_rollups")
+        report = submit_job("portfolio_report", {"start_year": 2021, "end_year": 2021})
+        self.assertEqual(claim_job("test").pk, first.pk)
+        # The second rebuild waits for the first one.
+        self.assertEqual(claim_job("test").pk, report.pk)
+        self.assertIsNone(claim_job("test"))
+
+    def test_stale_jobs(self):
+        job = submit_job("rebuild_rollups", max_attempts=1)
+        claim_job("test")
+        self.assertEqual(requeue_stale_jobs(), 0)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.FAILED, "The worker stopped responding"))
+
+    def test_stale_run_keeps_its_outcome(self):
+        # The heartbeats of a running job failed, e.g. on a locked database, and it was queued again.
+        job = submit_job("portfolio_report", {"start_year": 2021, "end_year": 2021})
+        context = JobContext(claim_job("test"))
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job = run_job(context)
+        self.assertEqual((job.status, job.error, job.attempts), (Job.SUCCEEDED, "", 1))
+        self.assertIsNone(claim_job("test"))
+
+    def test_reclaimed_stale_job(self):
+        # Another run claimed the job queued again as stale, its outcome is the one kept.
+        job = submit_job("portfolio_report", {"start_year": 2021, "end_year": 2021})
+        stale_context = JobContext(claim_job("first"))
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        requeue_stale_jobs()
+        context = JobContext(claim_job("second"))
+        with mock.patch.dict(JOB_HANDLERS, {"portfolio_report": mock.Mock(side_effect=RuntimeError("stale"))}):
+            run_job(stale_context)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.worker), (Job.RUNNING, 2, "second"))
+        self.assertEqual(run_job(context).status, Job.SUCCEEDED)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/api/v1/jobs/999').status_code, 404)
+
+
+class JobWorkerTestCase(TransactionTestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def test_run_jobs_command(self):
+        reports = [submit_job("portfolio_report", {"start_year": 2021, "end_year": year}) for year in (2022, 2024)]
+        rebuild = submit_job("rebuild_rollups")
+        output = StringIO()
+        call_command("run_jobs", "--once", "--threads", "1", stdout=output)
+        self.assertIn("Ran 3 jobs", output.getvalue())
+        for job in [*reports, rebuild]:
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.SUCCEEDED)
+            self.assertTrue(job.worker)
@@ -0,0 +1,74 @@
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import TestCase, override_settings
+from api.middleware import RequestInstrumentationMiddleware, timed
+import os
+
+
+@override_settings(REQUEST_INSTRUMENTATION_ENABLED=True, REQUEST_QUERY_BUDGET=5)
+class RequestInstrumentationTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _server_timing(self, response):
+        return {
+            metric.split(";")[0]: metric
+            for metric in response['Server-Timing'].split(", ")
+        }
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/v1/property-spaces?year=2022')
+        metrics = self._server_timing(response)
+        self.assertEqual(set(metrics), {"db", "aggregation", "serialization", "total"})
+        self.assertIn('desc="1 queries"', metrics["db"])
+
+        # Served from the cache: no query and no rendering.
+        metrics = self._server_timing(self.client.get('/api/v1/property-spaces?year=2022'))
+        self.assertEqual(set(metrics), {"db", "total"})
+        self.assertIn('desc="0 queries"', metrics["db"])
+
+    def test_structured_log_fields(self):
+        with self.assertLogs('api.middleware', level='INFO') as logs:
+            self.client.get('/api/v1/property-spaces/1')
+        record = logs.records[-1]
+        self.assertEqual(record.path, '/api/v1/property-spaces/1')
+        self.assertEqual(record.status, 200)
+        self.assertEqual(record.queries, 1)
+        self.assertFalse(record.over_query_budget)
+        for field in ["db_ms", "aggregation_ms", "serialization_ms", "total_ms"]:
+            self.assertGreaterEqual(getattr(record, field), 0)
+
+    @override_settings(REQUEST_QUERY_BUDGET=0)
+    def test_query_budget_exceeded(self):
+        with self.assertLogs('api.middleware', level='WARNING') as logs:
+            self.client.get('/api/v1/property-spaces/1')
+        self.assertIn("Query budget exceeded", logs.output[0])
+        self.assertTrue(logs.records[0].over_query_budget)
+
+    async def test_async_request(self):
+        headers = {'Authorization': 'Bearer ' + os.getenv('AUTH_TOKEN')}
+        response = await self.async_client.get('/api/v1/async/property-spaces/1', headers=headers)
+        # The queries run by `sync_to_async` in another thread are recorded.
+        self.assertIn('desc="1 queries"', self._server_timing(response)["db"])
+
+        async def get_response(request):
+            return None
+
+        self.assertTrue(iscoroutinefunction(RequestInstrumentationMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(RequestInstrumentationMiddleware(lambda request: None)))
+
+    @override_settings(REQUEST_INSTRUMENTATION_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get('/api/v1/property-spaces/1')
+        self.assertFalse(response.has_header('Server-Timing'))
+        # Django drops the middleware from the chain.
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestInstrumentationMiddleware(lambda request: None)
+        # Outside of an instrumented request, `timed` is a no-op.
+        with timed("aggregation"):
+            pass
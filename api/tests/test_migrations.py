@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Runs a migration on data created with the models of the migration before it.
+    """
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', self.migrate_from)])
+        self.apps = executor.loader.project_state([('api', self.migrate_from)]).apps
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        return super().tearDown()
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', self.migrate_to)])
+        return executor.loader.project_state([('api', self.migrate_to)]).apps
+
+
+class MergeDuplicateReadingsTestCase(MigrationTestCase):
+    migrate_from = '0002_property_space_yearly_rollup'
+    migrate_to = '0003_meter_data_unique_reading'
+
+    def test_duplicate_readings_are_merged(self):
+        Address = self.apps.get_model('api', 'Address')
+        PropertySpace = self.apps.get_model('api', 'PropertySpace')
+        UnitSpace = self.apps.get_model('api', 'UnitSpace')
+        MeterData = self.apps.get_model('api', 'MeterData')
+        address = Address.objects.create(street='Street', city='City', state='State', country='Country', postal_code='00000')
+        property_space = PropertySpace.objects.create(name='PS', address=address)
+        units = [UnitSpace.objects.create(name=f'Unit {i}', property_space=property_space, area=100) for i in range(3)]
+        reading = dict(
+            meter_number='100',
+            meter_provider_name='provider',
+            meter_source='source',
+            measurement_reading=1000,
+            measurement_start_date=datetime(2022, 7, 1, tzinfo=timezone.utc),
+            measurement_end_date=datetime(2022, 7, 31, tzinfo=timezone.utc),
+        )
+        kept = MeterData.objects.create(**reading)
+        kept.unit_space.set([units[0], units[1]])
+        MeterData.objects.create(**reading).unit_space.set([units[1], units[2]])
+        MeterData.objects.create(**reading)
+        other = MeterData.objects.create(**dict(reading, meter_number='101'))
+        other.unit_space.set([units[0]])
+
+        apps = self.migrate()
+
+        MeterData = apps.get_model('api', 'MeterData')
+        self.assertEqual(list(MeterData.objects.order_by('id').values_list('id', flat=True)), [kept.id, other.id])
+        self.assertEqual(
+            set(MeterData.objects.get(id=kept.id).unit_space.values_list('id', flat=True)),
+            {unit.id for unit in units},
+        )
+        self.assertEqual(list(MeterData.objects.get(id=other.id).unit_space.values_list('id', flat=True)), [units[0].id])
+
+
+class BackfillRollupsTestCase(MigrationTestCase):
+    migrate_from = '0009_job'
+    migrate_to = '0010_backfill_property_space_yearly_rollup'
+
+    def test_rollups_are_computed_from_the_meter_history(self):
+        Address = self.apps.get_model('api', 'Address')
+        PropertySpace = self.apps.get_model('api', 'PropertySpace')
+        UnitSpace = self.apps.get_model('api', 'UnitSpace')
+        MeterData = self.apps.get_model('api', 'MeterData')
+        address = Address.objects.create(street='Street', city='City', state='State', country='Country', postal_code='00000')
+        property_space = PropertySpace.objects.create(name='PS', address=address)
+        units = [UnitSpace.objects.create(name=f'Unit {i}', property_space=property_space, area=100) for i in range(2)]
+        shared = MeterData.objects.create(
+            meter_number='100',
+            meter_provider_name='provider',
+            meter_source='source',
+            measurement_reading=1000,
+            measurement_start_date=datetime(2022, 12, 15, tzinfo=timezone.utc),
+            measurement_end_date=datetime(2023, 1, 15, tzinfo=timezone.utc),
+            share_count=2,
+            share_reading=500,
+        )
+        shared.unit_space.set(units)
+
+        apps = self.migrate()
+
+        PropertySpaceYearlyRollup = apps.get_model('api', 'PropertySpaceYearlyRollup')
+        self.assertEqual(
+            set(PropertySpaceYearlyRollup.objects.values_list(
+                'property_space_id', 'year', 'measurement_unit', 'total_consumption', 'meter_count', 'total_area',
+            )),
+            {(property_space.id, 2022, 'kWh', 1000, 1, 200), (property_space.id, 2023, 'kWh', 1000, 1, 200)},
+        )
@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import MeterData, UnitSpace
+import os
+
+
+class ResponseCacheTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _get(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        return response, len(queries)
+
+    def test_detail_is_served_from_cache(self):
+        first, first_queries = self._get('/api/v1/property-spaces/1?year=2022')
+        second, second_queries = self._get('/api/v1/property-spaces/1?year=2022')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(first_queries, 1)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second_queries, 0)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(second.json()['total_consumption'], 5000)
+
+    def test_list_is_served_from_cache(self):
+        first, _ = self._get('/api/v1/property-spaces?limit=2')
+        second, queries = self._get('/api/v1/property-spaces?limit=2')
+        self.assertEqual(queries, 0)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['X-Next-Cursor'], first['X-Next-Cursor'])
+        other_page, _ = self._get(f"/api/v1/property-spaces?limit=2&cursor={first['X-Next-Cursor']}")
+        self.assertEqual(other_page['X-Cache'], 'MISS')
+
+    def test_if_none_match_returns_not_modified(self):
+        first, _ = self._get('/api/v1/property-spaces/1')
+        response, queries = self._get('/api/v1/property-spaces/1', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(queries, 0)
+        response, _ = self._get('/api/v1/property-spaces/1', HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_found_is_not_cached(self):
+        self.assertEqual(self.client.get('/api/v1/property-spaces/999').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/property-spaces/999').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/cache-stats').json()['hits'], 0)
+
+    def test_update_and_delete_invalidate(self):
+        self._get('/api/v1/property-spaces/1')
+        self._get('/api/v1/property-spaces')
+        self.client.put(
+            '/api/v1/property-spaces/1',
+            {"name": "Updated Space"},
+            content_type='application/json',
+        )
+        response, _ = self._get('/api/v1/property-spaces/1')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], 'Updated Space')
+        response, _ = self._get('/api/v1/property-spaces')
+        self.assertEqual(response.json()[0]['name'], 'Updated Space')
+
+        self.client.delete('/api/v1/property-spaces/1')
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1').status_code, 404)
+        self.assertNotIn('Updated Space', [item['name'] for item in self.client.get('/api/v1/property-spaces').json()])
+
+    def test_create_invalidates_list(self):
+        before = self.client.get('/api/v1/property-spaces').json()
+        self.client.post('/api/v1/property-spaces', {
+            "name": "New Space",
+            "address": {
+                "street": "New Street",
+                "city": "New City",
+                "state": "New State",
+                "country": "New Country",
+                "postal_code": "12345",
+            },
+        }, content_type='application/json')
+        self.assertEqual(len(self.client.get('/api/v1/property-spaces').json()), len(before) + 1)
+
+    def test_meter_change_invalidates_affected_years_only(self):
+        self._get('/api/v1/property-spaces/1?year=2022')
+        self._get('/api/v1/property-spaces/1?year=2020')
+        self._get('/api/v1/property-spaces/1')
+        self._get('/api/v1/property-spaces/2?year=2022')
+        meter = MeterData.objects.get(id=2)
+        meter.measurement_reading = 2500
+        meter.save()
+
+        response, _ = self._get('/api/v1/property-spaces/1?year=2022')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['total_consumption'], 5500)
+        self.assertEqual(self._get('/api/v1/property-spaces/1')[0]['X-Cache'], 'MISS')
+        self.assertEqual(self._get('/api/v1/property-spaces/1?year=2020')[0]['X-Cache'], 'HIT')
+        self.assertEqual(self._get('/api/v1/property-spaces/2?year=2022')[0]['X-Cache'], 'HIT')
+
+    def test_unit_and_link_changes_invalidate(self):
+        self._get('/api/v1/property-spaces/1?year=2022')
+        self._get('/api/v1/property-spaces/3?year=2022')
+        MeterData.objects.get(id=6).unit_space.add(1)
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1?year=2022').json()['total_consumption'], 7000)
+        self.assertEqual(self.client.get('/api/v1/property-spaces/3?year=2022').json()['total_consumption'], 2000)
+
+        unit = UnitSpace.objects.get(id=1)
+        unit.area = 1500
+        unit.save()
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1?year=2022').json()['total_area'], 6500)
+
+    def test_bulk_ingest_invalidates(self):
+        self._get('/api/v1/property-spaces/1?year=2024')
+        response = self.client.post('/api/v1/meter-data/bulk', {"readings": [{
+            "meter_number": "cache-1",
+            "meter_provider_name": "Provider",
+            "meter_source": "Source",
+            "measurement_reading": 100,
+            "measurement_start_date": datetime(2024, 3, 1, tzinfo=timezone.utc).isoformat(),
+            "measurement_end_date": datetime(2024, 3, 31, tzinfo=timezone.utc).isoformat(),
+            "unit_space_ids": [3],
+        }]}, content_type='application/json')
+        self.assertEqual(response.json()['created'], 1)
+        response, _ = self._get('/api/v1/property-spaces/1?year=2024')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_cache_stats(self):
+        self.client.get('/api/v1/property-spaces/1')
+        self.client.get('/api/v1/property-spaces/1')
+        self.client.get('/api/v1/property-spaces/1')
+        stats = self.client.get('/api/v1/cache-stats').json()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import MeterData, PropertySpace, PropertySpaceYearlyRollup, UnitSpace
+from api.rollups import check_rollup_consistency
+import os
+
+
+class RollupsTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _rollup(self, property_space_id, year):
+        return PropertySpaceYearlyRollup.objects.filter(
+            property_space_id=property_space_id, year=year, measurement_unit="kWh"
+        ).first()
+
+    def test_fixture_rollups(self):
+        self.assertEqual(check_rollup_consistency(), [])
+        rollup = self._rollup(1, 2022)
+        self.assertEqual(rollup.total_consumption, 5000)
+        self.assertEqual(rollup.meter_count, 2)
+        self.assertEqual(rollup.total_area, 6000)
+        self.assertEqual(self._rollup(2, 2022).total_consumption, 3000)
+        self.assertIsNone(self._rollup(1, 2020))
+
+    def test_detail_with_year_reads_rollup(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/property-spaces/2?year=2022')
+        self.assertEqual(response.json()['total_consumption'], 3000)
+        self.assertEqual(len(queries), 1)
+        self.assertIn("api_propertyspaceyearlyrollup", queries[0]['sql'])
+        self.assertNotIn("api_meterdata", queries[0]['sql'])
+
+    def test_adding_link_to_shared_meter(self):
+        MeterData.objects.get(id=6).unit_space.add(1)
+        self.assertEqual(self._rollup(1, 2022).total_consumption, 7000)
+        self.assertEqual(self._rollup(2, 2022).total_consumption, 2000)
+        self.assertEqual(self._rollup(3, 2022).total_consumption, 2000)
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_removing_link_from_reverse_side(self):
+        UnitSpace.objects.get(id=5).meterdata_set.remove(6)
+        self.assertEqual(self._rollup(2, 2022).total_consumption, 6000)
+        self.assertIsNone(self._rollup(3, 2022))
+        UnitSpace.objects.get(id=4).meterdata_set.clear()
+        self.assertIsNone(self._rollup(2, 2022))
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_updating_meter_reading_and_dates(self):
+        meter = MeterData.objects.get(id=2)
+        meter.measurement_reading = 2500
+        meter.save()
+        self.assertEqual(self._rollup(1, 2022).total_consumption, 5500)
+        meter.measurement_start_date = datetime(2020, 12, 1, tzinfo=timezone.utc)
+        meter.measurement_end_date = datetime(2021, 1, 31, tzinfo=timezone.utc)
+        meter.save()
+        self.assertEqual(self._rollup(1, 2022).total_consumption, 3000)
+        self.assertEqual(self._rollup(1, 2020).total_consumption, 2500)
+        self.assertEqual(self._rollup(1, 2021).total_consumption, 3500)
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_deleting_meter(self):
+        MeterData.objects.get(id=6).delete()
+        self.assertEqual(self._rollup(2, 2022), None)
+        self.assertEqual(self._rollup(2, 2023).total_consumption, 4000)
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_updating_unit_area(self):
+        unit = UnitSpace.objects.get(id=1)
+        unit.area = 1500
+        unit.save()
+        self.assertEqual(self._rollup(1, 2022).total_area, 6500)
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_deleting_unit_with_shared_meter(self):
+        UnitSpace.objects.get(id=5).delete()
+        self.assertEqual(self._rollup(2, 2022).total_consumption, 6000)
+        self.assertFalse(PropertySpaceYearlyRollup.objects.filter(property_space_id=3).exists())
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_deleting_property_space(self):
+        PropertySpace.objects.get(id=3).delete()
+        self.assertFalse(PropertySpaceYearlyRollup.objects.filter(property_space_id=3).exists())
+        self.assertEqual(self._rollup(2, 2022).total_consumption, 6000)
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_rebuild_and_check_commands(self):
+        PropertySpaceYearlyRollup.objects.filter(property_space_id=1, year=2022).update(total_consumption=1)
+        PropertySpaceYearlyRollup.objects.filter(property_space_id=2).delete()
+        with self.assertRaises(CommandError):
+            call_command("check_rollups", stdout=StringIO())
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(self._rollup(1, 2022).total_consumption, 5000)
+        call_command("check_rollups", stdout=StringIO())
@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from api.aggregations import annotate_property_space_totals
+from api.endpoints.api_v1 import api_v1
+from api.endpoints.schema_v1 import PropertySpaceOut
+from api.models import Address, PropertySpace, UnitSpace
+from api.synthetic import generate_synthetic_data
+import os
+
+
+def schema_dict(property_space):
+    # The reference output: the annotated model validated by the response schema.
+    return PropertySpaceOut.model_validate({
+        "name": property_space.name,
+        "address": property_space.address,
+        "number_of_units": property_space.number_of_units,
+        "total_area": property_space.total_area,
+        "total_consumption": property_space.total_consumption,
+        "consumption_unit": "kWh",
+    })
+
+
+class FastSerializationTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_synthetic_data(properties=30, readings=600, seed=3)
+        address = Address.objects.create(
+            street='1 "Quoted" Straße', city="Zürich", state="ZH", country="Schweiz", postal_code="8001"
+        )
+        property_space = PropertySpace.objects.create(address=address, name="Café Ω \\ tab\t")
+        UnitSpace.objects.create(name="unit", area=1234, property_space=property_space)
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _expected(self, year=None, use_rollup=False, **filters):
+        property_spaces = annotate_property_space_totals(
+            PropertySpace.objects.filter(**filters).select_related("address").order_by("id"), year, use_rollup
+        )
+        return [schema_dict(property_space) for property_space in property_spaces]
+
+    def _render(self, data):
+        return api_v1.create_response(RequestFactory().get('/'), data, status=200).content
+
+    def test_list_is_byte_equivalent(self):
+        for year in [None, 2022]:
+            query = f"&year={year}" if year else ""
+            response = self.client.get(f'/api/v1/property-spaces?limit=1000{query}')
+            expected = self._render([item.model_dump() for item in self._expected(year)])
+            self.assertEqual(response.content, expected)
+
+    def test_detail_is_byte_equivalent(self):
+        for property_space_id in PropertySpace.objects.values_list("id", flat=True):
+            response = self.client.get(f'/api/v1/property-spaces/{property_space_id}?year=2021')
+            expected = self._render(self._expected(2021, use_rollup=True, id=property_space_id)[0].model_dump())
+            self.assertEqual(response.content, expected)
+
+    def test_export_is_byte_equivalent(self):
+        response = self.client.get('/api/v1/property-spaces/export')
+        expected = "".join(item.model_dump_json() + "\n" for item in self._expected()).encode()
+        self.assertEqual(b"".join(response.streaming_content), expected)
+
+    def test_openapi_schema_is_unchanged(self):
+        # The full schema, then the variant of the `fields` parameter.
+        schema = api_v1.get_openapi_schema()
+        for path in ["/api/v1/property-spaces", "/api/v1/property-spaces/{property_space_id}"]:
+            content = schema["paths"][path]["get"]["responses"][200]["content"]["application/json"]["schema"]
+            if path == "/api/v1/property-spaces":
+                # The plain list, or the page object of `envelope=true`.
+                self.assertEqual(content["anyOf"][1], {"$ref": "#/components/schemas/PropertySpacesPageOut"})
+                content = content["anyOf"][0]
+            references = [variant["$ref"] for variant in content.get("items", content)["anyOf"]]
+            self.assertEqual(references, [
+                "#/components/schemas/PropertySpaceOut",
+                "#/components/schemas/PropertySpaceFieldsOut",
+            ])
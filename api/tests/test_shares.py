@@ -0,0 +1,55 @@
+from django.core.cache import cache
+from django.test import TestCase
+from api.models import MeterData, UnitSpace
+from api.rollups import check_rollup_consistency
+from api.shares import refresh_meter_shares
+import os
+
+
+class MeterSharesTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _share(self, meter_id):
+        return MeterData.objects.filter(id=meter_id).values_list("share_count", "share_reading").get()
+
+    def test_fixture_shares(self):
+        self.assertEqual(self._share(6), (2, 3000))
+        self.assertEqual(self._share(1), (1, 1000))
+
+    def test_adding_and_removing_links(self):
+        meter = MeterData.objects.get(id=6)
+        meter.unit_space.add(1)
+        self.assertEqual(self._share(6), (3, 2000))
+        self.assertEqual((meter.share_count, meter.share_reading), (3, 2000))
+
+        UnitSpace.objects.get(id=5).meterdata_set.remove(6)
+        meter.unit_space.remove(4)
+        self.assertEqual(self._share(6), (1, 6000))
+        self.assertEqual(check_rollup_consistency(), [])
+
+        meter.unit_space.clear()
+        self.assertEqual(self._share(6), (0, 0))
+
+    def test_saving_meter_keeps_share(self):
+        before = self.client.get('/api/v1/property-spaces/3').json()['total_consumption']
+        meter = MeterData.objects.get(id=6)
+        meter.measurement_reading = 8000
+        meter.save()
+        self.assertEqual(self._share(6), (2, 4000))
+        response = self.client.get('/api/v1/property-spaces/3')
+        self.assertEqual(response.json()['total_consumption'], before + 1000)
+
+    def test_deleting_unit_updates_share(self):
+        UnitSpace.objects.get(id=5).delete()
+        self.assertEqual(self._share(6), (1, 6000))
+
+    def test_refresh_repairs_shares(self):
+        MeterData.objects.update(share_count=0, share_reading=0)
+        refresh_meter_shares()
+        self.assertEqual(self._share(6), (2, 3000))
+        self.assertEqual(self._share(1), (1, 1000))
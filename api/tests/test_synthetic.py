@@ -0,0 +1,52 @@
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test import TestCase
+from api.models import MeterData, PropertySpace, UnitSpace
+from api.rollups import check_rollup_consistency
+from api.synthetic import generate_synthetic_data
+
+
+def _snapshot():
+    return [
+        (meter.meter_number, meter.measurement_reading, meter.measurement_start_date, meter.measurement_end_date,
+         sorted((unit.property_space.name, unit.name, unit.area) for unit in meter.unit_space.all()))
+        for meter in MeterData.objects.order_by("meter_number").prefetch_related("unit_space__property_space")
+    ]
+
+
+class SyntheticDataTestCase(TestCase):
+
+    def test_counts_and_shares(self):
+        counts = generate_synthetic_data(properties=5, units_per_property=3, readings=400, shared_fraction=0.25, seed=1)
+        self.assertEqual(counts["property_spaces"], 5)
+        self.assertEqual(counts["unit_spaces"], 15)
+        self.assertEqual(counts["meter_readings"], 400)
+        self.assertEqual(PropertySpace.objects.count(), 5)
+        self.assertEqual(UnitSpace.objects.count(), 15)
+        self.assertEqual(MeterData.objects.count(), 400)
+
+        meters = MeterData.objects.annotate(links=Count("unit_space"))
+        shared = sum(1 for meter in meters if meter.links > 1)
+        self.assertTrue(60 <= shared <= 140, shared)
+        for meter in meters:
+            self.assertEqual(meter.share_count, meter.links)
+            self.assertAlmostEqual(meter.share_reading, meter.measurement_reading / meter.links)
+        self.assertEqual(check_rollup_consistency(), [])
+
+    def test_same_seed_same_data(self):
+        with transaction.atomic():
+            generate_synthetic_data(properties=3, readings=50, seed=7, batch_size=20)
+            first = _snapshot()
+            transaction.set_rollback(True)
+        generate_synthetic_data(properties=3, readings=50, seed=7, batch_size=20)
+        self.assertEqual(_snapshot(), first)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("generate_synthetic_data", "--properties", "2", "--readings", "10", stdout=out)
+        self.assertIn("Created 2 property spaces, 8 unit spaces, 10 readings", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("generate_synthetic_data", "--shared-fraction", "2", stdout=StringIO())
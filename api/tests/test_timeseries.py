@@ -0,0 +1,104 @@
+from datetime import date, datetime, timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.exceptions import BadRequestException
+from api.models import MeterData
+from api.timeseries import consumption_time_series
+import os
+
+
+class ConsumptionTimeSeriesTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _totals(self, series):
+        return {bucket['period']: bucket['total_consumption'] for bucket in series}
+
+    def _add_meter(self, start, end, reading, unit_space_ids):
+        meter = MeterData.objects.create(
+            meter_number=f"series-{start.isoformat()}",
+            meter_provider_name="Provider",
+            meter_source="Source",
+            measurement_reading=reading,
+            measurement_start_date=start,
+            measurement_end_date=end,
+        )
+        meter.unit_space.set(unit_space_ids)
+        return meter
+
+    def test_yearly_series(self):
+        series = consumption_time_series(1, date(2020, 1, 1), date(2023, 12, 31))
+        self.assertEqual(self._totals(series), {"2020": 0, "2021": 1000, "2022": 5000, "2023": 0})
+        self.assertEqual(series[1]['start'], datetime(2021, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(series[1]['end'], datetime(2022, 1, 1, tzinfo=timezone.utc))
+
+    def test_monthly_series(self):
+        series = consumption_time_series(1, date(2022, 1, 15), date(2022, 4, 1), granularity="month")
+        self.assertEqual(self._totals(series), {"2022-01": 0, "2022-02": 2000, "2022-03": 3000, "2022-04": 0})
+
+    def test_shared_meter_is_divided(self):
+        series = consumption_time_series(2, date(2022, 1, 1), date(2023, 12, 31))
+        self.assertEqual(self._totals(series), {"2022": 3000, "2023": 4000})
+
+    def test_reading_crossing_a_boundary(self):
+        self._add_meter(
+            datetime(2022, 12, 17, tzinfo=timezone.utc), datetime(2023, 1, 16, tzinfo=timezone.utc), 3000, [1]
+        )
+        series = consumption_time_series(1, date(2022, 1, 1), date(2023, 12, 31))
+        self.assertEqual(self._totals(series), {"2022": 8000, "2023": 3000})
+        series = consumption_time_series(1, date(2022, 1, 1), date(2023, 12, 31), prorate=True)
+        self.assertEqual(self._totals(series), {"2022": 6500, "2023": 1500})
+        series = consumption_time_series(1, date(2022, 12, 1), date(2023, 1, 31), granularity="month", prorate=True)
+        self.assertEqual(self._totals(series), {"2022-12": 1500, "2023-01": 1500})
+
+    def test_prorated_reading_over_several_buckets(self):
+        self._add_meter(
+            datetime(2023, 1, 1, tzinfo=timezone.utc), datetime(2023, 4, 1, tzinfo=timezone.utc), 900, [1, 2]
+        )
+        series = consumption_time_series(1, date(2023, 1, 1), date(2023, 3, 31), granularity="month", prorate=True)
+        self.assertAlmostEqual(sum(self._totals(series).values()), 900)
+        self.assertAlmostEqual(self._totals(series)["2023-02"], 900 * 28 / 90)
+
+    def test_query_count_does_not_depend_on_the_range(self):
+        for start_year, granularity in [(2022, "year"), (1950, "year"), (1950, "month")]:
+            for prorate in [False, True]:
+                with CaptureQueriesContext(connection) as queries:
+                    consumption_time_series(1, date(start_year, 1, 1), date(2024, 12, 31), granularity, prorate)
+                self.assertEqual(len(queries), 1)
+
+    def test_invalid_range(self):
+        with self.assertRaises(BadRequestException):
+            consumption_time_series(1, date(2023, 1, 1), date(2022, 1, 1))
+        with self.assertRaises(BadRequestException):
+            consumption_time_series(1, date(1000, 1, 1), date(2022, 1, 1), granularity="month")
+
+    def test_endpoint(self):
+        response = self.client.get(
+            '/api/v1/property-spaces/1/consumption?start=2021-01-01&end=2022-12-31&granularity=year'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "property_space_id": 1,
+            "granularity": "year",
+            "prorated": False,
+            "consumption_unit": "kWh",
+            "buckets": [
+                {"period": "2021", "start": "2021-01-01T00:00:00Z", "end": "2022-01-01T00:00:00Z", "total_consumption": 1000},
+                {"period": "2022", "start": "2022-01-01T00:00:00Z", "end": "2023-01-01T00:00:00Z", "total_consumption": 5000},
+            ],
+        })
+
+    def test_endpoint_errors(self):
+        self.assertEqual(self.client.get('/api/v1/property-spaces/999/consumption?start=2021-01-01&end=2022-12-31').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1/consumption?start=2023-01-01&end=2022-12-31').status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/v1/property-spaces/1/consumption?start=2021-01-01&end=2022-12-31&granularity=week').status_code,
+            422,
+        )
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1/consumption').status_code, 422)
@@ -0,0 +1,136 @@
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from api.models import Address, PropertySpace, PropertySpaceYearlyRollup, UnitSpace
+import os
+
+
+def _property(external_id, units=2, name=None, city="Oakland"):
+    return {
+        "external_id": external_id,
+        "name": name or f"property {external_id}",
+        "address": {
+            "street": f"{external_id} Import St",
+            "city": city,
+            "state": "CA",
+            "country": "USA",
+            "postal_code": "94607",
+        },
+        "units": [
+            {"external_id": f"u{index}", "name": f"unit {index}", "unit_type": "LEASED", "area": 100 * (index + 1)}
+            for index in range(units)
+        ],
+    }
+
+
+class TopologyImportTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        return super().setUp()
+
+    def _import(self, properties, upsert=False):
+        return self.client.post(
+            '/api/v1/property-spaces/import',
+            {"properties": properties, "upsert": upsert},
+            content_type='application/json',
+        )
+
+    def test_import(self):
+        response = self._import([_property("a"), _property("b", units=3)])
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['created'], result['updated'], result['units_created']), (2, 0, 5))
+        property_space = PropertySpace.objects.select_related("address").get(id=result['property_spaces']['a'])
+        self.assertEqual((property_space.name, property_space.address.street), ("property a", "a Import St"))
+        unit = UnitSpace.objects.get(id=result['unit_spaces']['b']['u2'])
+        self.assertEqual((unit.property_space_id, unit.area, unit.unit_type), (result['property_spaces']['b'], 300, "LEASED"))
+
+        detail = self.client.get(f"/api/v1/property-spaces/{result['property_spaces']['b']}").json()
+        self.assertEqual((detail['number_of_units'], detail['total_area']), (3, 600))
+
+    def test_queries_per_batch_not_per_row(self):
+        with CaptureQueriesContext(connection) as small:
+            self._import([_property(f"small-{index}") for index in range(2)])
+        with CaptureQueriesContext(connection) as large:
+            self._import([_property(f"large-{index}", units=4) for index in range(200)])
+        # 6 statements for the import, 3 to move the property spaces forward in the change feed.
+        self.assertEqual(len(small), 9)
+        # SQLite limits the parameters of a statement, the 1000 rows of a batch take a few INSERTs.
+        self.assertLess(len(large), 18)
+
+    def test_existing_external_id_without_upsert(self):
+        self._import([_property("a")])
+        response = self._import([_property("b"), _property("a")])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PropertySpace.objects.filter(external_id="b").exists())
+
+    def test_duplicate_external_ids(self):
+        self.assertEqual(self._import([_property("a"), _property("a")]).status_code, 400)
+        duplicate_units = _property("c")
+        duplicate_units["units"][1]["external_id"] = "u0"
+        self.assertEqual(self._import([duplicate_units]).status_code, 400)
+        self.assertEqual(PropertySpace.objects.filter(external_id__isnull=False).count(), 0)
+
+    def test_upsert(self):
+        first = self._import([_property("a", units=2)]).json()
+        property_space_id = first['property_spaces']['a']
+        self.client.get(f"/api/v1/property-spaces/{property_space_id}")
+        self.client.get("/api/v1/property-spaces")
+
+        updated = _property("a", units=3, name="renamed", city="Berkeley")
+        updated["units"][0]["area"] = 1000
+        response = self._import([updated, _property("b")], upsert=True)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(
+            (result['created'], result['updated'], result['units_created'], result['units_updated']),
+            (1, 1, 3, 2),
+        )
+        self.assertEqual(result['property_spaces']['a'], property_space_id)
+        self.assertEqual(result['unit_spaces']['a']['u0'], first['unit_spaces']['a']['u0'])
+        self.assertEqual(Address.objects.get(propertyspace__id=property_space_id).city, "Berkeley")
+
+        detail = self.client.get(f"/api/v1/property-spaces/{property_space_id}")
+        self.assertEqual(detail['X-Cache'], 'MISS')
+        self.assertEqual(detail.json()['name'], "renamed")
+        self.assertEqual((detail.json()['number_of_units'], detail.json()['total_area']), (3, 1500))
+        self.assertIn("property b", [item['name'] for item in self.client.get("/api/v1/property-spaces").json()])
+
+    def test_upsert_requires_unit_external_ids(self):
+        # A unit without an external ID could not be matched, it would be created again on every upsert.
+        self._import([_property("a")])
+        unkeyed = _property("a")
+        unkeyed["units"].append({"name": "unit without external id", "area": 50})
+        response = self._import([unkeyed], upsert=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("external_id", response.json()['message'])
+        self.assertEqual(UnitSpace.objects.filter(property_space__external_id="a").count(), 2)
+        # Without upsert, the units need no external ID.
+        self.assertEqual(self._import([unkeyed | {"external_id": "b"}]).status_code, 200)
+
+    def test_concurrent_import_conflict(self):
+        # A concurrent import created the same property space between the lookup and the insert.
+        with mock.patch.object(PropertySpace.objects, "bulk_create", side_effect=IntegrityError("UNIQUE constraint failed")):
+            response = self._import([_property("a")], upsert=True)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Address.objects.filter(street="a Import St").exists())
+
+    def test_upsert_refreshes_the_rollups(self):
+        PropertySpace.objects.filter(id=1).update(external_id="fixture-1")
+        UnitSpace.objects.filter(id=1).update(external_id="u0")
+        imported = _property("fixture-1", units=1)
+        imported["units"][0]["area"] = 4000
+        self._import([imported], upsert=True)
+        rollup = PropertySpaceYearlyRollup.objects.get(property_space_id=1, year=2022)
+        self.assertEqual(rollup.total_area, 9000)
+        self.assertEqual(self.client.get('/api/v1/property-spaces/1?year=2022').json()['total_area'], 9000)
+
+    def test_invalid_payload(self):
+        invalid = _property("a")
+        invalid["units"][0]["unit_type"] = "OFFICE"
+        self.assertEqual(self._import([invalid]).status_code, 422)
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from api.models import MeterData
+from api.units import DEFAULT_KWH_FACTORS
+import os
+
+
+THERM_KWH = DEFAULT_KWH_FACTORS["therms"]
+
+
+class UnitNormalizationTestCase(TestCase):
+    fixtures = ['api_testing_fixture.json']
+
+    def setUp(self) -> None:
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer ' + os.getenv('AUTH_TOKEN')
+        cache.clear()
+        # A gas meter of 100 therms on unit space 1 of property space 1, in 2022.
+        meter = MeterData.objects.create(
+            meter_number="gas-1",
+            meter_provider_name="Gas Provider",
+            meter_source="Gas Source",
+            measurement_reading=100,
+            measurement_unit="therms",
+            measurement_start_date=datetime(2022, 7, 1, tzinfo=timezone.utc),
+            measurement_end_date=datetime(2022, 7, 31, tzinfo=timezone.utc),
+        )
+        meter.unit_space.set([1])
+        return super().setUp()
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_detail_converted_to_kwh_by_default(self):
+        data = self._get('/api/v1/property-spaces/1')
+        self.assertAlmostEqual(data['total_consumption'], 6000 + 100 * THERM_KWH)
+        self.assertEqual(data['consumption_unit'], 'kWh')
+
+        # The yearly rollups are stored per unit and converted when read.
+        data = self._get('/api/v1/property-spaces/1?year=2022')
+        self.assertAlmostEqual(data['total_consumption'], 5000 + 100 * THERM_KWH)
+
+    def test_detail_converted_to_requested_unit(self):
+        for url in ['/api/v1/property-spaces/1?year=2022&unit=therms', '/api/v1/async/property-spaces/1?year=2022&unit=therms']:
+            data = self._get(url)
+            self.assertAlmostEqual(data['total_consumption'], 5000 / THERM_KWH + 100)
+            self.assertEqual(data['consumption_unit'], 'therms')
+
+        data = self._get('/api/v1/property-spaces/1?year=2022&unit=therms&fields=total_consumption,consumption_unit')
+        self.assertAlmostEqual(data['total_consumption'], 5000 / THERM_KWH + 100)
+        self.assertEqual(data['consumption_unit'], 'therms')
+
+    def test_cached_per_unit(self):
+        kwh = self._get('/api/v1/property-spaces/1?year=2022')
+        therms = self._get('/api/v1/property-spaces/1?year=2022&unit=therms')
+        self.assertNotAlmostEqual(kwh['total_consumption'], therms['total_consumption'])
+        self.assertEqual(self._get('/api/v1/property-spaces/1?year=2022&unit=kWh'), kwh)
+
+        # The responses in therms are invalidated with the others.
+        MeterData.objects.filter(meter_number="gas-1").update(measurement_reading=200)
+        MeterData.objects.get(meter_number="gas-1").save()
+        therms = self._get('/api/v1/property-spaces/1?year=2022&unit=therms')
+        self.assertAlmostEqual(therms['total_consumption'], 5000 / THERM_KWH + 200)
+
+    def test_list_and_export(self):
+        data = self._get('/api/v1/property-spaces?unit=therms')
+        self.assertAlmostEqual(data[0]['total_consumption'], 6000 / THERM_KWH + 100)
+        self.assertEqual({item['consumption_unit'] for item in data}, {'therms'})
+
+        response = self.client.get('/api/v1/property-spaces/export?unit=therms')
+        self.assertIn(b'"consumption_unit":"therms"', b"".join(response.streaming_content))
+
+    def test_no_extra_query(self):
+        for url in ['/api/v1/property-spaces/1?year=2022', '/api/v1/property-spaces?year=2022&unit=therms']:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self._get(url)
+            self.assertEqual(len(queries), 1)
+            self.assertIn('CASE WHEN', queries[0]['sql'])
+
+    def test_series_and_analytics(self):
+        data = self._get('/api/v1/property-spaces/1/consumption?start=2022-01-01&end=2022-12-31&unit=therms')
+        self.assertEqual(data['consumption_unit'], 'therms')
+        self.assertAlmostEqual(data['buckets'][0]['total_consumption'], 5000 / THERM_KWH + 100)
+
+        data = self._get('/api/v1/analytics/portfolio?group_by=unit_type&year=2022')
+        groups = {group['group']['unit_type']: group['total_consumption'] for group in data['groups']}
+        self.assertAlmostEqual(groups['COMMON_AREA'], 100 * THERM_KWH + 6000)
+
+        data = self._get('/api/v1/analytics/intensity-ranking?year=2022&unit=therms')
+        self.assertEqual(data['consumption_unit'], 'therms')
+        totals = {item['id']: item['total_consumption'] for item in data['property_spaces']}
+        self.assertAlmostEqual(totals[1], 5000 / THERM_KWH + 100)
+
+    @override_settings(MEASUREMENT_UNIT_KWH_FACTORS={'kWh': 1.0, 'therms': 30.0, 'MJ': 1 / 3.6})
+    def test_configurable_conversion_table(self):
+        data = self._get('/api/v1/property-spaces/1?year=2022')
+        self.assertAlmostEqual(data['total_consumption'], 5000 + 100 * 30)
+        data = self._get('/api/v1/property-spaces/1?year=2022&unit=MJ')
+        self.assertAlmostEqual(data['total_consumption'], (5000 + 100 * 30) * 3.6)
+
+    def test_invalid_unit(self):
+        response = self.client.get('/api/v1/property-spaces/1?unit=BTU')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid unit: BTU', response.json()['message'])
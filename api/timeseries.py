@@ -0,0 +1,148 @@
+# Description: Consumption time series of a property space, bucketed by year or month.
+# Without pro-rating, a reading counts in the bucket it starts in and in the bucket it
+# ends in, like the `year` filter of the API. The readings are grouped in SQL by the
+# pair of (start bucket, end bucket), so the number of rows returned depends on the
+# number of buckets, not on the number of meters.
+# With pro-rating, a reading is split between the buckets it overlaps in proportion
+# to the overlapping time. The readings are grouped by measurement period in SQL and
+# split in Python, since the split needs the exact dates.
+
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+from api.exceptions import BadRequestException
+from api.models import MeterDataUnitSpace
+from api.units import converted
+
+GRANULARITIES = ["year", "month"]
+
+# Upper bound of the number of buckets of a series, e.g. 100 years of months.
+MAX_BUCKETS = 1200
+
+
+def _bucket_start(value: datetime, granularity: str) -> datetime:
+    value = timezone.localtime(value)
+    month = value.month if granularity == "month" else 1
+    return value.replace(month=month, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_bucket_start(bucket_start: datetime, granularity: str) -> datetime:
+    tz = timezone.get_current_timezone()
+    if granularity == "year":
+        return datetime(bucket_start.year + 1, 1, 1, tzinfo=tz)
+    year, month = divmod(bucket_start.month, 12)
+    return datetime(bucket_start.year + year, month + 1, 1, tzinfo=tz)
+
+
+def _bucket_label(bucket_start: datetime, granularity: str) -> str:
+    return f"{bucket_start.year}" if granularity == "year" else f"{bucket_start.year}-{bucket_start.month:02d}"
+
+
+def bucket_range(start: date, end: date, granularity: str) -> List[Tuple[datetime, datetime]]:
+    """
+    Return the (start, end) bounds of the buckets covering the dates from start to end, both included.
+
+    Args:
+        start (date): The first day of the range.
+        end (date): The last day of the range.
+        granularity (str): "year" or "month".
+    """
+    if granularity not in GRANULARITIES:
+        raise BadRequestException(f"Invalid granularity: {granularity}")
+    if end < start:
+        raise BadRequestException("end is before start")
+    tz = timezone.get_current_timezone()
+    bucket = _bucket_start(datetime(start.year, start.month, start.day, tzinfo=tz), granularity)
+    last = datetime(end.year, end.month, end.day, tzinfo=tz)
+    buckets = []
+    while bucket <= last:
+        next_bucket = _next_bucket_start(bucket, granularity)
+        buckets.append((bucket, next_bucket))
+        bucket = next_bucket
+        if len(buckets) > MAX_BUCKETS:
+            raise BadRequestException(f"The range covers more than {MAX_BUCKETS} buckets")
+    return buckets
+
+
+def consumption_time_series(
+    property_space_id: int,
+    start: date,
+    end: date,
+    granularity: str = "year",
+    prorate: bool = False,
+    unit: str = None,
+) -> List[dict]:
+    """
+    Return the consumption of a property space per bucket, with one query.
+    Shared meters are divided between their units, and the readings are converted to the
+    target unit, like the property space totals.
+
+    Args:
+        property_space_id (int): The property space ID.
+        start (date): The first day of the range.
+        end (date): The last day of the range, included.
+        granularity (str): "year" or "month".
+        prorate (bool): Split the readings crossing a bucket boundary in proportion to the time in each bucket.
+        unit (str): The unit of the totals, the default unit if None.
+    """
+    buckets = bucket_range(start, end, granularity)
+    range_start, range_end = buckets[0][0], buckets[-1][1]
+    totals: Dict[datetime, float] = {bucket_start: 0.0 for bucket_start, _ in buckets}
+
+    links = MeterDataUnitSpace.objects.filter(
+        unitspace__property_space_id=property_space_id,
+        meterdata__measurement_start_date__lt=range_end,
+        meterdata__measurement_end_date__gte=range_start,
+    )
+    reading = converted("meterdata__share_reading", "meterdata__measurement_unit", unit)
+    if prorate:
+        rows = (
+            links
+            .values_list("meterdata__measurement_start_date", "meterdata__measurement_end_date")
+            .annotate(total=Sum(reading))
+        )
+        for reading_start, reading_end, total in rows:
+            _add_prorated(totals, reading_start, reading_end, total, granularity)
+    else:
+        trunc = TruncYear if granularity == "year" else TruncMonth
+        tz = timezone.get_current_timezone()
+        rows = (
+            links
+            .annotate(
+                start_bucket=trunc("meterdata__measurement_start_date", tzinfo=tz),
+                end_bucket=trunc("meterdata__measurement_end_date", tzinfo=tz),
+            )
+            .values_list("start_bucket", "end_bucket")
+            .annotate(total=Sum(reading))
+        )
+        for start_bucket, end_bucket, total in rows:
+            for bucket_start in {start_bucket, end_bucket}:
+                if bucket_start in totals:
+                    totals[bucket_start] += total
+
+    return [
+        {
+            "period": _bucket_label(bucket_start, granularity),
+            "start": bucket_start,
+            "end": bucket_end,
+            "total_consumption": totals[bucket_start],
+        }
+        for bucket_start, bucket_end in buckets
+    ]
+
+
+def _add_prorated(totals: Dict[datetime, float], reading_start: datetime, reading_end: datetime, total: float, granularity: str):
+    duration = (reading_end - reading_start).total_seconds()
+    bucket_start = _bucket_start(reading_start, granularity)
+    if duration <= 0:
+        if bucket_start in totals:
+            totals[bucket_start] += total
+        return
+    while bucket_start < reading_end:
+        bucket_end = _next_bucket_start(bucket_start, granularity)
+        if bucket_start in totals:
+            overlap = (min(reading_end, bucket_end) - max(reading_start, bucket_start)).total_seconds()
+            totals[bucket_start] += total * overlap / duration
+        bucket_start = bucket_end
@@ -0,0 +1,193 @@
+# Description: Bulk import of property spaces with their addresses and unit spaces.
+# The rows are written with `bulk_create` in dependency order (addresses, property
+# spaces, unit spaces) in a single transaction, so a portfolio is imported in a few
+# statements per batch and either entirely or not at all. Property spaces are
+# identified by their `external_id`; in upsert mode, the existing ones are updated
+# in place with `bulk_update`, along with their units matched on their `external_id`,
+# which the units must then have: a unit without one could not be matched on the next import.
+# The existing property spaces are looked up in the transaction, and a property space
+# created by a concurrent import in the meantime is reported as a conflict.
+
+from typing import Dict, Iterable, List
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from api.exceptions import BadRequestException, ConflictException
+from api.models import Address, PropertySpace, UnitSpace
+from api.signals import notify_property_spaces_changed
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+
+ADDRESS_FIELDS = ["street", "city", "state", "country", "postal_code"]
+UNIT_SPACE_FIELDS = ["name", "unit_type", "area"]
+UNIT_TYPES = {unit_type for unit_type, _ in UnitSpace.UNIT_TYPE_CHOICES}
+
+
+def _validate(properties: List[dict], upsert: bool) -> None:
+    external_ids = set()
+    for index, property_space in enumerate(properties):
+        if property_space["external_id"] in external_ids:
+            raise BadRequestException(f"Duplicate property space external_id: {property_space['external_id']}")
+        external_ids.add(property_space["external_id"])
+        unit_external_ids = set()
+        for unit in property_space.get("units", []):
+            if unit.get("unit_type", "COMMON_AREA") not in UNIT_TYPES:
+                raise BadRequestException(f"Invalid unit_type in property space {index}: {unit['unit_type']}")
+            unit_external_id = unit.get("external_id")
+            if unit_external_id is None:
+                if upsert:
+                    raise BadRequestException(
+                        f"Unit spaces need an external_id to be upserted, in property space {property_space['external_id']}"
+                    )
+                continue
+            if unit_external_id in unit_external_ids:
+                raise BadRequestException(
+                    f"Duplicate unit space external_id in property space {property_space['external_id']}: {unit_external_id}"
+                )
+            unit_external_ids.add(unit_external_id)
+
+
+def _unit_space(unit: dict, property_space_id: int) -> UnitSpace:
+    return UnitSpace(
+        name=unit["name"],
+        unit_type=unit.get("unit_type", "COMMON_AREA"),
+        area=unit["area"],
+        property_space_id=property_space_id,
+        external_id=unit.get("external_id"),
+    )
+
+
+def import_topology(properties: Iterable[dict], upsert: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Create property spaces with their address and unit spaces, or update them in upsert mode.
+    Returns the number of created and updated property spaces and unit spaces, and the primary keys
+    by external ID: `property_spaces` maps the property space external IDs, `unit_spaces` maps the
+    unit space external IDs within each property space.
+    Raises BadRequestException if an external ID is repeated, already exists outside of the upsert mode,
+    or is missing from a unit in upsert mode, and ConflictException if a concurrent import created
+    the same property spaces or units.
+
+    Args:
+        properties (Iterable[dict]): The property spaces, with `external_id`, `name`, `address` and `units`.
+        upsert (bool): Update the property spaces whose external ID exists instead of failing.
+        batch_size (int): The number of rows per INSERT or UPDATE statement.
+    """
+    properties = list(properties)
+    _validate(properties, upsert)
+
+    try:
+        with transaction.atomic():
+            existing = {
+                external_id: (property_space_id, address_id)
+                for external_id, property_space_id, address_id in PropertySpace.objects
+                .filter(external_id__in=[property_space["external_id"] for property_space in properties])
+                .values_list("external_id", "id", "address_id")
+            }
+            if existing and not upsert:
+                raise BadRequestException(f"Property spaces already exist: {sorted(existing)}")
+
+            new_properties = [property_space for property_space in properties if property_space["external_id"] not in existing]
+            updated_properties = [property_space for property_space in properties if property_space["external_id"] in existing]
+
+            addresses = Address.objects.bulk_create(
+                [Address(**{field: property_space["address"][field] for field in ADDRESS_FIELDS}) for property_space in new_properties],
+                batch_size=batch_size,
+            )
+            created = PropertySpace.objects.bulk_create(
+                [
+                    PropertySpace(name=property_space["name"], address=address, external_id=property_space["external_id"])
+                    for property_space, address in zip(new_properties, addresses)
+                ],
+                batch_size=batch_size,
+            )
+            property_space_ids: Dict[str, int] = {
+                property_space.external_id: property_space.id for property_space in created
+            }
+            property_space_ids.update({external_id: ids[0] for external_id, ids in existing.items()})
+
+            new_units: List[UnitSpace] = []
+            updated_units: List[UnitSpace] = []
+            if updated_properties:
+                _update_properties(updated_properties, existing, batch_size)
+                existing_units = {
+                    (property_space_id, external_id): unit_id
+                    for unit_id, property_space_id, external_id in UnitSpace.objects
+                    .filter(
+                        property_space_id__in=[existing[property_space["external_id"]][0] for property_space in updated_properties],
+                        external_id__isnull=False,
+                    )
+                    .values_list("id", "property_space_id", "external_id")
+                }
+            else:
+                existing_units = {}
+
+            for property_space in properties:
+                property_space_id = property_space_ids[property_space["external_id"]]
+                for unit in property_space.get("units", []):
+                    unit_space = _unit_space(unit, property_space_id)
+                    unit_space.id = existing_units.get((property_space_id, unit.get("external_id")))
+                    (new_units if unit_space.id is None else updated_units).append(unit_space)
+
+            UnitSpace.objects.bulk_create(new_units, batch_size=batch_size)
+            # bulk_update does not set the auto_now fields.
+            updated_at = timezone.now()
+            for unit_space in updated_units:
+                unit_space.updated_at = updated_at
+            UnitSpace.objects.bulk_update(updated_units, [*UNIT_SPACE_FIELDS, "updated_at"], batch_size=batch_size)
+
+            # bulk_create and bulk_update bypass the model signals.
+            # The new property spaces have no meters, only the updated ones have rollups to refresh.
+            notify_property_spaces_changed([property_space.id for property_space in created], rollups_updated=True)
+            notify_property_spaces_changed([existing[property_space["external_id"]][0] for property_space in updated_properties])
+    except IntegrityError as error:
+        raise ConflictException(f"The property spaces or units were changed by a concurrent import: {error}")
+
+    unit_space_ids: Dict[str, Dict[str, int]] = {}
+    for unit_space in new_units + updated_units:
+        if unit_space.external_id is not None:
+            unit_space_ids.setdefault(unit_space.property_space_id, {})[unit_space.external_id] = unit_space.id
+    result = {
+        "created": len(created),
+        "updated": len(updated_properties),
+        "units_created": len(new_units),
+        "units_updated": len(updated_units),
+        "property_spaces": property_space_ids,
+        "unit_spaces": {
+            external_id: unit_space_ids[property_space_id]
+            for external_id, property_space_id in property_space_ids.items()
+            if property_space_id in unit_space_ids
+        },
+    }
+    logger.info(
+        f"Imported {result['created']} new and {result['updated']} updated property spaces, "
+        f"{result['units_created']} new and {result['units_updated']} updated unit spaces"
+    )
+    return result
+
+
+def _update_properties(properties: List[dict], existing: Dict[str, tuple], batch_size: int) -> None:
+    # The change sequence and the time of the property spaces are updated by `notify_property_spaces_changed`.
+    updated_at = timezone.now()
+    PropertySpace.objects.bulk_update(
+        [
+            PropertySpace(id=existing[property_space["external_id"]][0], name=property_space["name"])
+            for property_space in properties
+        ],
+        ["name"],
+        batch_size=batch_size,
+    )
+    Address.objects.bulk_update(
+        [
+            Address(
+                id=existing[property_space["external_id"]][1],
+                updated_at=updated_at,
+                **{field: property_space["address"][field] for field in ADDRESS_FIELDS},
+            )
+            for property_space in properties
+        ],
+        [*ADDRESS_FIELDS, "updated_at"],
+        batch_size=batch_size,
+    )
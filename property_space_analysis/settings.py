@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
+from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+	'api.middleware.RequestInstrumentationMiddleware',
+	'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,7 +83,7 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
     # 'default': {
     #     'ENGINE': 'django.db.backends.postgresql',
     #     'NAME': 'psdj_1m',
@@ -87,9 +91,120 @@ DATABASES = {
     #     'PASSWORD': '',
     #     'HOST': 'localhost',
     #     'PORT': '5432',
+    # },
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.postgresql',
+    #     'NAME': 'psdj_1m',
+    #     'USER': '',
+    #     'PASSWORD': '',
+    #     'HOST': 'replica.localhost',
+    #     'PORT': '5432',
+    #     'TEST': {'MIRROR': 'default'},
     # }
 }
 
+# Read replicas
+# The read-only endpoints read from these DATABASES aliases, with their weights,
+# e.g. {'replica': 1}. Every write and the other reads use the primary, `default`.
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+DATABASE_REPLICAS = {}
+
+# 'round_robin' (weighted) or 'random' (in proportion to the weights).
+DATABASE_REPLICA_SELECTION = 'round_robin'
+
+# After a write, the reads of the same client go to the primary for this number of seconds,
+# longer than the replication lag.
+DATABASE_PRIMARY_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Use a shared backend (e.g. Redis or Memcached) when running several processes,
+# so that every process sees the invalidations of the property space responses.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'property-spaces',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Time to live, in seconds, of the cached property space responses.
+RESPONSE_CACHE_TIMEOUT = 300
+
+
+# Request instrumentation
+# When enabled, every response has a Server-Timing header with the number of queries,
+# the database time and the time of the aggregation and serialization phases, and
+# the same fields are logged by `api.middleware`.
+
+# The settings are read before `api.apps` loads the `.env` file.
+load_dotenv()
+REQUEST_INSTRUMENTATION_ENABLED = os.getenv('REQUEST_INSTRUMENTATION_ENABLED', '') == '1'
+
+# Requests running more queries are logged as warnings, usually an N+1 regression.
+REQUEST_QUERY_BUDGET = 20
+
+
+# API keys and rate limiting
+# The shared key of the environment, accepted with the API keys.
+AUTH_TOKEN = os.getenv('AUTH_TOKEN')
+
+# The API key lookups are cached in each process for API_KEY_CACHE_TTL seconds,
+# a revoked key can be accepted by the other processes until then.
+API_KEY_CACHE_TTL = 60
+API_KEY_CACHE_MAX_ENTRIES = 10000
+
+# Rate limit of each API key: requests per minute, and per window of API_RATE_LIMIT_BURST
+# requests at that rate (10 seconds by default). They can be set per key.
+API_RATE_LIMIT_PER_MINUTE = 600
+API_RATE_LIMIT_BURST = 100
+
+# The request counts are stored in this cache, it must be shared by the processes to limit them together.
+RATE_LIMIT_CACHE_ALIAS = 'default'
+
+
+# Measurement units
+# The energy of one unit of each measurement unit, in kWh. The totals convert the readings
+# with these factors in SQL, to CONSUMPTION_UNIT_DEFAULT or to the `unit` of the request.
+# A unit can be added as a target unit only, e.g. 'MJ': 1 / 3.6.
+MEASUREMENT_UNIT_KWH_FACTORS = {
+    'kWh': 1.0,
+    'therms': 29.3071,
+}
+CONSUMPTION_UNIT_DEFAULT = 'kWh'
+
+
+# Columnar analytics
+# The portfolio totals can be answered from an in-memory NumPy snapshot of the readings,
+# one per process (see `api.columnar`). It needs `pip install numpy`. The snapshot is
+# refreshed from the change feed at most every COLUMNAR_REFRESH_SECONDS, and dropped
+# when it would need more than COLUMNAR_MEMORY_BUDGET_MB.
+COLUMNAR_ANALYTICS_ENABLED = os.getenv('COLUMNAR_ANALYTICS_ENABLED', '') == '1'
+COLUMNAR_REFRESH_SECONDS = 5
+COLUMNAR_MEMORY_BUDGET_MB = 512
+
+
+# Background jobs
+# Long operations (rollup rebuilds, multi-year reports) are queued in the Job table and
+# run by `python manage.py run_jobs`, on a pool of JOB_WORKER_THREADS threads. More
+# workers can run side by side, as separate processes. JOB_CONCURRENCY_LIMITS caps the
+# running jobs of a kind. A failed job is retried up to JOB_MAX_ATTEMPTS times, after
+# JOB_RETRY_BACKOFF_SECONDS doubled at each attempt. A running job without a heartbeat
+# for JOB_STALE_SECONDS lost its worker and is queued again.
+JOB_WORKER_THREADS = 4
+JOB_POLL_SECONDS = 1
+JOB_CONCURRENCY_LIMITS = {
+    'rebuild_rollups': 1,
+    'portfolio_report': 2,
+}
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF_SECONDS = 30
+JOB_STALE_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators